@@ -0,0 +1,24 @@
+from chess.engine import (
+    BACKENDS,
+    STARTING_FEN,
+    Bishop,
+    King,
+    Knight,
+    Move,
+    Pawn,
+    Piece_Long_Range,
+    Position,
+    Queen,
+    Rook,
+    check_next_move,
+    create_position,
+    fen_decoder,
+    fen_encoder,
+    get_attacked_squares,
+    get_pieces,
+    is_square_attacked,
+    move_from_uci,
+    move_to_uci,
+    parse_square,
+    square_name,
+)
@@ -0,0 +1,37 @@
+import argparse
+import sys
+
+from chess import uci
+from chess.instrument import Profiler
+from chess.polyglot import OpeningBook
+from chess.syzygy import Tablebase
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess", description="Headless chess engine.")
+    parser.add_argument("--uci", action="store_true", help="speak the UCI protocol on stdin/stdout")
+    parser.add_argument("--book", metavar="PATH", help="Polyglot opening book to play from before searching")
+    parser.add_argument("--syzygy", metavar="DIR", help="directory of Syzygy tables to play endgames from")
+    parser.add_argument("--profile", metavar="PREFIX",
+                        help="profile the session and write PREFIX.prof, PREFIX.folded and PREFIX.json on exit")
+    args = parser.parse_args(argv)
+    if args.uci:
+        book = OpeningBook(args.book) if args.book is not None else None
+        tablebase = Tablebase(args.syzygy) if args.syzygy is not None else None
+        profiler = Profiler() if args.profile is not None else None
+        try:
+            if profiler is None:
+                return uci.main(book=book, tablebase=tablebase)
+            with profiler:
+                return uci.main(book=book, tablebase=tablebase)
+        finally:
+            if profiler is not None:
+                print(f"info string profile written to {', '.join(profiler.write(args.profile))}", flush=True)
+            if book is not None:
+                book.close()
+            if tablebase is not None:
+                tablebase.close()
+    parser.print_help()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import basename, join, splitext
+
+import pygame
+
+from chess.engine import STARTING_FEN, fen_decoder
+from chess.render import BASE_SQUARE_SIZE, BoardRenderer
+
+SHEET = join("images", "Chess_pieces", "Chess_Peices.png")
+CELL_WIDTH, CELL_HEIGHT = 161, 155
+# Column order in the sheet; white pieces are on the top row, black below.
+PIECE_ORDER = ("king", "queen", "bishop", "knight", "rook", "pawn")
+COLORS = ("w", "b")
+# Sprite offsets in pixels for BASE_SQUARE_SIZE squares.
+PIECE_OFFSETS = {"king": (8, 0), "queen": (2, 0), "bishop": (0, 0), "knight": (-5, 0), "rook": (-13, 0), "pawn": (-20, 0)}
+# Bumped whenever the atlas layout or scaling changes, so old cache files
+# are never read back.
+ATLAS_VERSION = 1
+
+_tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+_frombytes = getattr(pygame.image, "frombytes", None) or pygame.image.fromstring
+
+def default_cache_dir() -> str:
+    return join(os.environ.get("XDG_CACHE_HOME") or join(os.path.expanduser("~"), ".cache"), "chess")
+
+def cut_sprites(sheet) -> dict:
+    # The twelve sprites at twice their size in the sheet, cut and doubled
+    # exactly as the game always has, so atlas pixels match the old ones.
+    sprites = {}
+    for row, color in enumerate(COLORS):
+        for column, piece in enumerate(PIECE_ORDER):
+            cell = pygame.Surface((CELL_WIDTH, CELL_HEIGHT), pygame.SRCALPHA, 32)
+            cell.blit(sheet, (0, 0), pygame.Rect(column * CELL_WIDTH, row * CELL_HEIGHT, CELL_WIDTH, CELL_HEIGHT))
+            sprites[color + piece] = pygame.transform.scale2x(cell)
+    return sprites
+
+def legacy_pieces(path=SHEET) -> dict:
+    # The piece table as Chess.py used to build it: the sheet decoded once
+    # per colour row, for BoardRenderer to scale on startup. Kept as the
+    # baseline of the startup benchmark.
+    pieces = {}
+    for row, color in enumerate(COLORS):
+        sheet = pygame.image.load(path).convert_alpha()
+        for column, piece in enumerate(PIECE_ORDER):
+            cell = pygame.Surface((CELL_WIDTH, CELL_HEIGHT), pygame.SRCALPHA, 32)
+            cell.blit(sheet, (0, 0), pygame.Rect(column * CELL_WIDTH, row * CELL_HEIGHT, CELL_WIDTH, CELL_HEIGHT))
+            pieces[color + piece] = [pygame.transform.scale2x(cell), PIECE_OFFSETS[piece]]
+    return pieces
+
+class PieceAtlas:
+    # Every piece sprite pre-scaled for one square size, packed in a single
+    # surface of six columns by two rows; renderers blit subsurfaces of it.
+    # Each size is built once per process and, with a cache_dir, once per
+    # sheet: the raw RGBA pixels are saved under a name made of the sheet's
+    # mtime and the square size, so a later start only reads that file and
+    # the sheet itself is decoded only when some size is missing.
+    def __init__(self, path=SHEET, cache_dir=None):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.atlases = {}
+        self.source = None
+        # How each size was obtained: "disk" or "built".
+        self.origins = {}
+
+    def cache_path(self, square_size) -> str:
+        stem = splitext(basename(self.path))[0]
+        return join(self.cache_dir, f"{stem}-v{ATLAS_VERSION}-{os.stat(self.path).st_mtime_ns}-{square_size}.rgba")
+
+    def sprites(self, square_size):
+        # Returns (sprites, offsets) by piece name, as scale_pieces() does.
+        entry = self.atlases.get(square_size)
+        if entry is None:
+            surface = self.load(square_size) if self.cache_dir is not None else None
+            if surface is None:
+                surface = self.build(square_size)
+                self.origins[square_size] = "built"
+                if self.cache_dir is not None:
+                    self.save(square_size, surface)
+            else:
+                self.origins[square_size] = "disk"
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+            entry = self.atlases[square_size] = self.split(surface, square_size)
+        return entry[1], entry[2]
+
+    def build(self, square_size):
+        if self.source is None:
+            self.source = cut_sprites(pygame.image.load(self.path))
+        surface = pygame.Surface((square_size * len(PIECE_ORDER), square_size * len(COLORS)), pygame.SRCALPHA, 32)
+        for row, color in enumerate(COLORS):
+            for column, piece in enumerate(PIECE_ORDER):
+                # Scaling straight into the atlas copies the pixels; a blit
+                # would blend the translucent edges with the empty atlas.
+                cell = surface.subsurface(pygame.Rect(column * square_size, row * square_size, square_size, square_size))
+                pygame.transform.scale(self.source[color + piece], (square_size, square_size), cell)
+        return surface
+
+    def split(self, surface, square_size):
+        sprites, offsets = {}, {}
+        for row, color in enumerate(COLORS):
+            for column, piece in enumerate(PIECE_ORDER):
+                rect = pygame.Rect(column * square_size, row * square_size, square_size, square_size)
+                sprites[color + piece] = surface.subsurface(rect)
+                dx, dy = PIECE_OFFSETS[piece]
+                offsets[color + piece] = (dx * square_size // BASE_SQUARE_SIZE, dy * square_size // BASE_SQUARE_SIZE)
+        return surface, sprites, offsets
+
+    def load(self, square_size):
+        size = (square_size * len(PIECE_ORDER), square_size * len(COLORS))
+        try:
+            with open(self.cache_path(square_size), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != size[0] * size[1] * 4:
+            return None
+        return _frombytes(data, size, "RGBA")
+
+    def save(self, square_size, surface) -> None:
+        # Written to a temporary file and renamed, so a kiosk losing power
+        # mid-write never finds half an atlas. Files for an older version of
+        # the sheet are removed. A read-only or full disk only costs the
+        # cache.
+        path = self.cache_path(square_size)
+        prefix = splitext(basename(self.path))[0] + "-"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(_tobytes(surface, "RGBA"))
+            os.replace(temp_path, path)
+            current = f"-v{ATLAS_VERSION}-{os.stat(self.path).st_mtime_ns}-"
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(prefix) and name.endswith(".rgba") and current not in name:
+                    os.remove(join(self.cache_dir, name))
+        except OSError:
+            pass
+
+def first_frame(mode, square_size=BASE_SQUARE_SIZE, cache_dir=None) -> float:
+    # One GUI startup up to the first board on screen, the old way
+    # ("legacy": every pygame subsystem, sheet decoded per row, sprites
+    # scaled by the renderer) or with an atlas and only the display.
+    # Returns the seconds it took inside this process.
+    start = time.perf_counter()
+    if mode == "legacy":
+        pygame.init()
+    else:
+        pygame.display.init()
+    screen = pygame.display.set_mode((square_size * 8, square_size * 8))
+    if mode == "legacy":
+        renderer = BoardRenderer(screen, legacy_pieces(), square_size)
+    else:
+        renderer = BoardRenderer(screen, None, square_size, atlas=PieceAtlas(cache_dir=cache_dir))
+    renderer.render(fen_decoder(STARTING_FEN)["board"])
+    elapsed = time.perf_counter() - start
+    pygame.quit()
+    return elapsed
+
+def benchmark_startup(runs=5, square_size=BASE_SQUARE_SIZE, target_ms=None, out=sys.stdout) -> bool:
+    # Each run is a fresh interpreter, so the process time is what a kiosk
+    # waits from launch to the first board (interpreter, imports, pygame,
+    # sprites, first frame); the in-process time leaves out the imports.
+    # The atlas is timed with no cache file ("cold") and with one ("warm").
+    # Returns False when the warm atlas median misses target_ms.
+    cache_dir = tempfile.mkdtemp(prefix="chess-atlas-")
+    results = {}
+    try:
+        for label, mode, clear in (("legacy", "legacy", False), ("atlas cold", "atlas", True), ("atlas warm", "atlas", False)):
+            process, inside = [], []
+            for _ in range(runs):
+                if clear:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                command = [sys.executable, "-m", "chess.atlas", "first-frame", mode, "--square-size", str(square_size),
+                           "--cache-dir", cache_dir]
+                start = time.perf_counter()
+                output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                process.append(time.perf_counter() - start)
+                inside.append(json.loads(output.strip().splitlines()[-1])["seconds"])
+            results[label] = (statistics.median(process), statistics.median(inside))
+            print(f"{label:<11} process {results[label][0] * 1000:7.1f} ms  startup {results[label][1] * 1000:7.1f} ms  (median of {runs})", file=out)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # Switching square size inside one process: a size not seen before is
+    # scaled from the sprites already in memory, a size seen before is a
+    # dictionary lookup; neither touches the sheet again.
+    pygame.display.init()
+    screen = pygame.display.set_mode((square_size * 8, square_size * 8))
+    atlas = PieceAtlas()
+    renderer = BoardRenderer(screen, None, square_size, atlas=atlas)
+    board = fen_decoder(STARTING_FEN)["board"]
+    renderer.render(board)
+    for label, sizes in (("new size", (60, 80, 120)), ("seen size", (60, 80, 120))):
+        start = time.perf_counter()
+        for size in sizes:
+            renderer.set_square_size(size, pygame.display.set_mode((size * 8, size * 8)))
+            renderer.render(board)
+        print(f"switch to {label:<9} {(time.perf_counter() - start) / len(sizes) * 1000:7.1f} ms, first frame included", file=out)
+    pygame.quit()
+
+    warm = results["atlas warm"][0] * 1000
+    print(f"speedup    {results['legacy'][0] / results['atlas warm'][0]:5.2f}x to first frame with a warm cache", file=out)
+    if target_ms is None:
+        return True
+    met = warm <= target_ms
+    print(f"target     {target_ms:.0f} ms to first frame: {'met' if met else 'MISSED'} ({warm:.1f} ms)", file=out)
+    return met
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.atlas", description="Build piece atlases and time GUI startup.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="write atlases for the given square sizes to the cache")
+    build.add_argument("sizes", type=int, nargs="+", metavar="SIZE")
+    build.add_argument("--sheet", default=SHEET)
+    build.add_argument("--cache-dir", default=default_cache_dir())
+    bench = commands.add_parser("bench", help="time launch to first frame, legacy against the atlas")
+    bench.add_argument("--runs", type=int, default=5)
+    bench.add_argument("--square-size", type=int, default=BASE_SQUARE_SIZE)
+    bench.add_argument("--target-ms", type=float, default=None,
+                       help="exit with status 1 if the warm atlas start takes longer than this")
+    frame = commands.add_parser("first-frame", help=argparse.SUPPRESS)
+    frame.add_argument("mode", choices=("legacy", "atlas"))
+    frame.add_argument("--square-size", type=int, default=BASE_SQUARE_SIZE)
+    frame.add_argument("--cache-dir", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        atlas = PieceAtlas(args.sheet, args.cache_dir)
+        for size in args.sizes:
+            atlas.sprites(size)
+            print(f"{size:>4} px  {atlas.origins[size]:<5}  {atlas.cache_path(size)}")
+        return 0
+    if args.command == "bench":
+        return 0 if benchmark_startup(args.runs, args.square_size, args.target_ms) else 1
+    print(json.dumps({"mode": args.mode, "seconds": first_frame(args.mode, args.square_size, args.cache_dir)}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
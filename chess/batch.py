@@ -0,0 +1,177 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from chess.bitboard import BitboardPosition
+from chess.engine import STARTING_FEN, move_to_uci
+from chess.game import validate_fen
+from chess.search import MAX_PLY, Searcher, SharedTranspositionTable, shared_table
+
+# error is None for a searched position, else why it could not be searched
+# (an invalid FEN); best_move, score and depth are then None.
+BatchResult = namedtuple("BatchResult", ["index", "fen", "best_move", "score", "depth", "nodes", "error"])
+# depth is the deepest iteration any worker completed, the one best_move and
+# score come from; worker_depths holds each worker's deepest iteration.
+ParallelResult = namedtuple("ParallelResult", ["fen", "best_move", "score", "depth", "worker_depths", "nodes"])
+
+# Used when no depth, movetime or nodes limit is given; without one a search
+# would run to MAX_PLY.
+DEFAULT_DEPTH = 3
+
+# Each worker process keeps one Searcher (and its transposition table) for
+# every position it is handed, instead of rebuilding it per task.
+_searcher = None
+
+def _init_worker(tt_size):
+    global _searcher
+    _searcher = Searcher(tt_size)
+
+def _limits(depth, movetime, nodes):
+    if depth is None and movetime is None and nodes is None:
+        depth = DEFAULT_DEPTH
+    return depth or MAX_PLY - 1, movetime, nodes
+
+def _analyse_chunk(chunk, depth, movetime, nodes):
+    # A position that cannot be searched gets a result carrying the error,
+    # so it costs neither the rest of its chunk nor the whole batch.
+    results = []
+    for index, fen in chunk:
+        try:
+            validate_fen(fen)
+        except ValueError as error:
+            results.append(BatchResult(index, fen, None, None, None, 0, str(error)))
+            continue
+        result = _searcher.search(BitboardPosition(fen), *_limits(depth, movetime, nodes))
+        best_move = move_to_uci(result.best_move) if result.best_move is not None else None
+        results.append(BatchResult(index, fen, best_move, result.score, result.depth, result.nodes, None))
+    return results
+
+def _chunks(fens, chunksize):
+    numbered = enumerate(fen.strip() for fen in fens)
+    while True:
+        chunk = [(index, fen) for index, fen in islice(numbered, chunksize) if fen]
+        if not chunk:
+            return
+        yield chunk
+
+def analyse_batch(fens, depth=None, movetime=None, nodes=None, workers=None, ordered=True, chunksize=8, max_pending=None, tt_size=1 << 16):
+    # FENs are read lazily and at most max_pending chunks are in flight or
+    # waiting to be yielded, so memory stays bounded for any input size.
+    # Without any limit each position is searched to DEFAULT_DEPTH.
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    chunks = _chunks(fens, chunksize)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(tt_size,)) as executor:
+        pending = deque()
+        for chunk in islice(chunks, max_pending):
+            pending.append(executor.submit(_analyse_chunk, chunk, depth, movetime, nodes))
+
+        while pending:
+            if ordered:
+                finished = [pending.popleft()]
+                yield from finished[0].result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished = list(done)
+                for future in finished:
+                    pending.remove(future)
+                    yield from future.result()
+            for chunk in islice(chunks, len(finished)):
+                pending.append(executor.submit(_analyse_chunk, chunk, depth, movetime, nodes))
+
+def _init_smp_worker(table):
+    global _searcher
+    _searcher = Searcher(tt=SharedTranspositionTable(table))
+
+def _smp_search(fen, depth, movetime, nodes):
+    result = _searcher.search(BitboardPosition(fen), *_limits(depth, movetime, nodes))
+    return move_to_uci(result.best_move) if result.best_move is not None else None, result.score, result.depth, result.nodes
+
+def parallel_search(fen, workers=None, depth=None, movetime=None, nodes=None, tt_size=1 << 18):
+    # Lazy SMP: every worker searches the whole position with the same
+    # limits (nodes counts per worker) through one transposition table in
+    # shared memory. Workers skip what another has already stored, so the
+    # table fills faster than one process could fill it; the answer is the
+    # deepest completed iteration, the first worker's on a tie.
+    validate_fen(fen)
+    workers = workers or os.cpu_count() or 1
+    table = shared_table(tt_size)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_smp_worker, initargs=(table,)) as executor:
+        futures = [executor.submit(_smp_search, fen, depth, movetime, nodes) for _ in range(workers)]
+        outcomes = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    best_move, score, completed_depth, _ = max(outcomes, key=lambda outcome: outcome[2])
+    return ParallelResult(fen, best_move, score, completed_depth, [outcome[2] for outcome in outcomes],
+                          sum(outcome[3] for outcome in outcomes)), elapsed
+
+def _read_fens(path):
+    if path == "-":
+        yield from sys.stdin
+    else:
+        with open(path) as file:
+            yield from file
+
+def scaling_report(fens, depth, worker_counts, out=sys.stdout) -> None:
+    fens = list(fens)
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        count = sum(1 for _ in analyse_batch(fens, depth=depth, workers=workers, ordered=False))
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed > 0 else 0.0
+        baseline = baseline or rate
+        speedup = rate / baseline if baseline else 0.0
+        print(f"workers {workers:>3}  positions {count}  time {elapsed:8.3f}s  {rate:8.2f} positions/s  speedup {speedup:5.2f}x", file=out)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.batch", description="Analyse many FEN positions across processes.")
+    parser.add_argument("path", nargs="?", default="-", help="file with one FEN per line, - for stdin")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--movetime", type=int, default=None, help="milliseconds per position")
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--unordered", action="store_true", help="print results as soon as they finish")
+    parser.add_argument("--parallel-search", metavar="FEN", nargs="?", const=STARTING_FEN,
+                        help="search one position on all workers sharing a transposition table (Lazy SMP)")
+    parser.add_argument("--scaling", action="store_true", help="time the input at 1, 2, 4, ... workers")
+    args = parser.parse_args(argv)
+    if args.depth is None and args.movetime is None and args.nodes is None:
+        args.depth = DEFAULT_DEPTH
+
+    if args.parallel_search:
+        try:
+            result, elapsed = parallel_search(args.parallel_search, args.workers, args.depth, args.movetime, args.nodes)
+        except ValueError as error:
+            parser.error(str(error))
+        print(f"bestmove {result.best_move}  score {result.score}  depth {result.depth} (workers reached "
+              f"{' '.join(map(str, result.worker_depths))})  nodes {result.nodes}  time {elapsed:.3f}s  "
+              f"nps {result.nodes / elapsed if elapsed > 0 else 0:.0f}")
+        return 0
+
+    if args.scaling:
+        limit = args.workers or os.cpu_count() or 1
+        counts = [1]
+        while counts[-1] * 2 <= limit:
+            counts.append(counts[-1] * 2)
+        scaling_report(_read_fens(args.path), args.depth, counts)
+        return 0
+
+    start, count, errors = time.perf_counter(), 0, 0
+    for result in analyse_batch(_read_fens(args.path), args.depth, args.movetime, args.nodes, args.workers, not args.unordered):
+        count += 1
+        if result.error is not None:
+            errors += 1
+            print(f"line {result.index + 1}: {result.error}", file=sys.stderr)
+            continue
+        print(f"{result.fen};{result.best_move};{result.score};{result.depth}")
+    elapsed = time.perf_counter() - start
+    print(f"{count} positions, {errors} errors in {elapsed:.3f}s, {count / elapsed if elapsed > 0 else 0:.2f} positions/s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
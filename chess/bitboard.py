@@ -0,0 +1,601 @@
+from array import array
+
+from chess.engine import STARTING_FEN, Move, fen_decoder, fen_encoder, parse_square
+from chess.zobrist import CASTLING_KEYS, EP_KEYS, PIECE_KEYS, SIDE_KEY, position_key
+
+# Squares are numbered y * 8 + x, using the same (x, y) orientation as the
+# dict board: a8 is square 0 and h1 is square 63.
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+COLORS = ["w", "b"]
+PIECE_TYPES = ["pawn", "knight", "bishop", "rook", "queen", "king"]
+PIECE_NAMES = [color + piece_type for color in COLORS for piece_type in PIECE_TYPES]
+PIECE_INDEX = {name: i for i, name in enumerate(PIECE_NAMES)}
+
+SQUARES = [(sq % 8, sq // 8) for sq in range(64)]
+FULL = (1 << 64) - 1
+RANK_1 = 0xFF << 56
+RANK_8 = 0xFF
+RANK_3 = 0xFF << 40
+RANK_6 = 0xFF << 16
+DARK_SQUARES = sum(1 << sq for sq in range(64) if (sq % 8 + sq // 8) % 2)
+
+# Move flags, packed above the from/to squares: from | to << 6 | flag << 12.
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EP_CAPTURE = 5
+PROMOTION = 8
+PROMOTION_CAPTURE = 12
+
+CASTLING_BITS = {"K": 1, "Q": 2, "k": 4, "q": 8}
+
+def _leaper_table(vectors):
+    table = []
+    for sq in range(64):
+        x, y = SQUARES[sq]
+        mask = 0
+        for dx, dy in vectors:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                mask |= 1 << ((y + dy) * 8 + x + dx)
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([(-1, -2), (1, -2), (-2, -1), (2, -1), (-1, 2), (1, 2), (-2, 1), (2, 1)])
+KING_ATTACKS = _leaper_table([(0, -1), (0, 1), (1, 0), (-1, 0), (1, 1), (-1, 1), (-1, -1), (1, -1)])
+PAWN_ATTACKS = [_leaper_table([(-1, -1), (1, -1)]), _leaper_table([(-1, 1), (1, 1)])]
+
+def _ray_table(dx, dy):
+    table = []
+    for sq in range(64):
+        x, y = SQUARES[sq]
+        mask = 0
+        x, y = x + dx, y + dy
+        while 0 <= x < 8 and 0 <= y < 8:
+            mask |= 1 << (y * 8 + x)
+            x, y = x + dx, y + dy
+        table.append(mask)
+    return table
+
+# Rays that run towards higher square numbers stop at their lowest blocker,
+# rays towards lower square numbers at their highest one.
+NORTH, SOUTH, EAST, WEST = _ray_table(0, -1), _ray_table(0, 1), _ray_table(1, 0), _ray_table(-1, 0)
+NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = _ray_table(1, -1), _ray_table(-1, -1), _ray_table(1, 1), _ray_table(-1, 1)
+
+def rook_attacks(sq, occupied):
+    attacks = 0
+    ray = SOUTH[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= SOUTH[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = EAST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= EAST[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = NORTH[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= NORTH[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = WEST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= WEST[blockers.bit_length() - 1]
+    return attacks | ray
+
+def bishop_attacks(sq, occupied):
+    attacks = 0
+    ray = SOUTH_EAST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= SOUTH_EAST[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = SOUTH_WEST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= SOUTH_WEST[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = NORTH_EAST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= NORTH_EAST[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = NORTH_WEST[sq]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= NORTH_WEST[blockers.bit_length() - 1]
+    return attacks | ray
+
+def iter_bits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+def _line_tables():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for ray, opposite in ((SOUTH, NORTH), (EAST, WEST), (SOUTH_EAST, NORTH_WEST), (SOUTH_WEST, NORTH_EAST)):
+        for a in range(64):
+            for b in iter_bits(ray[a]):
+                between[a][b] = between[b][a] = ray[a] ^ ray[b] ^ (1 << b)
+                line[a][b] = line[b][a] = ray[a] | opposite[a] | (1 << a)
+    return between, line
+
+# Squares strictly between two aligned squares, and the full line through them.
+BETWEEN, LINE = _line_tables()
+
+# Castling rights that survive a move touching each square.
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[60] = 15 ^ 3
+CASTLING_MASK[63] = 15 ^ 1
+CASTLING_MASK[56] = 15 ^ 2
+CASTLING_MASK[4] = 15 ^ 12
+CASTLING_MASK[7] = 15 ^ 4
+CASTLING_MASK[0] = 15 ^ 8
+
+# king from, king to, rook from, rook to, squares that must be empty, squares that must not be attacked
+CASTLES = {
+    (WHITE, KING_CASTLE): (60, 62, 63, 61, (1 << 61) | (1 << 62), (60, 61, 62)),
+    (WHITE, QUEEN_CASTLE): (60, 58, 56, 59, (1 << 57) | (1 << 58) | (1 << 59), (60, 59, 58)),
+    (BLACK, KING_CASTLE): (4, 6, 7, 5, (1 << 5) | (1 << 6), (4, 5, 6)),
+    (BLACK, QUEEN_CASTLE): (4, 2, 0, 3, (1 << 1) | (1 << 2) | (1 << 3), (4, 3, 2)),
+}
+CASTLING_RIGHT = {(WHITE, KING_CASTLE): 1, (WHITE, QUEEN_CASTLE): 2, (BLACK, KING_CASTLE): 4, (BLACK, QUEEN_CASTLE): 8}
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return (move >> 6) & 63
+
+def move_flag(move):
+    return move >> 12
+
+class BitboardPosition:
+    __slots__ = ("pieces", "occupancy", "side", "castling", "ep_square", "halfmove_clock", "fullmove_number", "history", "key",
+                 "repetitions", "cache")
+
+    def __init__(self, fen=STARTING_FEN, cache=None):
+        board_info = fen_decoder(fen, "w")
+        self.pieces = [0] * 12
+        for (x, y), name in board_info["board"].items():
+            self.pieces[PIECE_INDEX[name]] |= 1 << (y * 8 + x)
+        self.occupancy = [self.pieces[0] | self.pieces[1] | self.pieces[2] | self.pieces[3] | self.pieces[4] | self.pieces[5],
+                          self.pieces[6] | self.pieces[7] | self.pieces[8] | self.pieces[9] | self.pieces[10] | self.pieces[11]]
+        self.side = WHITE if board_info["turn"] == "w" else BLACK
+        self.castling = 0
+        for char in board_info["castling_availability"]:
+            self.castling |= CASTLING_BITS.get(char, 0)
+        en_passant_square = parse_square(board_info["en_passant_target_square"])
+        self.ep_square = -1 if en_passant_square is None else en_passant_square[1] * 8 + en_passant_square[0]
+        self.halfmove_clock = board_info["halfmove_clock"]
+        self.fullmove_number = board_info["fullmove_number"]
+        self.history = []
+        self.key = position_key(self)
+        # How many times each position of the game so far has occurred,
+        # kept up to date by make_move and unmake_move. Positions before an
+        # irreversible move cannot come back with the same key, so there is
+        # no need to forget them.
+        self.repetitions = {self.key: 1}
+        self.cache = cache
+
+    def copy(self):
+        position = BitboardPosition.__new__(BitboardPosition)
+        position.pieces, position.occupancy = self.pieces[:], self.occupancy[:]
+        position.side, position.castling, position.ep_square = self.side, self.castling, self.ep_square
+        position.halfmove_clock, position.fullmove_number = self.halfmove_clock, self.fullmove_number
+        position.history, position.key = self.history[:], self.key
+        position.repetitions = self.repetitions.copy()
+        position.cache = self.cache
+        return position
+
+    def __eq__(self, other):
+        if not isinstance(other, BitboardPosition):
+            return NotImplemented
+        return (self.key == other.key and self.pieces == other.pieces and self.side == other.side
+                and self.castling == other.castling and self.ep_square == other.ep_square)
+
+    def __hash__(self):
+        return self.key
+
+    def fen(self) -> str:
+        return fen_encoder(self.board, self.turn, self.castling_availability, self.en_passant_square, self.halfmove_clock, self.fullmove_number)
+
+    @property
+    def turn(self):
+        return COLORS[self.side]
+
+    @property
+    def board(self):
+        board = {}
+        for i, bb in enumerate(self.pieces):
+            for sq in iter_bits(bb):
+                board[SQUARES[sq]] = PIECE_NAMES[i]
+        return board
+
+    @property
+    def castling_availability(self):
+        return "".join(char for char in "KQkq" if self.castling & CASTLING_BITS[char]) or "-"
+
+    @property
+    def en_passant_square(self):
+        return None if self.ep_square == -1 else SQUARES[self.ep_square]
+
+    def piece_at(self, sq):
+        bb = 1 << sq
+        for i, pieces in enumerate(self.pieces):
+            if pieces & bb:
+                return i
+        return None
+
+    def is_attacked(self, sq, by_color, occupied=None) -> bool:
+        pieces = self.pieces
+        offset = by_color * 6
+        if KNIGHT_ATTACKS[sq] & pieces[offset + KNIGHT]:
+            return True
+        if PAWN_ATTACKS[by_color ^ 1][sq] & pieces[offset + PAWN]:
+            return True
+        if KING_ATTACKS[sq] & pieces[offset + KING]:
+            return True
+        if occupied is None:
+            occupied = self.occupancy[0] | self.occupancy[1]
+        if bishop_attacks(sq, occupied) & (pieces[offset + BISHOP] | pieces[offset + QUEEN]):
+            return True
+        if rook_attacks(sq, occupied) & (pieces[offset + ROOK] | pieces[offset + QUEEN]):
+            return True
+        return False
+
+    def attackers_to(self, sq, by_color, occupied) -> int:
+        pieces = self.pieces
+        offset = by_color * 6
+        return ((KNIGHT_ATTACKS[sq] & pieces[offset + KNIGHT])
+                | (PAWN_ATTACKS[by_color ^ 1][sq] & pieces[offset + PAWN])
+                | (KING_ATTACKS[sq] & pieces[offset + KING])
+                | (bishop_attacks(sq, occupied) & (pieces[offset + BISHOP] | pieces[offset + QUEEN]))
+                | (rook_attacks(sq, occupied) & (pieces[offset + ROOK] | pieces[offset + QUEEN])))
+
+    def in_check(self) -> bool:
+        king = self.pieces[self.side * 6 + KING]
+        return self.is_attacked(king.bit_length() - 1, self.side ^ 1)
+
+    def repetition_count(self) -> int:
+        return self.repetitions[self.key]
+
+    def has_insufficient_material(self, color) -> bool:
+        # Whether color cannot possibly mate: a lone knight against at most
+        # queens, or bishops all on one square colour with no knights or
+        # pawns anywhere.
+        pieces = self.pieces
+        offset, other = color * 6, (color ^ 1) * 6
+        if pieces[offset + PAWN] | pieces[offset + ROOK] | pieces[offset + QUEEN]:
+            return False
+        if pieces[offset + KNIGHT]:
+            return (self.occupancy[color].bit_count() <= 2
+                    and not pieces[other + PAWN] | pieces[other + KNIGHT] | pieces[other + BISHOP] | pieces[other + ROOK])
+        if pieces[offset + BISHOP]:
+            bishops = pieces[BISHOP] | pieces[6 + BISHOP]
+            return (not bishops & DARK_SQUARES or not bishops & ~DARK_SQUARES) and not (
+                pieces[PAWN] | pieces[6 + PAWN] | pieces[KNIGHT] | pieces[6 + KNIGHT])
+        return True
+
+    def is_insufficient_material(self) -> bool:
+        return self.has_insufficient_material(WHITE) and self.has_insufficient_material(BLACK)
+
+    def pseudo_legal_moves(self, from_mask=FULL, noisy=True, quiet=True) -> list:
+        # from_mask keeps only moves of the pieces on those squares. Noisy
+        # moves are captures, en passant and every promotion; quiet moves are
+        # the rest, castling included. A staged move picker asks for one kind
+        # at a time and never pays for the other if the first one cuts off.
+        moves = []
+        us, them = self.side, self.side ^ 1
+        pieces = self.pieces
+        offset = us * 6
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+
+        pawns = pieces[offset + PAWN] & from_mask
+        if us == WHITE:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_3) >> 8) & empty
+            push_delta = 8
+            promotion_rank = RANK_8
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_6) << 8) & empty
+            push_delta = -8
+            promotion_rank = RANK_1
+        if quiet:
+            for to_sq in iter_bits(single & ~promotion_rank):
+                moves.append((to_sq + push_delta) | to_sq << 6)
+        if noisy:
+            for to_sq in iter_bits(single & promotion_rank):
+                base = (to_sq + push_delta) | to_sq << 6
+                for promotion in (3, 2, 1, 0):
+                    moves.append(base | (PROMOTION | promotion) << 12)
+        if quiet:
+            for to_sq in iter_bits(double):
+                moves.append((to_sq + 2 * push_delta) | to_sq << 6 | DOUBLE_PUSH << 12)
+        if noisy:
+            pawn_attacks = PAWN_ATTACKS[us]
+            for from_sq in iter_bits(pawns):
+                targets = pawn_attacks[from_sq] & enemy
+                for to_sq in iter_bits(targets):
+                    if (1 << to_sq) & promotion_rank:
+                        for promotion in (3, 2, 1, 0):
+                            moves.append(from_sq | to_sq << 6 | (PROMOTION_CAPTURE | promotion) << 12)
+                    else:
+                        moves.append(from_sq | to_sq << 6 | CAPTURE << 12)
+            if self.ep_square != -1:
+                for from_sq in iter_bits(PAWN_ATTACKS[them][self.ep_square] & pawns):
+                    moves.append(from_sq | self.ep_square << 6 | EP_CAPTURE << 12)
+
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            for from_sq in iter_bits(pieces[offset + piece_type] & from_mask):
+                if piece_type == KNIGHT:
+                    targets = KNIGHT_ATTACKS[from_sq]
+                elif piece_type == BISHOP:
+                    targets = bishop_attacks(from_sq, occupied)
+                elif piece_type == ROOK:
+                    targets = rook_attacks(from_sq, occupied)
+                elif piece_type == QUEEN:
+                    targets = bishop_attacks(from_sq, occupied) | rook_attacks(from_sq, occupied)
+                else:
+                    targets = KING_ATTACKS[from_sq]
+                if noisy:
+                    for to_sq in iter_bits(targets & enemy):
+                        moves.append(from_sq | to_sq << 6 | CAPTURE << 12)
+                if quiet:
+                    for to_sq in iter_bits(targets & empty):
+                        moves.append(from_sq | to_sq << 6)
+
+        if quiet and pieces[offset + KING] & from_mask:
+            for flag in (KING_CASTLE, QUEEN_CASTLE):
+                if self.castling & CASTLING_RIGHT[(us, flag)]:
+                    king_from, king_to, rook_from, rook_to, must_be_empty, must_be_safe = CASTLES[(us, flag)]
+                    if (not occupied & must_be_empty and pieces[offset + KING] & (1 << king_from)
+                            and pieces[offset + ROOK] & (1 << rook_from)):
+                        if not any(self.is_attacked(sq, them) for sq in must_be_safe):
+                            moves.append(king_from | king_to << 6 | flag << 12)
+        return moves
+
+    def make_move(self, move) -> None:
+        from_sq, to_sq, flag = move & 63, (move >> 6) & 63, move >> 12
+        us, them = self.side, self.side ^ 1
+        pieces, occupancy = self.pieces, self.occupancy
+        from_bb, to_bb = 1 << from_sq, 1 << to_sq
+        offset = us * 6
+        for moved in range(offset, offset + 6):
+            if pieces[moved] & from_bb:
+                break
+
+        captured = -1
+        if flag == EP_CAPTURE:
+            captured = them * 6 + PAWN
+            captured_bb = 1 << (to_sq + (8 if us == WHITE else -8))
+            pieces[captured] ^= captured_bb
+            occupancy[them] ^= captured_bb
+        elif flag & CAPTURE:
+            for captured in range(them * 6, them * 6 + 6):
+                if pieces[captured] & to_bb:
+                    pieces[captured] ^= to_bb
+                    occupancy[them] ^= to_bb
+                    break
+
+        self.history.append((move, moved, captured, self.castling, self.ep_square, self.halfmove_clock, self.key))
+
+        key = self.key ^ SIDE_KEY ^ PIECE_KEYS[moved][from_sq]
+        # The en passant file is only in the key while one of our pawns can
+        # capture there (see zobrist.ep_key); they have not moved yet.
+        if self.ep_square != -1 and PAWN_ATTACKS[them][self.ep_square] & pieces[offset + PAWN]:
+            key ^= EP_KEYS[self.ep_square & 7]
+        if captured != -1:
+            key ^= PIECE_KEYS[captured][to_sq if flag != EP_CAPTURE else to_sq + (8 if us == WHITE else -8)]
+        pieces[moved] ^= from_bb
+        if flag & PROMOTION:
+            pieces[offset + KNIGHT + (flag & 3)] |= to_bb
+            key ^= PIECE_KEYS[offset + KNIGHT + (flag & 3)][to_sq]
+        else:
+            pieces[moved] |= to_bb
+            key ^= PIECE_KEYS[moved][to_sq]
+        occupancy[us] ^= from_bb | to_bb
+
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            rook_from, rook_to = CASTLES[(us, flag)][2:4]
+            rook_bb = (1 << rook_from) | (1 << rook_to)
+            pieces[offset + ROOK] ^= rook_bb
+            occupancy[us] ^= rook_bb
+            key ^= PIECE_KEYS[offset + ROOK][rook_from] ^ PIECE_KEYS[offset + ROOK][rook_to]
+
+        if moved == offset + PAWN or captured != -1:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if us == BLACK:
+            self.fullmove_number += 1
+        self.ep_square = (from_sq + to_sq) // 2 if flag == DOUBLE_PUSH else -1
+        if self.ep_square != -1 and PAWN_ATTACKS[us][self.ep_square] & pieces[them * 6 + PAWN]:
+            key ^= EP_KEYS[self.ep_square & 7]
+        castling = self.castling & CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        if castling != self.castling:
+            key ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling]
+            self.castling = castling
+        self.key = key
+        self.side = them
+        repetitions = self.repetitions
+        repetitions[key] = repetitions.get(key, 0) + 1
+
+    def unmake_move(self) -> None:
+        repetitions = self.repetitions
+        count = repetitions[self.key]
+        if count == 1:
+            del repetitions[self.key]
+        else:
+            repetitions[self.key] = count - 1
+        move, moved, captured, self.castling, self.ep_square, self.halfmove_clock, self.key = self.history.pop()
+        from_sq, to_sq, flag = move & 63, (move >> 6) & 63, move >> 12
+        them, us = self.side, self.side ^ 1
+        self.side = us
+        if us == BLACK:
+            self.fullmove_number -= 1
+        pieces, occupancy = self.pieces, self.occupancy
+        from_bb, to_bb = 1 << from_sq, 1 << to_sq
+        offset = us * 6
+
+        if flag & PROMOTION:
+            pieces[offset + KNIGHT + (flag & 3)] ^= to_bb
+            pieces[moved] |= from_bb
+        else:
+            pieces[moved] ^= from_bb | to_bb
+        occupancy[us] ^= from_bb | to_bb
+
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            rook_from, rook_to = CASTLES[(us, flag)][2:4]
+            rook_bb = (1 << rook_from) | (1 << rook_to)
+            pieces[offset + ROOK] ^= rook_bb
+            occupancy[us] ^= rook_bb
+
+        if flag == EP_CAPTURE:
+            captured_bb = 1 << (to_sq + (8 if us == WHITE else -8))
+            pieces[captured] |= captured_bb
+            occupancy[them] |= captured_bb
+        elif captured != -1:
+            pieces[captured] |= to_bb
+            occupancy[them] |= to_bb
+
+    def generate_legal(self) -> list:
+        # With an LRUCache attached, a position seen before costs a lookup;
+        # callers get a fresh list they are free to reorder. Moves fit in 16
+        # bits, so cached lists are kept as array('H') at two bytes a move
+        # instead of a pointer plus an int object each.
+        cache = self.cache
+        if cache is None:
+            return self.generate_legal_subset()
+        moves = cache.get(self.key)
+        if moves is None:
+            moves = self.generate_legal_subset()
+            cache.put(self.key, array("H", moves))
+            return moves
+        return moves.tolist()
+
+    def check_info(self):
+        # Checkers and pinned pieces are worked out once for the position, so
+        # only king moves and en passant captures need a further attack test.
+        # Returns the king square, the squares a non-king move must land on
+        # (all of them, the checker and the squares between, or none in
+        # double check) and the pinned pieces as a bitboard.
+        us, them = self.side, self.side ^ 1
+        pieces, occupancy = self.pieces, self.occupancy
+        occupied = occupancy[0] | occupancy[1]
+        king_sq = pieces[us * 6 + KING].bit_length() - 1
+
+        checkers = self.attackers_to(king_sq, them, occupied)
+        if not checkers:
+            check_mask = FULL
+        elif checkers & (checkers - 1):
+            check_mask = 0
+        else:
+            check_mask = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+
+        pinned = 0
+        offset = them * 6
+        snipers = ((rook_attacks(king_sq, occupancy[them]) & (pieces[offset + ROOK] | pieces[offset + QUEEN]))
+                   | (bishop_attacks(king_sq, occupancy[them]) & (pieces[offset + BISHOP] | pieces[offset + QUEEN])))
+        for sniper in iter_bits(snipers):
+            blockers = BETWEEN[king_sq][sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & occupancy[us]:
+                pinned |= blockers
+        return king_sq, check_mask, pinned
+
+    def generate_legal_subset(self, from_mask=FULL, noisy=True, quiet=True, check_info=None) -> list:
+        # The legal moves among pseudo_legal_moves(from_mask, noisy, quiet),
+        # never cached. Callers asking for several subsets of one position
+        # can pass the check_info() they already have.
+        king_sq, check_mask, pinned = check_info or self.check_info()
+        them = self.side ^ 1
+        legal = []
+        without_king = (self.occupancy[0] | self.occupancy[1]) ^ (1 << king_sq)
+        line = LINE[king_sq]
+        for move in self.pseudo_legal_moves(from_mask, noisy, quiet):
+            from_sq, to_sq, flag = move & 63, (move >> 6) & 63, move >> 12
+            if from_sq == king_sq:
+                if flag == KING_CASTLE or flag == QUEEN_CASTLE or not self.is_attacked(to_sq, them, without_king):
+                    legal.append(move)
+            elif flag == EP_CAPTURE:
+                self.make_move(move)
+                if not self.is_attacked(king_sq, them):
+                    legal.append(move)
+                self.unmake_move()
+            elif (1 << to_sq) & check_mask and (not pinned & (1 << from_sq) or (1 << to_sq) & line[from_sq]):
+                legal.append(move)
+        return legal
+
+    def moves_from(self, sq) -> list:
+        # Legal moves of the piece on sq only, for highlighting one square;
+        # the other pieces' moves are not generated unless they are cached.
+        if self.cache is not None:
+            moves = self.cache.get(self.key)
+            if moves is not None:
+                return [move for move in moves if move & 63 == sq]
+        return self.generate_legal_subset(1 << sq)
+
+    def is_legal(self, move, check_info=None) -> bool:
+        # For moves that come from elsewhere (the hash table, a killer slot,
+        # a user): only moves of the same kind from the same square are
+        # generated to look for it.
+        noisy = bool(move >> 12 & (CAPTURE | PROMOTION))
+        return move in self.generate_legal_subset(1 << (move & 63), noisy, not noisy, check_info)
+
+    def has_legal_moves(self) -> bool:
+        # Stops at the first piece with a legal move, trying the king first
+        # since in double check nothing else can move.
+        if self.cache is not None:
+            moves = self.cache.get(self.key)
+            if moves is not None:
+                return bool(moves)
+        info = self.check_info()
+        king = self.pieces[self.side * 6 + KING]
+        if self.generate_legal_subset(king, check_info=info):
+            return True
+        if not info[1]:
+            return False
+        for sq in iter_bits(self.occupancy[self.side] ^ king):
+            if self.generate_legal_subset(1 << sq, check_info=info):
+                return True
+        return False
+
+    def to_move(self, move):
+        flag = move >> 12
+        promotion = PIECE_NAMES[self.side * 6 + KNIGHT + (flag & 3)] if flag & PROMOTION else None
+        return Move(SQUARES[move & 63], SQUARES[(move >> 6) & 63], promotion)
+
+    def encode_move(self, move) -> int:
+        from_sq = move.from_square[1] * 8 + move.from_square[0]
+        to_sq = move.to_square[1] * 8 + move.to_square[0]
+        moved = self.piece_at(from_sq) % 6
+        flag = CAPTURE if self.occupancy[self.side ^ 1] & (1 << to_sq) else QUIET
+        if moved == PAWN:
+            if abs(to_sq - from_sq) == 16:
+                flag = DOUBLE_PUSH
+            elif to_sq == self.ep_square:
+                flag = EP_CAPTURE
+            elif move.promotion is not None:
+                flag |= PROMOTION | (PIECE_TYPES.index(move.promotion[1:]) - KNIGHT)
+        elif moved == KING and to_sq - from_sq == 2:
+            flag = KING_CASTLE
+        elif moved == KING and to_sq - from_sq == -2:
+            flag = QUEEN_CASTLE
+        return from_sq | to_sq << 6 | flag << 12
+
+    def legal_moves(self) -> list:
+        return [self.to_move(move) for move in self.generate_legal()]
+
+    def push(self, move) -> None:
+        self.make_move(self.encode_move(move))
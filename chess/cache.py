@@ -0,0 +1,45 @@
+from collections import OrderedDict, namedtuple
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "evictions", "size", "capacity"])
+
+class LRUCache:
+    # Bounded mapping from a position's Zobrist key to whatever a backend
+    # derives from it (legal moves, attack sets). The least recently used
+    # entry is dropped once capacity is reached. One cache may be shared by
+    # several positions of the same backend.
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> CacheStats:
+        return CacheStats(self.hits, self.misses, self.evictions, len(self.entries), self.capacity)
@@ -0,0 +1,764 @@
+from collections import Counter, namedtuple
+
+from chess.zobrist import CASTLING_KEYS, PIECE_KEYS_BY_NAME, SIDE_KEY, castling_mask, ep_key, position_key
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+Move = namedtuple("Move", ["from_square", "to_square", "promotion"], defaults=[None])
+
+KNIGHT_VECTORS = [(-1, -2), (1, -2), (-2, -1), (2, -1), (-1, 2), (1, 2), (-2, 1), (2, 1)]
+KING_VECTORS = [(0, -1), (0, 1), (1, 0), (-1, 0), (1, 1), (-1, 1), (-1, -1), (1, -1)]
+ROOK_VECTORS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_VECTORS = [(1, 1), (-1, 1), (-1, -1), (1, -1)]
+
+ROOK_CASTLING_RIGHTS = {("w", (7, 7)): "K", ("w", (0, 7)): "Q", ("b", (7, 0)): "k", ("b", (0, 0)): "q"}
+PIECE_LETTERS = {"pawn": "p", "knight": "n", "bishop": "b", "rook": "r", "queen": "q", "king": "k"}
+
+def square_name(square) -> str:
+    return "abcdefgh"[square[0]] + str(8 - square[1])
+
+def parse_square(name):
+    if name == "-":
+        return None
+    return ("abcdefgh".index(name[0]), 8 - int(name[1]))
+
+def move_to_uci(move) -> str:
+    promotion = PIECE_LETTERS[move.promotion[1:]] if move.promotion is not None else ""
+    return square_name(move.from_square) + square_name(move.to_square) + promotion
+
+def move_from_uci(text, turn):
+    promotion = None
+    if len(text) == 5:
+        for piece_type, letter in PIECE_LETTERS.items():
+            if letter == text[4]:
+                promotion = turn + piece_type
+    return Move(parse_square(text[0:2]), parse_square(text[2:4]), promotion)
+
+FEN_PIECES = {
+    'p': 'bpawn',
+    'r': 'brook',
+    'n': 'bknight',
+    'b': 'bbishop',
+    'q': 'bqueen',
+    'k': 'bking',
+    'P': 'wpawn',
+    'R': 'wrook',
+    'N': 'wknight',
+    'B': 'wbishop',
+    'Q': 'wqueen',
+    'K': 'wking'
+}
+FEN_LETTERS = {name: letter for letter, name in FEN_PIECES.items()}
+# The king and rook each castling right needs, as (column, FEN row) squares.
+CASTLING_PIECES = {"K": (((4, 7), "wking"), ((7, 7), "wrook")), "Q": (((4, 7), "wking"), ((0, 7), "wrook")),
+                   "k": (((4, 0), "bking"), ((7, 0), "brook")), "q": (((4, 0), "bking"), ((0, 0), "brook"))}
+
+def fen_decoder(fen, player_side="w"):
+    # player_side only chooses which way up the ranks are stored; positions
+    # always use "w" so that rank 8 is y == 0. The clocks are optional so the
+    # four-field positions of EPD records decode too.
+    fen_parts = fen.split()
+    board = {}
+    rows = fen_parts[0].split('/')
+
+    for i, row in enumerate(rows):
+        col = 0
+        for char in row:
+            if char.isdigit():
+                col += int(char)
+            else:
+                board[(col, i if player_side == "w" else 7-i)] = FEN_PIECES[char]
+                col += 1
+    turn = fen_parts[1] if len(fen_parts) > 1 else "w"
+    castling_availability = fen_parts[2] if len(fen_parts) > 2 else "-"
+    # A right whose king or rook is not on its square can never be used;
+    # it is dropped here so no backend generates a castle for it.
+    castling_availability = "".join(
+        right for right in castling_availability
+        if right in CASTLING_PIECES and all(board.get((col, row if player_side == "w" else 7 - row)) == name
+                                            for (col, row), name in CASTLING_PIECES[right])) or "-"
+    en_passant_target_square = fen_parts[3] if len(fen_parts) > 3 else "-"
+    halfmove_clock = int(fen_parts[4]) if len(fen_parts) > 4 else 0
+    fullmove_number = int(fen_parts[5]) if len(fen_parts) > 5 else 1
+
+    return {
+        'board': board,
+        'turn': turn,
+        'castling_availability': castling_availability,
+        'en_passant_target_square': en_passant_target_square,
+        'halfmove_clock': halfmove_clock,
+        'fullmove_number': fullmove_number,
+    }
+
+def fen_encoder(board, turn, castling_availability, en_passant_square, halfmove_clock, fullmove_number) -> str:
+    rows = []
+    for y in range(8):
+        row, empty = "", 0
+        for x in range(8):
+            name = board.get((x, y))
+            if name is None:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            row += FEN_LETTERS[name]
+        rows.append(row + (str(empty) if empty else ""))
+    en_passant = square_name(en_passant_square) if en_passant_square is not None else "-"
+    return f"{'/'.join(rows)} {turn} {castling_availability or '-'} {en_passant} {halfmove_clock} {fullmove_number}"
+
+def get_attacked_squares(piece_objects, board, en_passant_square, white_attacked_squares, black_attacked_squares, castling_availability=None) -> list:
+    white_attacked_squares = []
+    black_attacked_squares = []
+    for piece in piece_objects:
+
+        if isinstance(piece, Pawn):
+            piece.check_legal_moves(board, en_passant_square)
+            if piece.color == "w":
+                white_attacked_squares.extend(piece.attacked_squares)
+
+            else:
+                black_attacked_squares.extend(piece.attacked_squares)
+
+        elif isinstance(piece, King):
+            piece.check_legal_moves(board, piece_objects, white_attacked_squares, black_attacked_squares, castling_availability)
+
+        else:
+            piece.check_legal_moves(board)
+            if piece.color == "w":
+                white_attacked_squares.extend(piece.legal_moves)
+
+            else:
+                black_attacked_squares.extend(piece.legal_moves)
+
+    return white_attacked_squares, black_attacked_squares
+
+def get_pieces(board, en_passant_square, castling_availability, white_attacked_squares, black_attacked_squares) -> list:
+    piece_objects = []
+    for piece in board:
+        piece_type = board[piece][1:]
+        piece_color = board[piece][0]
+        if piece_type == "pawn":
+            piece_objects.append(Pawn(piece_color, piece))
+        elif piece_type == "king":
+            piece_objects.append(King(piece_color, piece, castling_availability))
+        elif piece_type == "rook":
+            piece_objects.append(Rook(piece_color, piece, castling_availability))
+        elif piece_type == "bishop":
+            piece_objects.append(Bishop(piece_color, piece))
+        elif piece_type == "queen":
+            piece_objects.append(Queen(piece_color, piece))
+        elif piece_type == "knight":
+            piece_objects.append(Knight(piece_color, piece))
+
+    for piece in piece_objects:
+        if not isinstance(piece, Pawn) and not isinstance(piece, King):
+            piece.check_legal_moves(board)
+        elif isinstance(piece, Pawn):
+            piece.check_legal_moves(board, en_passant_square)
+        elif isinstance(piece, King):
+            piece.check_legal_moves(board, piece_objects, white_attacked_squares, black_attacked_squares, castling_availability)
+    return piece_objects
+
+class Pawn:
+    # Direction tables and promotion names are shared by every instance; each
+    # pawn only stores references to the ones for its colour.
+    __slots__ = ("color", "position", "has_moved", "promotion_pieces", "possible_vectors", "legal_moves", "attacked_squares")
+    VECTORS = {"w": ((0, -1), (-1, -1), (1, -1), (0, -2)), "b": ((0, 1), (-1, 1), (1, 1), (0, 2))}
+    PROMOTION_PIECES = {color: (color+"bishop", color+"knight", color+"rook", color+"queen") for color in "wb"}
+    CAPTURE_VECTORS = ((-1, -1), (1, -1), (-1, 1), (1, 1))
+    PUSH_VECTORS = ((0, 1), (0, -1))
+    DOUBLE_PUSH_VECTORS = ((0, 2), (0, -2))
+    MOVE_OVER = {-2 : -1, 2 : 1, -1 : -1, 1 : 1}
+    value = 1
+
+    def __init__(self, color, position):
+        self.color = color
+        self.position = position
+        self.has_moved = False if (self.position[1] == 6 and color == "w") or (self.position[1] == 1 and color == "b") else True
+        self.promotion_pieces = Pawn.PROMOTION_PIECES[color]
+        self.possible_vectors = Pawn.VECTORS[color]
+        self.legal_moves = []
+        self.attacked_squares = []
+
+    def check_legal_moves(self, board, en_passant_square) -> None:
+        move_over = Pawn.MOVE_OVER
+        self.attacked_squares, self.legal_moves = [], []
+        for vector in self.possible_vectors:
+            if self.position[0] + vector[0] < 8 and self.position[0] + vector[0] >= 0 and self.position[1] + vector[1] < 8 and self.position[1] + vector[1] >= 0:
+                if (self.position[0] + vector[0], self.position[1] + vector[1]) in board and vector in Pawn.CAPTURE_VECTORS:
+                    if board[(self.position[0] + vector[0], self.position[1] + vector[1])][0] != self.color:
+                        self.legal_moves.append((self.position[0] + vector[0], self.position[1] + vector[1]))
+
+                elif (self.position[0] + vector[0], self.position[1] + vector[1]) not in board and vector in Pawn.CAPTURE_VECTORS and (self.position[0] + vector[0], self.position[1] + vector[1]) == en_passant_square:
+                    self.legal_moves.append((self.position[0] + vector[0], self.position[1] + vector[1]))
+
+                elif (self.position[0] + vector[0], self.position[1] + vector[1]) not in board and vector in Pawn.PUSH_VECTORS:
+                    self.legal_moves.append((self.position[0] + vector[0], self.position[1] + vector[1]))
+
+                elif ((self.position[0] + vector[0], self.position[1] + vector[1]) not in board and (self.position[0], self.position[1] + move_over[vector[1]]) not in board) and vector in Pawn.DOUBLE_PUSH_VECTORS and not self.has_moved:
+                    self.legal_moves.append((self.position[0] + vector[0], self.position[1] + vector[1]))
+
+                if vector in Pawn.CAPTURE_VECTORS:
+                    if (self.position[0] + vector[0], self.position[1] + vector[1]) in board:
+                        if board[(self.position[0] + vector[0], self.position[1] + vector[1])][0] != self.color:
+                            self.attacked_squares.append((self.position[0] + vector[0], self.position[1] + vector[1]))
+                    else:
+                        self.attacked_squares.append((self.position[0] + vector[0], self.position[1] + vector[1]))
+class King:
+    __slots__ = ("color", "position", "has_moved", "legal_moves")
+    possible_vectors = KING_VECTORS
+    ROOKS = {"w" : ["wrook", (7, 7), (0, 7)], "b" : ["brook", (7, 0), (0, 0)]}
+    CASTLE_MOVES = {"w" : {0 : (2, 0), 1 : (-2, 0)}, "b" : {0 : (2, 0), 1 : (-2, 0)}}
+    EMPTY_SQUARES = {"w" : {0 : [(5, 7), (6, 7)], 1 : [(1, 7), (2, 7), (3, 7)]}, "b" : {0 : [(5, 0), (6, 0)], 1 : [(1, 0), (2, 0), (3, 0)]}}
+    value = 0
+
+    def __init__(self, color, position, castling_availability):
+        self.color = color
+        self.position = position
+        rights = "KQ" if color == "w" else "kq"
+        self.has_moved = not any(right in castling_availability for right in rights)
+        self.legal_moves = []
+
+    def check_legal_moves(self, board, piece_objects, white_attacked_squares, black_attacked_squares, castling_availability=None):
+        # Given castling_availability, a rook on its corner may castle if the
+        # matching right is still held, which is what its has_moved flag
+        # mirrors; without it the rook object is looked up in piece_objects.
+        self.legal_moves = []
+        for vector in self.possible_vectors:
+            next_pos = (self.position[0] + vector[0], self.position[1] + vector[1])
+            if 0 <= next_pos[0] <= 7 and 0 <= next_pos[1] <= 7:
+                if next_pos in board:
+                    if board[next_pos][0] != self.color and board[next_pos][1:] != "king":
+                        self.legal_moves.append(next_pos)
+                else:
+                    self.legal_moves.append(next_pos)
+
+        rooks, castle_moves, empty_squares = King.ROOKS, King.CASTLE_MOVES, King.EMPTY_SQUARES
+
+        color = self.color
+        if self.has_moved or self.position != (4, 7 if color == "w" else 0):
+            return
+        for rook_pos in [rooks[color][1], rooks[color][2]]:
+            if rook_pos in board and board[rook_pos] == rooks[color][0]:
+                if castling_availability is not None:
+                    can_castle = ROOK_CASTLING_RIGHTS[(color, rook_pos)] in castling_availability
+                else:
+                    rook = None
+                    for piece in piece_objects:
+                        if piece.position == rook_pos and isinstance(piece, Rook):
+                            rook = piece
+                    can_castle = rook != None and not rook.has_moved
+
+                if can_castle:
+                    castle_elegibility = True
+                    for i in empty_squares[color][rooks[color].index(rook_pos) - 1]:
+                        if i in board:
+                            castle_elegibility = False
+
+                    if castle_elegibility:
+                        new_position = (self.position[0] + castle_moves[color][rooks[color].index(rook_pos) - 1][0], self.position[1])
+                        self.legal_moves.append(new_position)
+
+class Piece_Long_Range:
+    __slots__ = ("color", "position", "has_moved", "legal_moves")
+    vector_cols = ((0, 1), (0, -1), (1, 0), (-1, 0))
+    vector_diagonals = ((1, 1), (-1, 1), (-1, -1), (1, -1))
+
+    def __init__(self, color, position) -> None:
+        self.color = color
+        self.position = position
+        self.has_moved = False
+        self.legal_moves = []
+
+    def check_cols(self, board):
+        for direction in self.vector_cols:
+            next_position = (self.position[0] + direction[0], self.position[1] + direction[1])
+            while 0 <= next_position[0] < 8 and 0 <= next_position[1] < 8:
+                if next_position in board:
+                    if board[next_position][0] != self.color:
+                        self.legal_moves.append(next_position)
+                    break
+                else:
+                    self.legal_moves.append(next_position)
+
+                next_position = (next_position[0] + direction[0], next_position[1] + direction[1])
+
+        return self.legal_moves
+
+    def check_diagonals(self, board):
+        for direction in self.vector_diagonals:
+            next_position = (self.position[0] + direction[0], self.position[1] + direction[1])
+            while 0 <= next_position[0] < 8 and 0 <= next_position[1] < 8:
+                if next_position in board:
+                    if board[next_position][0] != self.color:
+                        self.legal_moves.append(next_position)
+                    break
+                else:
+                    self.legal_moves.append(next_position)
+
+                next_position = (next_position[0] + direction[0], next_position[1] + direction[1])
+
+        return self.legal_moves
+
+class Rook(Piece_Long_Range):
+    __slots__ = ()
+    value = 5
+
+    def __init__(self, color, position, castling_availability="KQkq"):
+        super().__init__(color, position)
+        right = ROOK_CASTLING_RIGHTS.get((color, position))
+        self.has_moved = right is None or right not in castling_availability
+
+    def check_legal_moves(self, board):
+        self.legal_moves = []
+        self.check_cols(board)
+
+class Bishop(Piece_Long_Range):
+    __slots__ = ()
+    value = 3
+
+    def check_legal_moves(self, board):
+        self.legal_moves = []
+        self.check_diagonals(board)
+
+class Knight:
+    __slots__ = ("color", "position", "has_moved", "legal_moves")
+    possible_vectors = KNIGHT_VECTORS
+    value = 3
+
+    def __init__(self, color, position):
+        self.color = color
+        self.position = position
+        self.has_moved = False
+        self.legal_moves = []
+
+    def check_legal_moves(self, board):
+        self.legal_moves = []
+        for vector in self.possible_vectors:
+            new_pos = (self.position[0] + vector[0], self.position[1] + vector[1])
+            if 0 <= new_pos[0] <= 7 and 0 <= new_pos[1] <= 7:
+                if new_pos in board:
+                    if board[new_pos][0] == self.color:
+                        continue
+                    else:
+                        self.legal_moves.append(new_pos)
+                else:
+                    self.legal_moves.append(new_pos)
+
+class Queen(Piece_Long_Range):
+    __slots__ = ()
+    value = 9
+
+    def check_legal_moves(self, board):
+        self.legal_moves = []
+        self.check_cols(board)
+        self.check_diagonals(board)
+        return self.legal_moves
+
+PROMOTION_CLASSES = {"queen": Queen, "rook": Rook, "bishop": Bishop, "knight": Knight}
+
+def is_square_attacked(board, square, by_color) -> bool:
+    x, y = square
+    pawn_row = y + 1 if by_color == "w" else y - 1
+    if board.get((x - 1, pawn_row)) == by_color + "pawn" or board.get((x + 1, pawn_row)) == by_color + "pawn":
+        return True
+    for dx, dy in KNIGHT_VECTORS:
+        if board.get((x + dx, y + dy)) == by_color + "knight":
+            return True
+    for dx, dy in KING_VECTORS:
+        if board.get((x + dx, y + dy)) == by_color + "king":
+            return True
+    for vectors, sliders in ((ROOK_VECTORS, ("rook", "queen")), (BISHOP_VECTORS, ("bishop", "queen"))):
+        for dx, dy in vectors:
+            next_x, next_y = x + dx, y + dy
+            while 0 <= next_x < 8 and 0 <= next_y < 8:
+                name = board.get((next_x, next_y))
+                if name is not None:
+                    if name[0] == by_color and name[1:] in sliders:
+                        return True
+                    break
+                next_x, next_y = next_x + dx, next_y + dy
+    return False
+
+def check_next_move(board, piece_objects, board_pos, selected_square, en_passant_square, dragged_info, white_attacked_squares, black_attacked_squares):
+    color = dragged_info[0][0]
+    origin = board.pop(selected_square, None)
+    captured = board.get(board_pos)
+    board[board_pos] = dragged_info[0]
+
+    en_passant_capture, captured_pawn = None, None
+    if dragged_info[0][1:] == "pawn" and board_pos == en_passant_square and board_pos[0] != selected_square[0]:
+        en_passant_capture = (board_pos[0], selected_square[1])
+        captured_pawn = board.pop(en_passant_capture, None)
+
+    king_square = board_pos if dragged_info[0][1:] == "king" else None
+    if king_square is None:
+        for piece in piece_objects:
+            if isinstance(piece, King) and piece.color == color:
+                king_square = piece.position
+                break
+
+    in_check = is_square_attacked(board, king_square, "b" if color == "w" else "w")
+
+    if captured is None:
+        board.pop(board_pos)
+    else:
+        board[board_pos] = captured
+    if origin is not None:
+        board[selected_square] = origin
+    if captured_pawn is not None:
+        board[en_passant_capture] = captured_pawn
+
+    return in_check
+
+def checks_and_pins(board, king_square, color):
+    opponent = "b" if color == "w" else "w"
+    x, y = king_square
+    checkers, block_squares, pinned = [], set(), {}
+
+    for vectors, sliders in ((ROOK_VECTORS, ("rook", "queen")), (BISHOP_VECTORS, ("bishop", "queen"))):
+        for dx, dy in vectors:
+            path, own_piece = [], None
+            next_x, next_y = x + dx, y + dy
+            while 0 <= next_x < 8 and 0 <= next_y < 8:
+                name = board.get((next_x, next_y))
+                if name is None:
+                    path.append((next_x, next_y))
+                elif name[0] == color:
+                    if own_piece is not None:
+                        break
+                    own_piece = (next_x, next_y)
+                else:
+                    if name[1:] in sliders:
+                        if own_piece is None:
+                            checkers.append((next_x, next_y))
+                            block_squares.update(path)
+                            block_squares.add((next_x, next_y))
+                        else:
+                            pinned[own_piece] = (dx, dy)
+                    break
+                next_x, next_y = next_x + dx, next_y + dy
+
+    for dx, dy in KNIGHT_VECTORS:
+        if board.get((x + dx, y + dy)) == opponent + "knight":
+            checkers.append((x + dx, y + dy))
+            block_squares.add((x + dx, y + dy))
+    pawn_row = y - 1 if color == "w" else y + 1
+    for dx in (-1, 1):
+        if board.get((x + dx, pawn_row)) == opponent + "pawn":
+            checkers.append((x + dx, pawn_row))
+            block_squares.add((x + dx, pawn_row))
+
+    return checkers, block_squares, pinned
+
+# Castling rights lost when a move starts or ends on each square.
+CASTLING_SQUARES = {(4, 7): "KQ", (7, 7): "K", (0, 7): "Q", (4, 0): "kq", (7, 0): "k", (0, 0): "q"}
+
+class Position:
+    def __init__(self, fen=STARTING_FEN, cache=None):
+        board_info = fen_decoder(fen, "w")
+        self.board = board_info["board"]
+        self.turn = board_info["turn"]
+        self.castling_availability = board_info["castling_availability"]
+        self.en_passant_square = parse_square(board_info["en_passant_target_square"])
+        self.halfmove_clock = board_info["halfmove_clock"]
+        self.fullmove_number = board_info["fullmove_number"]
+        self.white_attacked_squares, self.black_attacked_squares = [], []
+        self.piece_objects = get_pieces(self.board, self.en_passant_square, self.castling_availability, self.white_attacked_squares, self.black_attacked_squares)
+        self.white_attacked_squares, self.black_attacked_squares = get_attacked_squares(self.piece_objects, self.board, self.en_passant_square, self.white_attacked_squares, self.black_attacked_squares)
+        self.history = []
+        self.key = position_key(self)
+        # Occurrences of each position key so far and a count of each piece,
+        # both updated by make_move and unmake_move so draw rules never have
+        # to rescan the game or the board.
+        self.repetitions = {self.key: 1}
+        self.material = Counter(self.board.values())
+        # Optional LRUCache of (legal moves, white attacks, black attacks) by
+        # key. A hit leaves the pieces' own legal_moves lists stale, which is
+        # fine because every miss regenerates them before they are read.
+        self.cache = cache
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return (self.key == other.key and self.board == other.board and self.turn == other.turn
+                and self.castling_availability == other.castling_availability and self.en_passant_square == other.en_passant_square)
+
+    def __hash__(self):
+        return self.key
+
+    def fen(self) -> str:
+        return fen_encoder(self.board, self.turn, self.castling_availability, self.en_passant_square, self.halfmove_clock, self.fullmove_number)
+
+    def piece_at(self, square):
+        for piece in self.piece_objects:
+            if piece.position == square:
+                return piece
+        return None
+
+    def king(self, color):
+        for piece in self.piece_objects:
+            if isinstance(piece, King) and piece.color == color:
+                return piece
+        return None
+
+    def in_check(self) -> bool:
+        return is_square_attacked(self.board, self.king(self.turn).position, "b" if self.turn == "w" else "w")
+
+    def repetition_count(self) -> int:
+        return self.repetitions[self.key]
+
+    def has_insufficient_material(self, color) -> bool:
+        # Same rules as BitboardPosition.has_insufficient_material; only the
+        # all-bishops case has to look at the board, for square colours.
+        material = self.material
+        other = "b" if color == "w" else "w"
+        if material[color + "pawn"] or material[color + "rook"] or material[color + "queen"]:
+            return False
+        if material[color + "knight"]:
+            return (material[color + "knight"] + material[color + "bishop"] == 1
+                    and not (material[other + "pawn"] or material[other + "knight"] or material[other + "bishop"] or material[other + "rook"]))
+        if material[color + "bishop"]:
+            if material["wpawn"] or material["bpawn"] or material["wknight"] or material["bknight"]:
+                return False
+            return len({(x + y) % 2 for (x, y), name in self.board.items() if name[1:] == "bishop"}) == 1
+        return True
+
+    def is_insufficient_material(self) -> bool:
+        return self.has_insufficient_material("w") and self.has_insufficient_material("b")
+
+    def castling_is_legal(self, king, board_pos) -> bool:
+        rook_x, step = (7, 1) if board_pos[0] > king.position[0] else (0, -1)
+        if self.board.get((rook_x, king.position[1])) != king.color + "rook":
+            return False
+        for x in range(king.position[0] + step, rook_x, step):
+            if (x, king.position[1]) in self.board:
+                return False
+        opponent = "b" if king.color == "w" else "w"
+        for x in (king.position[0], king.position[0] + step, board_pos[0]):
+            if is_square_attacked(self.board, (x, king.position[1]), opponent):
+                return False
+        return True
+
+    def legal_moves(self) -> list:
+        if self.cache is not None:
+            entry = self.cache.get(self.key)
+            if entry is not None:
+                moves, self.white_attacked_squares, self.black_attacked_squares = entry
+                return list(moves)
+
+        self.white_attacked_squares, self.black_attacked_squares = get_attacked_squares(self.piece_objects, self.board, self.en_passant_square, self.white_attacked_squares, self.black_attacked_squares, self.castling_availability)
+        king = self.king(self.turn)
+        checks = checks_and_pins(self.board, king.position, self.turn)
+
+        moves = []
+        for piece in self.piece_objects:
+            if piece.color == self.turn:
+                self.add_legal_targets(piece, king, checks, moves)
+        if self.cache is not None:
+            self.cache.put(self.key, (tuple(moves), self.white_attacked_squares, self.black_attacked_squares))
+        return moves
+
+    def add_legal_targets(self, piece, king, checks, moves) -> None:
+        # Appends the Moves among piece.legal_moves, which must be current,
+        # that do not leave king in check; checks is checks_and_pins() for it.
+        checkers, block_squares, pinned = checks
+        dragged_info = [self.board[piece.position], piece.position]
+        for target in piece.legal_moves:
+            if piece is king and abs(target[0] - piece.position[0]) == 2:
+                if not self.castling_is_legal(king, target):
+                    continue
+
+            elif piece is king or (isinstance(piece, Pawn) and target == self.en_passant_square and target[0] != piece.position[0]):
+                if check_next_move(self.board, self.piece_objects, target, piece.position, self.en_passant_square, dragged_info, self.white_attacked_squares, self.black_attacked_squares):
+                    continue
+
+            elif len(checkers) > 1 or (checkers and target not in block_squares):
+                continue
+
+            elif piece.position in pinned:
+                dx, dy = pinned[piece.position]
+                if dx * (target[1] - king.position[1]) != dy * (target[0] - king.position[0]):
+                    continue
+
+            if isinstance(piece, Pawn) and target[1] in (0, 7):
+                for promotion in piece.promotion_pieces:
+                    moves.append(Move(piece.position, target, promotion))
+            else:
+                moves.append(Move(piece.position, target))
+
+    def piece_legal_moves(self, piece, king, checks) -> list:
+        # Regenerates one piece's moves and keeps the legal ones, leaving the
+        # other pieces and both attack maps alone.
+        if isinstance(piece, Pawn):
+            piece.check_legal_moves(self.board, self.en_passant_square)
+        elif isinstance(piece, King):
+            piece.check_legal_moves(self.board, self.piece_objects, self.white_attacked_squares, self.black_attacked_squares, self.castling_availability)
+        else:
+            piece.check_legal_moves(self.board)
+        moves = []
+        self.add_legal_targets(piece, king, checks, moves)
+        return moves
+
+    def moves_from(self, square) -> list:
+        # Legal moves of the piece on square only, for highlighting one
+        # square or checking one move, without legal_moves() regenerating
+        # every piece first.
+        piece = self.piece_at(square)
+        if piece is None or piece.color != self.turn:
+            return []
+        if self.cache is not None:
+            entry = self.cache.get(self.key)
+            if entry is not None:
+                return [move for move in entry[0] if move.from_square == square]
+        king = self.king(self.turn)
+        return self.piece_legal_moves(piece, king, checks_and_pins(self.board, king.position, self.turn))
+
+    def has_legal_moves(self) -> bool:
+        # Stops at the first piece with a legal move, king first.
+        if self.cache is not None:
+            entry = self.cache.get(self.key)
+            if entry is not None:
+                return bool(entry[0])
+        king = self.king(self.turn)
+        checks = checks_and_pins(self.board, king.position, self.turn)
+        if self.piece_legal_moves(king, king, checks):
+            return True
+        if len(checks[0]) > 1:
+            return False
+        return any(self.piece_legal_moves(piece, king, checks) for piece in self.piece_objects
+                   if piece.color == self.turn and piece is not king)
+
+    def generate_legal(self) -> list:
+        return self.legal_moves()
+
+    def make_move(self, move) -> None:
+        selected_square, board_pos = move.from_square, move.to_square
+        selected_piece = self.piece_at(selected_square)
+        # Taken before the board changes, while the pawns that decide it
+        # are still where they were.
+        old_ep_key = ep_key(self.board, self.turn, self.en_passant_square)
+        piece = self.board.pop(selected_square)
+        captured_piece = self.piece_at(board_pos)
+        captured_square = board_pos
+
+        next_pos = (board_pos[0] - selected_square[0], board_pos[1] - selected_square[1])
+        en_passant_square = None
+        rook = None
+        if isinstance(selected_piece, Pawn):
+            if next_pos in [(0, 2), (0, -2)]:
+                en_passant_square = (board_pos[0], board_pos[1] - 1) if selected_piece.color == "b" else (board_pos[0], board_pos[1] + 1)
+
+            elif next_pos[0] != 0 and board_pos == self.en_passant_square:
+                captured_square = (board_pos[0], selected_square[1])
+                captured_piece = self.piece_at(captured_square)
+
+        elif isinstance(selected_piece, King) and next_pos in [(2, 0), (-2, 0)]:
+            rook_from, rook_to = ((7, board_pos[1]), (5, board_pos[1])) if next_pos == (2, 0) else ((0, board_pos[1]), (3, board_pos[1]))
+            rook = self.piece_at(rook_from)
+
+        captured_index, captured_name = None, None
+        if captured_piece is not None:
+            captured_index = self.piece_objects.index(captured_piece)
+            self.piece_objects.pop(captured_index)
+            captured_name = self.board.pop(captured_square)
+            self.material[captured_name] -= 1
+
+        self.history.append((move, selected_piece, getattr(selected_piece, "has_moved", False), captured_piece, captured_index, captured_square, captured_name,
+                             rook, rook.has_moved if rook is not None else None,
+                             self.castling_availability, self.en_passant_square, self.halfmove_clock, self.key))
+
+        key = self.key ^ SIDE_KEY ^ PIECE_KEYS_BY_NAME[piece][selected_square[1] * 8 + selected_square[0]]
+        if captured_name is not None:
+            key ^= PIECE_KEYS_BY_NAME[captured_name][captured_square[1] * 8 + captured_square[0]]
+
+        if rook is not None:
+            self.board[rook_to] = self.board.pop(rook_from)
+            rook.position = rook_to
+            rook.has_moved = True
+            key ^= PIECE_KEYS_BY_NAME[rook.color + "rook"][rook_from[1] * 8 + rook_from[0]] ^ PIECE_KEYS_BY_NAME[rook.color + "rook"][rook_to[1] * 8 + rook_to[0]]
+
+        self.board[board_pos] = piece
+        selected_piece.position = board_pos
+        selected_piece.has_moved = True
+
+        if move.promotion is not None:
+            self.piece_objects[self.piece_objects.index(selected_piece)] = PROMOTION_CLASSES[move.promotion[1:]](selected_piece.color, board_pos)
+            self.board[board_pos] = move.promotion
+            self.material[piece] -= 1
+            self.material[move.promotion] += 1
+        key ^= PIECE_KEYS_BY_NAME[self.board[board_pos]][board_pos[1] * 8 + board_pos[0]]
+
+        if isinstance(selected_piece, Pawn) or captured_piece is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.turn == "b":
+            self.fullmove_number += 1
+
+        castling_availability = self.castling_availability
+        for square in (selected_square, board_pos):
+            for right in CASTLING_SQUARES.get(square, ""):
+                castling_availability = castling_availability.replace(right, "")
+        if castling_availability == "":
+            castling_availability = "-"
+        if castling_availability != self.castling_availability:
+            key ^= CASTLING_KEYS[castling_mask(self.castling_availability)] ^ CASTLING_KEYS[castling_mask(castling_availability)]
+            self.castling_availability = castling_availability
+
+        self.turn = "w" if self.turn == "b" else "b"
+        key ^= old_ep_key ^ ep_key(self.board, self.turn, en_passant_square)
+        self.en_passant_square = en_passant_square
+        self.key = key
+        self.repetitions[key] = self.repetitions.get(key, 0) + 1
+
+    def unmake_move(self) -> None:
+        count = self.repetitions[self.key]
+        if count == 1:
+            del self.repetitions[self.key]
+        else:
+            self.repetitions[self.key] = count - 1
+        (move, selected_piece, has_moved, captured_piece, captured_index, captured_square, captured_name, rook, rook_has_moved,
+         self.castling_availability, self.en_passant_square, self.halfmove_clock, self.key) = self.history.pop()
+        self.turn = "w" if self.turn == "b" else "b"
+        if self.turn == "b":
+            self.fullmove_number -= 1
+
+        self.board[move.from_square] = self.board.pop(move.to_square)
+        if move.promotion is not None:
+            self.piece_objects[self.piece_objects.index(self.piece_at(move.to_square))] = selected_piece
+            self.board[move.from_square] = selected_piece.color + "pawn"
+            self.material[move.promotion] -= 1
+            self.material[selected_piece.color + "pawn"] += 1
+        selected_piece.position = move.from_square
+        selected_piece.has_moved = has_moved
+
+        if rook is not None:
+            rook_from = (7, move.to_square[1]) if move.to_square[0] > move.from_square[0] else (0, move.to_square[1])
+            self.board[rook_from] = self.board.pop(rook.position)
+            rook.position = rook_from
+            rook.has_moved = rook_has_moved
+
+        if captured_piece is not None:
+            self.board[captured_square] = captured_name
+            self.piece_objects.insert(captured_index, captured_piece)
+            self.material[captured_name] += 1
+
+    def push(self, move) -> None:
+        self.make_move(move)
+        entry = self.cache.get(self.key) if self.cache is not None else None
+        if entry is not None:
+            _, self.white_attacked_squares, self.black_attacked_squares = entry
+            return
+        self.white_attacked_squares, self.black_attacked_squares = get_attacked_squares(self.piece_objects, self.board, self.en_passant_square, self.white_attacked_squares, self.black_attacked_squares)
+
+BACKENDS = ("dict", "bitboard")
+
+def create_position(fen=STARTING_FEN, backend="bitboard", cache=None):
+    if backend == "dict":
+        return Position(fen, cache)
+    if backend == "bitboard":
+        from chess.bitboard import BitboardPosition
+        return BitboardPosition(fen, cache)
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
@@ -0,0 +1,259 @@
+import argparse
+import sys
+import time
+
+from chess.bitboard import (BISHOP, BLACK, FULL, KNIGHT, KNIGHT_ATTACKS, PAWN, QUEEN, ROOK, WHITE, BitboardPosition,
+                            bishop_attacks, rook_attacks)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Centipawn values, 100 times the piece classes' value attributes.
+PIECE_VALUES = [100, 300, 300, 500, 900, 0]
+
+# Centipawns per square attacked and not occupied by the own side. Each group
+# counts the union of its pieces' attacks, which is what one bitboard fill
+# over all of them produces: knights, diagonal sliders (bishops and queens)
+# and orthogonal sliders (rooks and queens).
+KNIGHT_MOBILITY = 4
+DIAGONAL_MOBILITY = 3
+ORTHOGONAL_MOBILITY = 2
+
+# Piece-square tables from White's point of view, laid out as the board is
+# drawn: the first row is rank 8, so entry y * 8 + x is the square index the
+# bitboards use. Black reads them mirrored with sq ^ 56.
+PIECE_SQUARE = [
+    [  0,   0,   0,   0,   0,   0,   0,   0,
+      50,  50,  50,  50,  50,  50,  50,  50,
+      10,  10,  20,  30,  30,  20,  10,  10,
+       5,   5,  10,  25,  25,  10,   5,   5,
+       0,   0,   0,  20,  20,   0,   0,   0,
+       5,  -5, -10,   0,   0, -10,  -5,   5,
+       5,  10,  10, -20, -20,  10,  10,   5,
+       0,   0,   0,   0,   0,   0,   0,   0],
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20,   0,   0,   0,   0, -20, -40,
+     -30,   0,  10,  15,  15,  10,   0, -30,
+     -30,   5,  15,  20,  20,  15,   5, -30,
+     -30,   0,  15,  20,  20,  15,   0, -30,
+     -30,   5,  10,  15,  15,  10,   5, -30,
+     -40, -20,   0,   5,   5,   0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10,   0,   0,   0,   0,   0,   0, -10,
+     -10,   0,   5,  10,  10,   5,   0, -10,
+     -10,   5,   5,  10,  10,   5,   5, -10,
+     -10,   0,  10,  10,  10,  10,   0, -10,
+     -10,  10,  10,  10,  10,  10,  10, -10,
+     -10,   5,   0,   0,   0,   0,   5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],
+    [  0,   0,   0,   0,   0,   0,   0,   0,
+       5,  10,  10,  10,  10,  10,  10,   5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+      -5,   0,   0,   0,   0,   0,   0,  -5,
+       0,   0,   0,   5,   5,   0,   0,   0],
+    [-20, -10, -10,  -5,  -5, -10, -10, -20,
+     -10,   0,   0,   0,   0,   0,   0, -10,
+     -10,   0,   5,   5,   5,   5,   0, -10,
+      -5,   0,   5,   5,   5,   5,   0,  -5,
+       0,   0,   5,   5,   5,   5,   0,  -5,
+     -10,   5,   5,   5,   5,   5,   0, -10,
+     -10,   0,   5,   0,   0,   0,   0, -10,
+     -20, -10, -10,  -5,  -5, -10, -10, -20],
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+      20,  20,   0,   0,   0,   0,  20,  20,
+      20,  30,  10,   0,   0,  10,  30,  20],
+]
+
+# Material plus placement for each bitboard piece index, signed for White.
+PST = ([[PIECE_VALUES[piece] + PIECE_SQUARE[piece][sq] for sq in range(64)] for piece in range(6)]
+       + [[-(PIECE_VALUES[piece] + PIECE_SQUARE[piece][sq ^ 56]) for sq in range(64)] for piece in range(6)])
+
+def material(position) -> int:
+    pieces = position.pieces
+    score = 0
+    for piece_type in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+        score += PIECE_VALUES[piece_type] * (pieces[piece_type].bit_count() - pieces[6 + piece_type].bit_count())
+    return score
+
+def placement(position) -> int:
+    score = 0
+    for table, bb in zip(PST, position.pieces):
+        while bb:
+            low = bb & -bb
+            score += table[low.bit_length() - 1]
+            bb ^= low
+    return score
+
+def mobility(position) -> int:
+    pieces, occupancy = position.pieces, position.occupancy
+    occupied = occupancy[0] | occupancy[1]
+    score = 0
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        offset = color * 6
+        knights = diagonal = orthogonal = 0
+        bb = pieces[offset + KNIGHT]
+        while bb:
+            low = bb & -bb
+            knights |= KNIGHT_ATTACKS[low.bit_length() - 1]
+            bb ^= low
+        bb = pieces[offset + BISHOP] | pieces[offset + QUEEN]
+        while bb:
+            low = bb & -bb
+            diagonal |= bishop_attacks(low.bit_length() - 1, occupied)
+            bb ^= low
+        bb = pieces[offset + ROOK] | pieces[offset + QUEEN]
+        while bb:
+            low = bb & -bb
+            orthogonal |= rook_attacks(low.bit_length() - 1, occupied)
+            bb ^= low
+        targets = FULL ^ occupancy[color]
+        score += sign * (KNIGHT_MOBILITY * (knights & targets).bit_count()
+                         + DIAGONAL_MOBILITY * (diagonal & targets).bit_count()
+                         + ORTHOGONAL_MOBILITY * (orthogonal & targets).bit_count())
+    return score
+
+def evaluate_white(position) -> int:
+    return placement(position) + mobility(position)
+
+def evaluate(position) -> int:
+    score = placement(position) + mobility(position)
+    return score if position.side == WHITE else -score
+
+# Batch evaluation works on an (N, 12) array of uint64 bitboards, indexed like
+# BitboardPosition.pieces, or an (N, 12, 64) array of 0/1 squares. Placement is
+# summed through per-byte lookup tables and mobility through Kogge-Stone fills
+# over whole columns, so there is no Python loop per position.
+
+NOT_A_FILE = FULL ^ sum(1 << (y * 8) for y in range(8))
+NOT_H_FILE = FULL ^ sum(1 << (y * 8 + 7) for y in range(8))
+NOT_AB_FILE = NOT_A_FILE & (NOT_A_FILE << 1) & FULL
+NOT_GH_FILE = NOT_H_FILE & (NOT_H_FILE >> 1)
+
+# (shift, mask) pairs; a positive shift moves towards higher square numbers.
+KNIGHT_SHIFTS = [(17, NOT_A_FILE), (15, NOT_H_FILE), (10, NOT_AB_FILE), (6, NOT_GH_FILE),
+                 (-6, NOT_AB_FILE), (-10, NOT_GH_FILE), (-15, NOT_A_FILE), (-17, NOT_H_FILE)]
+ROOK_SHIFTS = [(8, FULL), (-8, FULL), (1, NOT_A_FILE), (-1, NOT_H_FILE)]
+BISHOP_SHIFTS = [(9, NOT_A_FILE), (7, NOT_H_FILE), (-7, NOT_A_FILE), (-9, NOT_H_FILE)]
+
+BATCH_CHUNK = 16384
+
+if np is not None:
+    # BYTE_PST[piece * 8 + k, byte] is the PST sum of the set bits of byte k
+    # of that piece's bitboard, flattened so one take() scores a position.
+    _bits = (np.arange(256)[:, None] >> np.arange(8)[None, :]) & 1
+    BYTE_PST = np.einsum("bj,pkj->pkb", _bits, np.array(PST, dtype=np.int64).reshape(12, 8, 8)).astype(np.int32).reshape(-1)
+    BYTE_OFFSETS = np.arange(96, dtype=np.intp) * 256
+    POPCOUNT_8 = _bits.sum(axis=1).astype(np.uint8)
+    del _bits
+
+def _shift(bb, amount):
+    return bb << np.uint64(amount) if amount > 0 else bb >> np.uint64(-amount)
+
+def _popcount(bb):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bb).astype(np.int32)
+    return POPCOUNT_8[bb.view(np.uint8)].reshape(bb.shape + (8,)).sum(axis=-1, dtype=np.int32)
+
+def _slide(gen, empty, shifts):
+    attacks = np.zeros_like(gen)
+    for amount, mask in shifts:
+        mask = np.uint64(mask)
+        flood, propagate = gen, empty & mask
+        flood = flood | (propagate & _shift(flood, amount))
+        propagate = propagate & _shift(propagate, amount)
+        flood = flood | (propagate & _shift(flood, 2 * amount))
+        propagate = propagate & _shift(propagate, 2 * amount)
+        flood = flood | (propagate & _shift(flood, 4 * amount))
+        attacks |= _shift(flood, amount) & mask
+    return attacks
+
+def as_bitboards(positions):
+    # Accepts BitboardPositions, an (N, 12, 64) square array or an (N, 12)
+    # uint64 bitboard array, and returns the (N, 12) uint64 form.
+    if np is None:
+        raise ImportError("batch evaluation requires numpy")
+    if not isinstance(positions, np.ndarray):
+        return np.array([position.pieces for position in positions], dtype=np.uint64).reshape(-1, 12)
+    if positions.ndim == 3:
+        packed = np.packbits(positions.astype(bool), axis=-1, bitorder="little")
+        return np.ascontiguousarray(packed).view("<u8").reshape(positions.shape[0], 12).astype(np.uint64)
+    return positions.astype(np.uint64, copy=False)
+
+def _evaluate_chunk(pieces):
+    count = pieces.shape[0]
+    as_bytes = np.ascontiguousarray(pieces.astype("<u8", copy=False)).view(np.uint8).reshape(count, 96)
+    scores = np.take(BYTE_PST, as_bytes + BYTE_OFFSETS).sum(axis=1, dtype=np.int64)
+
+    # Both colours are filled in one pass: rows 0..count-1 are White's pieces
+    # and rows count.. are Black's.
+    white = np.bitwise_or.reduce(pieces[:, 0:6], axis=1)
+    black = np.bitwise_or.reduce(pieces[:, 6:12], axis=1)
+    empty = np.tile(~(white | black), 2)
+    targets = ~np.concatenate((white, black))
+    sides = np.concatenate((pieces[:, 0:6], pieces[:, 6:12]))
+    knights = sides[:, KNIGHT]
+    knight_attacks = np.zeros_like(knights)
+    for amount, mask in KNIGHT_SHIFTS:
+        knight_attacks |= _shift(knights, amount) & np.uint64(mask)
+    diagonal = _slide(sides[:, BISHOP] | sides[:, QUEEN], empty, BISHOP_SHIFTS)
+    orthogonal = _slide(sides[:, ROOK] | sides[:, QUEEN], empty, ROOK_SHIFTS)
+    mobility = (KNIGHT_MOBILITY * _popcount(knight_attacks & targets)
+                + DIAGONAL_MOBILITY * _popcount(diagonal & targets)
+                + ORTHOGONAL_MOBILITY * _popcount(orthogonal & targets))
+    return scores + mobility[:count] - mobility[count:]
+
+def evaluate_batch(positions, sides=None):
+    # Scores from White's point of view, or from the side to move's when
+    # sides (0 = white, 1 = black per position) is given. Work is done in
+    # chunks so the temporaries stay in cache.
+    pieces = as_bitboards(positions)
+    scores = np.empty(pieces.shape[0], dtype=np.int64)
+    for start in range(0, pieces.shape[0], BATCH_CHUNK):
+        scores[start:start + BATCH_CHUNK] = _evaluate_chunk(pieces[start:start + BATCH_CHUNK])
+    if sides is not None:
+        scores = np.where(np.asarray(sides) == BLACK, -scores, scores)
+    return scores
+
+def _read_positions(path):
+    with open(path) as file:
+        return [BitboardPosition(line) for line in file if line.strip()]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.evaluate", description="Compare single and batch evaluation speed.")
+    parser.add_argument("path", help="file with one FEN per line")
+    parser.add_argument("--repeat", type=int, default=1, help="tile the positions this many times for the batch run")
+    args = parser.parse_args(argv)
+
+    positions = _read_positions(args.path)
+    if not positions:
+        print("no positions")
+        return 1
+    start = time.perf_counter()
+    single = [evaluate_white(position) for position in positions]
+    elapsed = time.perf_counter() - start
+    print(f"single {len(positions)} positions in {elapsed:.3f}s, {len(positions) / elapsed if elapsed > 0 else 0:.0f} positions/s")
+    if np is None:
+        print("numpy is not installed, skipping the batch run")
+        return 0
+
+    bitboards = np.tile(as_bitboards(positions), (args.repeat, 1))
+    start = time.perf_counter()
+    scores = evaluate_batch(bitboards)
+    elapsed = time.perf_counter() - start
+    print(f"batch  {len(bitboards)} positions in {elapsed:.3f}s, {len(bitboards) / elapsed if elapsed > 0 else 0:.0f} positions/s")
+    print("batch matches single" if scores[:len(positions)].tolist() == single else "MISMATCH between batch and single")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import argparse
+import re
+import sys
+from collections import namedtuple
+
+from chess.bitboard import KING, PROMOTION, BitboardPosition
+from chess.engine import BACKENDS, STARTING_FEN, create_position, move_from_uci, move_to_uci
+
+# Everything one game needs lives on its Game: the position (board, piece
+# objects, side to move, castling and en passant state, attack maps), the
+# moves played so far and the result. Nothing is shared between games except
+# an optional move cache, which is keyed by position and so safe to share.
+
+UCI_MOVE = re.compile(r"[a-h][1-8][a-h][1-8][nbrq]?")
+
+Outcome = namedtuple("Outcome", ["termination", "result"])
+
+_SHUFFLE = "e2e4 g8f6 g1f3 f6g8 f3g1 g8f6 f1e2 f6g8 e2f1"
+_EP_START = "4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1"
+_KINGS = "e8d8 e1d1 d8e8 d1e1"
+# Games whose repetition count and outcome were checked against
+# python-chess: (name, fen, moves, repetitions, outcome, claimed outcome).
+# After e2e4 no black pawn can take en passant, so the starting position
+# with e4 played repeats; on _EP_START d4xe3 is possible after e2e4, so the
+# first position with e4 played differs from its later copies.
+OUTCOME_CASES = [
+    ("threefold", STARTING_FEN, _SHUFFLE, 3, None, "threefold_repetition"),
+    ("fivefold", STARTING_FEN, _SHUFFLE + " g8f6 f1e2 f6g8 e2f1 g8f6 f1e2 f6g8 e2f1", 5,
+     "fivefold_repetition", "fivefold_repetition"),
+    ("en passant", _EP_START, f"e2e4 {_KINGS} {_KINGS}", 2, None, None),
+    ("en passant 3", _EP_START, f"e2e4 {_KINGS} {_KINGS} {_KINGS}", 3, None, "threefold_repetition"),
+]
+
+FEN_RANK = re.compile(r"(?:[pnbrqkPNBRQK]|[1-8](?![1-8]))+")
+
+def validate_fen(fen) -> None:
+    # Raises ValueError unless fen is a position the engine can play from:
+    # a board of 8 ranks of 8 files, w or b to move, castling and en passant
+    # fields that fit the side to move, no pawns on the first or last rank,
+    # one king of each colour and the side not to move not in check. The
+    # clocks may be left out, as in EPD records. Castling rights whose king
+    # or rook has left its square are dropped by fen_decoder, not refused.
+    if not isinstance(fen, str):
+        raise ValueError(f"FEN must be a string, got {fen!r}")
+    fields = fen.split()
+    if not 1 <= len(fields) <= 6:
+        raise ValueError(f"Not a valid FEN: {fen!r} has {len(fields)} fields, expected at most 6")
+    ranks = fields[0].split("/")
+    if len(ranks) != 8:
+        raise ValueError(f"Not a valid FEN: {fen!r} has {len(ranks)} ranks")
+    for rank in ranks:
+        if not FEN_RANK.fullmatch(rank) or sum(int(char) if char.isdigit() else 1 for char in rank) != 8:
+            raise ValueError(f"Not a valid FEN: rank {rank!r} of {fen!r} is not 8 squares")
+    side = fields[1] if len(fields) > 1 else "w"
+    if side not in ("w", "b"):
+        raise ValueError(f"Not a valid FEN: {fen!r}, the side to move must be w or b")
+    castling = fields[2] if len(fields) > 2 else "-"
+    if castling != "-" and (not castling or any(castling.count(right) > 1 for right in castling)
+                            or set(castling) - set("KQkq")):
+        raise ValueError(f"Not a valid FEN: {fen!r}, castling rights must be - or letters of KQkq")
+    en_passant = fields[3] if len(fields) > 3 else "-"
+    if en_passant != "-" and not re.fullmatch("[a-h]6" if side == "w" else "[a-h]3", en_passant):
+        raise ValueError(f"Not a valid FEN: {fen!r}, en passant square {en_passant} cannot follow a double push")
+    if any(not field.isdigit() for field in fields[4:]) or fields[5:] == ["0"]:
+        raise ValueError(f"Not a valid FEN: {fen!r}, the halfmove clock must count from 0 and the move number from 1")
+    if re.search("[pP]", ranks[0] + ranks[7]):
+        raise ValueError(f"Not a valid FEN: {fen!r} has a pawn on the first or last rank")
+    position = BitboardPosition(fen)
+    if position.pieces[KING].bit_count() != 1 or position.pieces[6 + KING].bit_count() != 1:
+        raise ValueError(f"Not a valid FEN: {fen!r} needs one king of each colour")
+    king = position.pieces[(position.side ^ 1) * 6 + KING]
+    if position.is_attacked(king.bit_length() - 1, position.side):
+        raise ValueError(f"Not a valid FEN: {fen!r}, the side not to move is in check")
+
+def parse_uci(position, text):
+    # Returns the Move for a legal UCI move in position and raises
+    # ValueError for anything else. Only the moves of the piece being moved
+    # are generated; the bitboard backend compares encoded moves instead of
+    # building a Move for each of them.
+    if not isinstance(text, str) or not UCI_MOVE.fullmatch(text):
+        raise ValueError(f"Malformed move {text!r}, expected UCI such as e2e4 or e7e8q")
+    move = move_from_uci(text, position.turn)
+    if isinstance(position, BitboardPosition):
+        from_sq = move.from_square[1] * 8 + move.from_square[0]
+        if position.occupancy[position.side] >> from_sq & 1:
+            encoded = position.encode_move(move)
+            if bool(encoded >> 12 & PROMOTION) == (move.promotion is not None) and position.is_legal(encoded):
+                return move
+    elif move in position.moves_from(move.from_square):
+        return move
+    raise ValueError(f"Illegal move {text} in {position.fen()}")
+
+def outcome(position, legal=None, claim_draws=False):
+    # Returns an Outcome, or None while the game goes on. Checkmate,
+    # insufficient material, stalemate, the 75-move rule and fivefold
+    # repetition end the game by themselves; the 50-move rule and threefold
+    # repetition only with claim_draws, and only for the current position,
+    # not for a position the next move would reach. Apart from whether any
+    # move is legal, which is answered from the legal moves when the caller
+    # has them and otherwise stops at the first piece that can move, every
+    # test is a lookup in counters the position keeps up to date.
+    can_move = bool(legal) if legal is not None else position.has_legal_moves()
+    if not can_move and position.in_check():
+        return Outcome("checkmate", "0-1" if position.turn == "w" else "1-0")
+    if position.is_insufficient_material():
+        return Outcome("insufficient_material", "1/2-1/2")
+    if not can_move:
+        return Outcome("stalemate", "1/2-1/2")
+    if position.halfmove_clock >= 150:
+        return Outcome("seventyfive_moves", "1/2-1/2")
+    repetitions = position.repetition_count()
+    if repetitions >= 5:
+        return Outcome("fivefold_repetition", "1/2-1/2")
+    if claim_draws:
+        if position.halfmove_clock >= 100:
+            return Outcome("fifty_moves", "1/2-1/2")
+        if repetitions >= 3:
+            return Outcome("threefold_repetition", "1/2-1/2")
+    return None
+
+class Game:
+    # With claim_draws the game also ends at the first threefold repetition
+    # or fifty-move draw, as if the player to move claimed it.
+    def __init__(self, fen=STARTING_FEN, backend="bitboard", cache=None, game_id=None, claim_draws=False):
+        validate_fen(fen)
+        self.id = game_id
+        self.start_fen = fen
+        self.position = create_position(fen, backend, cache)
+        self.claim_draws = claim_draws
+        self.moves = []
+        self.update()
+
+    def update(self) -> None:
+        # Nothing generates the full list of legal moves after a move: the
+        # outcome only needs to know whether one exists and parse_move() only
+        # looks at the moved piece. The list is built on first use of legal.
+        self._legal = None
+        self.outcome = outcome(self.position, None, self.claim_draws)
+        self.result = self.outcome.result if self.outcome is not None else "*"
+
+    @property
+    def legal(self) -> list:
+        if self._legal is None:
+            self._legal = self.position.generate_legal()
+        return self._legal
+
+    @property
+    def is_over(self) -> bool:
+        return self.outcome is not None
+
+    @property
+    def turn(self):
+        return self.position.turn
+
+    def fen(self) -> str:
+        return self.position.fen()
+
+    def legal_moves(self) -> list:
+        if self.outcome is not None:
+            return []
+        if isinstance(self.position, BitboardPosition):
+            return [move_to_uci(self.position.to_move(move)) for move in self.legal]
+        return [move_to_uci(move) for move in self.legal]
+
+    def parse_move(self, text):
+        return parse_uci(self.position, text)
+
+    def push(self, move) -> None:
+        # move must already be legal, as returned by parse_move() or taken
+        # from position.legal_moves().
+        self.position.push(move)
+        self.moves.append(move_to_uci(move))
+        self.update()
+
+    def play(self, text) -> None:
+        if self.outcome is not None:
+            raise ValueError(f"Game is over ({self.outcome.termination}, {self.result})")
+        self.push(self.parse_move(text))
+
+    def claim_draw(self) -> bool:
+        # Ends the game if the side to move may claim a draw right now.
+        if self.outcome is None:
+            claimed = outcome(self.position, self._legal, claim_draws=True)
+            if claimed is not None:
+                self.outcome, self.result = claimed, claimed.result
+        return self.outcome is not None and self.result == "1/2-1/2"
+
+    def pgn(self, headers=None) -> str:
+        from chess.pgn import export_pgn
+        position = BitboardPosition(self.start_fen)
+        for text in self.moves:
+            position.push(move_from_uci(text, position.turn))
+        return export_pgn(position, headers, self.result)
+
+    def to_dict(self) -> dict:
+        return {"game": self.id, "fen": self.fen(), "turn": self.turn, "moves": list(self.moves), "result": self.result,
+                "termination": self.outcome.termination if self.outcome is not None else None}
+
+# Castling fields naming a king or rook that is not on its square, with the
+# rights kept and the legal moves python-chess finds: (name, fen, castling,
+# number of legal moves, castles among them).
+CASTLING_CASES = [
+    ("king on d1", "4k3/8/8/8/8/8/8/3K3R w K - 0 1", "-", 15, []),
+    ("no h8 rook", "r3k3/8/8/8/8/8/8/4K2R b KQkq - 0 1", "Kq", 16, ["e8c8"]),
+    ("no black", "4k3/8/8/8/8/8/8/4K2R w Kkq - 0 1", "K", 15, ["e1g1"]),
+    ("rooks moved", "1r2k2r/8/8/8/8/8/8/R3K1R1 w KQkq - 0 1", "Qk", 25, ["e1c1"]),
+]
+
+# FENs validate_fen must refuse, each for one reason.
+INVALID_FENS = [
+    ("long rank", "rnbqkbnrR/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("short rank", "rnbqkbn/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("split digits", "rnbqkbnr/pppppppp/44/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("nine ranks", "rnbqkbnr/pppppppp/8/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("bad piece", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1"),
+    ("bad side", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1"),
+    ("bad castling", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkx - 0 1"),
+    ("ep off board", "rnbqkbnr/pppp1ppp/8/4p3/8/8/PPPPPPPP/RNBQKBNR w KQkq e9 0 2"),
+    ("ep wrong rank", "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e6 0 1"),
+    ("bad clock", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - x 1"),
+    ("move zero", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 0"),
+    ("extra field", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 x"),
+    ("pawn on 8th", "rnbqkbnP/pppppppp/8/8/8/8/PPPPPPP1/RNBQKBNR w KQq - 0 1"),
+    ("pawn on 1st", "rnbqkbnr/ppppppp1/8/8/8/8/PPPPPPPP/RNBQKBNp w KQkq - 0 1"),
+    ("no kings", "8/8/8/8/8/8/8/8 w - - 0 1"),
+    ("two kings", "4k3/8/8/8/8/8/8/3KK3 w - - 0 1"),
+    ("king en prise", "4k2R/8/8/8/8/8/8/4K3 w - - 0 1"),
+]
+
+def check_fens(out=sys.stdout) -> bool:
+    passed = True
+    for name, fen in INVALID_FENS:
+        try:
+            validate_fen(fen)
+            error = None
+        except ValueError as raised:
+            error = str(raised)
+        passed = passed and error is not None
+        print(f"{name:<13} {'ok' if error is not None else 'FAIL, accepted'}  {error or fen}", file=out)
+    print("all invalid FENs refused" if passed else "INVALID FEN accepted", file=out)
+    return passed
+
+def check_castling(backend="bitboard", out=sys.stdout) -> bool:
+    passed = True
+    for name, fen, castling, count, castles in CASTLING_CASES:
+        game = Game(fen, backend)
+        legal = game.legal_moves()
+        got = (game.fen().split()[2], len(legal), sorted(text for text in legal if text in ("e1g1", "e1c1", "e8g8", "e8c8")))
+        ok = got == (castling, count, castles)
+        passed = passed and ok
+        print(f"{name:<13} castling {got[0]:<4}  legal {got[1]:>2}  castles {' '.join(got[2]) or '-':<9}  {'ok' if ok else 'FAIL'}", file=out)
+    print("all castling rights match" if passed else "MISMATCH against expected castling", file=out)
+    return passed
+
+def check_outcomes(backend="bitboard", out=sys.stdout) -> bool:
+    passed = True
+    for name, fen, moves, repetitions, expected, claimed in OUTCOME_CASES:
+        game = Game(fen, backend)
+        for text in moves.split():
+            game.play(text)
+        got = (game.position.repetition_count(), game.outcome and game.outcome.termination)
+        game.claim_draw()
+        got += (game.outcome and game.outcome.termination,)
+        ok = got == (repetitions, expected, claimed)
+        passed = passed and ok
+        print(f"{name:<13} repetitions {got[0]}  outcome {got[1]}  claimed {got[2]}  {'ok' if ok else 'FAIL'}", file=out)
+    print("all outcomes match" if passed else "MISMATCH against expected outcomes", file=out)
+    return passed
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.game", description="Check game rules on known positions.")
+    parser.add_argument("--check", action="store_true", required=True,
+                        help="check FEN validation, castling rights, repetition counts and draws on known positions")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    args = parser.parse_args(argv)
+    passed = check_fens()
+    passed = check_castling(args.backend) and passed
+    passed = check_outcomes(args.backend) and passed
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import argparse
+import cProfile
+import functools
+import importlib
+import json
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Switchable instrumentation for the hot paths. enable() swaps each hook
+# point below for a wrapper that counts (and optionally times) its calls, and
+# disable() puts the originals back, so with instrumentation off the code
+# that runs is exactly the uninstrumented code. Functions are also swapped in
+# every chess module that imported them by name.
+#
+# Timers are inclusive: time spent in a timed callee also counts for its
+# timed caller. Recursive hooks (the search) are counted, not timed.
+
+HOOKS = [
+    # module, attribute, metric, timed
+    ("chess.engine", "check_next_move", "legality.check_next_move", True),
+    ("chess.engine", "checks_and_pins", "legality.checks_and_pins", True),
+    ("chess.engine", "is_square_attacked", "legality.is_square_attacked", False),
+    ("chess.engine", "get_attacked_squares", "movegen.get_attacked_squares", True),
+    ("chess.engine", "Position.legal_moves", "movegen.dict.legal_moves", True),
+    ("chess.engine", "Position.make_move", "moves.dict.make_move", False),
+    ("chess.engine", "Position.push", "moves.dict.push", True),
+    ("chess.bitboard", "BitboardPosition.generate_legal_subset", "movegen.bitboard.generate_legal", True),
+    ("chess.bitboard", "BitboardPosition.make_move", "moves.bitboard.make_move", False),
+    ("chess.search", "Searcher.negamax", "search.nodes", False),
+    ("chess.search", "Searcher.quiescence", "search.quiescence_nodes", False),
+    ("chess.search", "Searcher.search", "search.search", True),
+    ("chess.evaluate", "evaluate", "search.evaluate", False),
+    ("chess.render", "BoardRenderer.render", "render.frame", True),
+    ("chess.render", "BoardRenderer.restore", "render.restore", True),
+    ("chess.render", "scale_pieces", "render.scale_pieces", True),
+    ("chess.atlas", "PieceAtlas.build", "render.build_atlas", True),
+    ("pygame.transform", "scale", "render.transform_scale", True),
+]
+
+counters = Counter()
+timers = defaultdict(lambda: [0, 0.0])
+_installed = []
+_started = None
+_stopped = None
+
+def _counted(func, name):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        counters[name] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+def _timed(func, name):
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            entry = timers[name]
+            entry[0] += 1
+            entry[1] += perf_counter() - start
+    return wrapper
+
+def is_enabled() -> bool:
+    return bool(_installed)
+
+def enable(hooks=HOOKS) -> int:
+    # Returns the number of hook points installed. Only modules that are
+    # already imported are hooked: enabling never imports anything, so a
+    # headless UCI session does not load pygame, whose banner would land on
+    # the protocol's stdout. Modules imported after enable() are not hooked.
+    global _started, _stopped
+    if _installed:
+        return len(_installed)
+    for module_name, attribute, name, timed in hooks:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        owner_name, _, attribute_name = attribute.rpartition(".")
+        owner = getattr(module, owner_name) if owner_name else module
+        original = owner.__dict__.get(attribute_name)
+        if original is None:
+            continue
+        wrapper = (_timed if timed else _counted)(original, name)
+        targets = [owner]
+        if not owner_name:
+            targets += [other for key, other in list(sys.modules.items())
+                        if other is not module and key.startswith("chess") and getattr(other, attribute_name, None) is original]
+        for target in targets:
+            setattr(target, attribute_name, wrapper)
+            _installed.append((target, attribute_name, original))
+    _started, _stopped = time.perf_counter(), None
+    return len(_installed)
+
+def disable() -> None:
+    global _stopped
+    if _installed:
+        _stopped = time.perf_counter()
+    while _installed:
+        target, attribute_name, original = _installed.pop()
+        setattr(target, attribute_name, original)
+
+def reset() -> None:
+    global _started, _stopped
+    counters.clear()
+    timers.clear()
+    _started, _stopped = (time.perf_counter() if _installed else None), None
+
+def snapshot() -> dict:
+    return {
+        "enabled": is_enabled(),
+        "wall_s": (_stopped or time.perf_counter()) - _started if _started is not None else 0.0,
+        "counters": dict(sorted(counters.items())),
+        "timers": {name: {"calls": calls, "total_s": total, "mean_us": total / calls * 1e6 if calls else 0.0}
+                   for name, (calls, total) in sorted(timers.items())},
+    }
+
+def report(out=sys.stdout) -> None:
+    data = snapshot()
+    print(f"instrumentation over {data['wall_s']:.3f}s", file=out)
+    for name, stats in data["timers"].items():
+        print(f"  {name:<36} {stats['calls']:>10} calls {stats['total_s']:>9.3f}s {stats['mean_us']:>10.1f} us/call", file=out)
+    for name, count in data["counters"].items():
+        print(f"  {name:<36} {count:>10} calls", file=out)
+
+class Profiler:
+    # cProfile plus a stack sampler over every thread, so work done by the
+    # UCI search thread shows up too. write(prefix) leaves:
+    #   prefix.prof    pstats data (snakeviz, gprof2dot, python -m pstats)
+    #   prefix.folded  collapsed stacks for flamegraph.pl, inferno or speedscope
+    #   prefix.json    the instrumentation snapshot and the top functions
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.profiles = []
+        self.samples = Counter()
+        self.stopping = threading.Event()
+        self.sampler = None
+        self.elapsed = 0.0
+
+    def _thread_profile(self, *args):
+        # Runs as the first profile event of each new thread and hands the
+        # thread over to its own cProfile.Profile. Only used before Python
+        # 3.12; should another profiler be active anyway, the thread runs
+        # unprofiled and the stack sampler still sees it.
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return
+        self.profiles.append(profile)
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self.stopping.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        enable()
+        reset()
+        self.start_time = time.perf_counter()
+        self.sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self.sampler.start()
+        # From Python 3.12 cProfile is built on sys.monitoring: one Profile
+        # sees the calls of every thread and a second one cannot be enabled.
+        # Before that each thread needs a Profile of its own.
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._thread_profile)
+        self.main_profile = cProfile.Profile()
+        self.main_profile.enable()
+
+    def stop(self) -> None:
+        self.main_profile.disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        self.stopping.set()
+        self.sampler.join()
+        self.elapsed = time.perf_counter() - self.start_time
+        self.metrics = snapshot()
+        disable()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.main_profile)
+        for profile in self.profiles:
+            if profile.getstats():
+                stats.add(profile)
+        return stats
+
+    def write(self, prefix, top=30) -> list:
+        stats = self.stats()
+        stats.dump_stats(prefix + ".prof")
+        with open(prefix + ".folded", "w") as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write(f"{stack} {count}\n")
+        hottest = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top]
+        functions = [{"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls, "total_s": total,
+                      "cumulative_s": cumulative} for (filename, line, name), (_, calls, total, cumulative, _) in hottest]
+        with open(prefix + ".json", "w") as file:
+            json.dump({"elapsed_s": self.elapsed, "samples": sum(self.samples.values()), "metrics": self.metrics,
+                       "functions": functions}, file, indent=2)
+        return [prefix + suffix for suffix in (".prof", ".folded", ".json")]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.instrument",
+                                     description="Run a module's command line under the profiler and instrumentation.")
+    parser.add_argument("--out", default="profile", metavar="PREFIX", help="write PREFIX.prof, PREFIX.folded and PREFIX.json")
+    parser.add_argument("--interval", type=float, default=1.0, metavar="MS", help="stack sampling interval (default 1 ms)")
+    parser.add_argument("module", help="module to run, e.g. chess.perft")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the module")
+    args = parser.parse_args(argv)
+
+    # Modules with a main(argv) are imported and called, so the hooks land on
+    # the same module objects the command runs; anything else goes through
+    # runpy as a fresh __main__.
+    module = importlib.import_module(args.module)
+    saved_argv = sys.argv
+    sys.argv = [args.module] + args.args
+    profiler = Profiler(args.interval / 1000)
+    status = 0
+    try:
+        with profiler:
+            if callable(getattr(module, "main", None)):
+                status = module.main(args.args) or 0
+            else:
+                runpy.run_module(args.module, run_name="__main__", alter_sys=True)
+    except SystemExit as exit:
+        status = exit.code if isinstance(exit.code, int) else 0
+    finally:
+        sys.argv = saved_argv
+    paths = profiler.write(args.out)
+    print(f"\nprofiled {args.module}: {sum(profiler.samples.values())} stack samples", file=sys.stderr)
+    report(sys.stderr)
+    print(f"wrote {', '.join(paths)}", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
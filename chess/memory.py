@@ -0,0 +1,57 @@
+import argparse
+import sys
+import tracemalloc
+from array import array
+
+from chess.bitboard import BitboardPosition
+from chess.engine import Position
+from chess.packed import pack_position
+from chess.perft import PERFT_POSITIONS
+
+# Memory is measured as what stays allocated: build many objects, keep them
+# alive, and divide the traced growth by how many were built. Allocation
+# counts are live memory blocks, so "per move" is how many separate objects
+# each stored move costs.
+
+def measure(build, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+    return kept, size, blocks
+
+def report(out=sys.stdout, count=200) -> None:
+    fens = [fen for _, fen, _ in PERFT_POSITIONS]
+
+    print("bytes per position", file=out)
+    for name, build in (("dict backend", lambda i: Position(fens[i % len(fens)])),
+                        ("bitboard backend", lambda i: BitboardPosition(fens[i % len(fens)])),
+                        ("fen string", lambda i: BitboardPosition(fens[i % len(fens)]).fen()),
+                        ("packed record", lambda i: pack_position(BitboardPosition(fens[i % len(fens)])))):
+        _, size, blocks = measure(build, count)
+        print(f"  {name:<18} {size / count:9.1f} bytes  {blocks / count:7.1f} blocks", file=out)
+
+    dict_positions = [Position(fen) for fen in fens]
+    bitboard_positions = [BitboardPosition(fen) for fen in fens]
+    moves_per_round = sum(len(position.generate_legal()) for position in bitboard_positions)
+    print("per generated move (kept)", file=out)
+    for name, build in (("Move namedtuples", lambda i: dict_positions[i % len(fens)].legal_moves()),
+                        ("int list", lambda i: bitboard_positions[i % len(fens)].generate_legal()),
+                        ("array('H')", lambda i: array("H", bitboard_positions[i % len(fens)].generate_legal()))):
+        _, size, blocks = measure(build, count)
+        moves = moves_per_round * count / len(fens)
+        print(f"  {name:<18} {size / moves:9.1f} bytes  {blocks / moves:7.2f} allocations", file=out)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.memory", description="Report memory per position and per generated move.")
+    parser.add_argument("--count", type=int, default=600, help="objects built per measurement")
+    args = parser.parse_args(argv)
+    report(count=args.count)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
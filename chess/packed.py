@@ -0,0 +1,265 @@
+import argparse
+import mmap
+import pickle
+import struct
+import sys
+import time
+
+from chess.bitboard import PAWN, PAWN_ATTACKS, PIECE_INDEX, PIECE_NAMES, SQUARES, BitboardPosition, iter_bits
+from chess.engine import create_position, fen_decoder, fen_encoder, parse_square
+from chess.zobrist import CASTLING_KEYS, EP_KEYS, PIECE_KEYS, SIDE_KEY, castling_mask
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# A position packs into 32 little-endian bytes:
+#   0-7    occupancy, bit y * 8 + x set for every occupied square
+#   8-23   one nibble per occupied square in ascending square order, holding
+#          the bitboard piece index (white pawn..king = 0-5, black = 6-11),
+#          low nibble first
+#   24     bit 0 side to move (1 = black), bits 4-7 castling mask (K=1 Q=2 k=4 q=8)
+#   25     en passant square, 255 if none
+#   26-27  halfmove clock
+#   28-29  fullmove number
+#   30-31  reserved, zero
+# Legal positions have at most 32 pieces, which is what fits in the nibbles.
+
+RECORD = struct.Struct("<Q16sBBHH2x")
+RECORD_SIZE = RECORD.size
+NO_EP = 255
+
+# Database files are a 32 byte header followed by packed records, so record i
+# starts at HEADER_SIZE + i * RECORD_SIZE and can be sliced straight out of a
+# memory map.
+MAGIC = b"CHESSPOS"
+VERSION = 1
+HEADER = struct.Struct("<8sHH20x")
+HEADER_SIZE = HEADER.size
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([("occupancy", "<u8"), ("pieces", "u1", (16,)), ("flags", "u1"), ("ep", "u1"),
+                             ("halfmove", "<u2"), ("fullmove", "<u2"), ("reserved", "u1", (2,))])
+
+def _pack(pieces_by_square, occupancy, side, castling, ep_square, halfmove_clock, fullmove_number) -> bytes:
+    if len(pieces_by_square) > 32:
+        raise ValueError(f"Cannot pack a position with {len(pieces_by_square)} pieces, the limit is 32")
+    nibbles = bytearray(16)
+    for i, piece in enumerate(pieces_by_square):
+        nibbles[i >> 1] |= piece << ((i & 1) * 4)
+    return RECORD.pack(occupancy, bytes(nibbles), side | castling << 4, NO_EP if ep_square is None else ep_square,
+                       halfmove_clock, fullmove_number)
+
+def pack_board(board, turn, castling_availability, en_passant_square, halfmove_clock, fullmove_number) -> bytes:
+    squares = sorted((y * 8 + x, PIECE_INDEX[name]) for (x, y), name in board.items())
+    occupancy = 0
+    for sq, _ in squares:
+        occupancy |= 1 << sq
+    ep_square = None if en_passant_square is None else en_passant_square[1] * 8 + en_passant_square[0]
+    return _pack([piece for _, piece in squares], occupancy, 1 if turn == "b" else 0, castling_mask(castling_availability),
+                 ep_square, halfmove_clock, fullmove_number)
+
+def pack_fen(fen) -> bytes:
+    board_info = fen_decoder(fen)
+    return pack_board(board_info["board"], board_info["turn"], board_info["castling_availability"],
+                      parse_square(board_info["en_passant_target_square"]), board_info["halfmove_clock"],
+                      board_info["fullmove_number"])
+
+def pack_position(position) -> bytes:
+    if isinstance(position, BitboardPosition):
+        occupancy = position.occupancy[0] | position.occupancy[1]
+        piece_at = {}
+        for piece, bb in enumerate(position.pieces):
+            for sq in iter_bits(bb):
+                piece_at[sq] = piece
+        return _pack([piece_at[sq] for sq in iter_bits(occupancy)], occupancy, position.side, position.castling,
+                     None if position.ep_square == -1 else position.ep_square, position.halfmove_clock,
+                     position.fullmove_number)
+    return pack_board(position.board, position.turn, position.castling_availability, position.en_passant_square,
+                      position.halfmove_clock, position.fullmove_number)
+
+def _piece_codes(nibbles):
+    return [code for byte in nibbles for code in (byte & 15, byte >> 4)]
+
+def unpack_board(data) -> dict:
+    occupancy, nibbles, flags, ep_square, halfmove_clock, fullmove_number = RECORD.unpack(data)
+    board = {SQUARES[sq]: PIECE_NAMES[code] for sq, code in zip(iter_bits(occupancy), _piece_codes(nibbles))}
+    castling = flags >> 4
+    return {
+        'board': board,
+        'turn': "b" if flags & 1 else "w",
+        'castling_availability': "".join(char for bit, char in zip((1, 2, 4, 8), "KQkq") if castling & bit) or "-",
+        'en_passant_square': None if ep_square == NO_EP else SQUARES[ep_square],
+        'halfmove_clock': halfmove_clock,
+        'fullmove_number': fullmove_number,
+    }
+
+def unpack_fen(data) -> str:
+    board_info = unpack_board(data)
+    return fen_encoder(board_info["board"], board_info["turn"], board_info["castling_availability"],
+                       board_info["en_passant_square"], board_info["halfmove_clock"], board_info["fullmove_number"])
+
+def unpack_position(data, backend="bitboard"):
+    if backend != "bitboard":
+        return create_position(unpack_fen(data), backend)
+    # Fill the bitboards and Zobrist key straight from the record, without
+    # going through FEN text.
+    occupancy, nibbles, flags, ep_square, halfmove_clock, fullmove_number = RECORD.unpack(data)
+    position = BitboardPosition.__new__(BitboardPosition)
+    pieces = [0] * 12
+    key = 0
+    for sq, code in zip(iter_bits(occupancy), _piece_codes(nibbles)):
+        pieces[code] |= 1 << sq
+        key ^= PIECE_KEYS[code][sq]
+    position.pieces = pieces
+    position.occupancy = [pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5],
+                          pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]]
+    position.side = flags & 1
+    position.castling = flags >> 4
+    position.ep_square = -1 if ep_square == NO_EP else ep_square
+    position.halfmove_clock, position.fullmove_number = halfmove_clock, fullmove_number
+    position.history = []
+    position.cache = None
+    key ^= CASTLING_KEYS[position.castling]
+    if position.ep_square != -1 and PAWN_ATTACKS[position.side ^ 1][position.ep_square] & pieces[position.side * 6 + PAWN]:
+        key ^= EP_KEYS[position.ep_square % 8]
+    if position.side:
+        key ^= SIDE_KEY
+    position.key = key
+    position.repetitions = {key: 1}
+    return position
+
+def write_database(path, positions) -> int:
+    # positions may be position objects, FEN strings or already packed
+    # records; they are consumed lazily and written one at a time.
+    count = 0
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        for position in positions:
+            if isinstance(position, str):
+                record = pack_fen(position)
+            elif isinstance(position, (bytes, bytearray, memoryview)):
+                record = bytes(position)
+            else:
+                record = pack_position(position)
+            file.write(record)
+            count += 1
+    return count
+
+class PositionDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} position database")
+        self.count = (len(self.map) - HEADER_SIZE) // RECORD_SIZE
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index) -> bytes:
+        # A copy of the record, sliced straight from the memory map. Records
+        # are small enough that copying costs less than a memoryview object,
+        # and a copy stays valid after close(), which a view into the map
+        # would block with BufferError.
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("position index out of range")
+        start = HEADER_SIZE + index * RECORD_SIZE
+        return self.map[start:start + RECORD_SIZE]
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def fen(self, index) -> str:
+        return unpack_fen(self[index])
+
+    def position(self, index, backend="bitboard"):
+        return unpack_position(self[index], backend)
+
+    def array(self):
+        if np is None:
+            raise ImportError("PositionDatabase.array() requires numpy")
+        return np.memmap(self.path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(self.count,))
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _read_fens(path):
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+
+def _pgn_positions(path):
+    from chess.pgn import open_lines, read_games, replay
+    for game in read_games(open_lines(path)):
+        for position, _ in replay(game):
+            yield pack_position(position)
+
+def benchmark(fens, out=sys.stdout) -> None:
+    # Encode from and decode back to a BitboardPosition for each format.
+    positions = [BitboardPosition(fen) for fen in fens]
+    if not positions:
+        print("no positions", file=out)
+        return
+    formats = [
+        ("packed", pack_position, unpack_position),
+        ("fen", BitboardPosition.fen, BitboardPosition),
+        ("pickle", lambda position: pickle.dumps(position, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    ]
+    count = len(positions)
+    for name, encode, decode in formats:
+        start = time.perf_counter()
+        encoded = [encode(position) for position in positions]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = [decode(data) for data in encoded]
+        decode_time = time.perf_counter() - start
+        size = sum(len(data) for data in encoded)
+        ok = decoded == positions
+        print(f"{name:<7} {size / count:7.1f} bytes/position  encode {count / encode_time if encode_time > 0 else 0:10.0f}/s  "
+              f"decode {count / decode_time if decode_time > 0 else 0:10.0f}/s  {'ok' if ok else 'MISMATCH'}", file=out)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.packed", description="Build or inspect packed position databases.")
+    parser.add_argument("input", help="FEN file (one per line), PGN file with --pgn, or a database with --show")
+    parser.add_argument("output", nargs="?", help="database file to write")
+    parser.add_argument("--pgn", action="store_true", help="store every position of every game in a PGN file")
+    parser.add_argument("--show", type=int, nargs="*", metavar="INDEX", help="print the FEN of records in a database")
+    parser.add_argument("--bench", action="store_true", help="compare size and speed against FEN text and pickle")
+    args = parser.parse_args(argv)
+
+    if args.show is not None:
+        with PositionDatabase(args.input) as database:
+            print(f"{len(database)} positions")
+            for index in args.show or range(min(len(database), 10)):
+                print(f"{index}: {database.fen(index)}")
+        return 0
+    if args.bench:
+        benchmark(_read_fens(args.input))
+        return 0
+    if args.output is None:
+        parser.error("an output path is required to build a database")
+    start = time.perf_counter()
+    count = write_database(args.output, _pgn_positions(args.input) if args.pgn else _read_fens(args.input))
+    elapsed = time.perf_counter() - start
+    print(f"{count} positions, {HEADER_SIZE + count * RECORD_SIZE} bytes in {elapsed:.3f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import argparse
+import random
+import sys
+import time
+
+from chess.bitboard import BitboardPosition
+from chess.cache import LRUCache
+from chess.engine import BACKENDS, STARTING_FEN, create_position, move_to_uci
+
+# Published node counts for depths 1-5 (chessprogramming.org "Perft Results").
+PERFT_POSITIONS = [
+    ("startpos", STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+def perft(position, depth) -> int:
+    if depth == 0:
+        return 1
+    moves = position.generate_legal()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+def divide(position, depth) -> dict:
+    counts = {}
+    for move in position.generate_legal():
+        position.make_move(move)
+        nodes = perft(position, depth - 1)
+        position.unmake_move()
+        public_move = position.to_move(move) if hasattr(position, "to_move") else move
+        counts[move_to_uci(public_move)] = nodes
+    return counts
+
+def timed_perft(position, depth):
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+def run_suite(backend="bitboard", max_depth=5, max_nodes=5_000_000, out=sys.stdout) -> bool:
+    passed = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in PERFT_POSITIONS:
+        for depth, expected_nodes in enumerate(expected[:max_depth], 1):
+            if expected_nodes > max_nodes:
+                break
+            nodes, elapsed, nps = timed_perft(create_position(fen, backend), depth)
+            ok = nodes == expected_nodes
+            passed = passed and ok
+            total_nodes += nodes
+            total_time += elapsed
+            print(f"{name:<10} depth {depth}  {nodes:>10} / {expected_nodes:<10} {'ok' if ok else 'FAIL'}  {elapsed:8.3f}s  {nps:10.0f} nps", file=out)
+    if total_time > 0:
+        print(f"total      {total_nodes} nodes in {total_time:.3f}s, {total_nodes / total_time:.0f} nps", file=out)
+    print("all positions match" if passed else "MISMATCH against published counts", file=out)
+    return passed
+
+def sample_positions(count, plies=60, seed=1) -> list:
+    # FENs met along random games from the suite positions, a spread of
+    # openings, middlegames and endgames for the query benchmark.
+    rng = random.Random(seed)
+    fens = []
+    while len(fens) < count:
+        position = BitboardPosition(PERFT_POSITIONS[len(fens) % len(PERFT_POSITIONS)][1])
+        for _ in range(rng.randrange(plies)):
+            moves = position.generate_legal()
+            if not moves:
+                break
+            position.make_move(rng.choice(moves))
+        fens.append(position.fen())
+    return fens
+
+def benchmark_queries(backend="bitboard", count=200, repeat=5, out=sys.stdout) -> dict:
+    # Answers "what can the piece on this square do" for every piece of the
+    # side to move and "is any move legal" once per position, first from the
+    # full legal list as before and then with moves_from() and
+    # has_legal_moves(). Times are per query, best of repeat runs.
+    fens = sample_positions(count)
+    positions = [create_position(fen, backend) for fen in fens]
+    squares = []
+    for fen, position in zip(fens, positions):
+        own = BitboardPosition(fen)
+        own_squares = [sq for sq in range(64) if own.occupancy[own.side] >> sq & 1]
+        squares.append(own_squares if backend == "bitboard" else [(sq % 8, sq // 8) for sq in own_squares])
+    queries = sum(len(own_squares) for own_squares in squares)
+
+    def eager_square():
+        for position, own_squares in zip(positions, squares):
+            for square in own_squares:
+                moves = position.generate_legal()
+                if backend == "bitboard":
+                    [move for move in moves if move & 63 == square]
+                else:
+                    [move for move in moves if move.from_square == square]
+
+    def lazy_square():
+        for position, own_squares in zip(positions, squares):
+            for square in own_squares:
+                position.moves_from(square)
+
+    def eager_any():
+        for position in positions:
+            bool(position.generate_legal())
+
+    def lazy_any():
+        for position in positions:
+            position.has_legal_moves()
+
+    results = {}
+    for name, run, per in (("moves_from eager", eager_square, queries), ("moves_from lazy", lazy_square, queries),
+                           ("any legal eager", eager_any, len(positions)), ("any legal lazy", lazy_any, len(positions))):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best / per
+    print(f"{backend}: {len(positions)} positions, {queries} square queries", file=out)
+    for query in ("moves_from", "any legal"):
+        eager, lazy = results[f"{query} eager"], results[f"{query} lazy"]
+        print(f"{query:<11} eager {eager * 1e6:8.1f} us  lazy {lazy * 1e6:8.1f} us  speedup {eager / lazy:5.2f}x", file=out)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.perft", description="Count move-generation leaf nodes.")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--suite", action="store_true", help="check the standard positions against published counts")
+    parser.add_argument("--max-depth", type=int, default=5, help="deepest depth checked by --suite")
+    parser.add_argument("--max-nodes", type=int, default=5_000_000, help="skip --suite entries larger than this")
+    parser.add_argument("--cache", type=int, default=0, metavar="SIZE", help="cache legal moves of up to SIZE positions")
+    parser.add_argument("--queries", type=int, default=0, metavar="COUNT",
+                        help="time moves_from() and has_legal_moves() against the full legal list on COUNT positions")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        return 0 if run_suite(args.backend, args.max_depth, args.max_nodes) else 1
+    if args.queries:
+        benchmark_queries(args.backend, args.queries)
+        return 0
+
+    cache = LRUCache(args.cache) if args.cache else None
+    position = create_position(args.fen, args.backend, cache)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(position, args.depth)
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(position, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"nodes {nodes}  time {elapsed:.3f}s  nps {nodes / elapsed if elapsed > 0 else 0:.0f}")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"cache hits {stats.hits}  misses {stats.misses}  evictions {stats.evictions}  size {stats.size}/{stats.capacity}  hit rate {cache.hit_rate():.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
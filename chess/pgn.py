@@ -0,0 +1,380 @@
+import argparse
+import re
+import sys
+import time
+from collections import namedtuple
+
+from chess.bitboard import (BISHOP, CAPTURE, DOUBLE_PUSH, EP_CAPTURE, KING, KING_ATTACKS, KING_CASTLE, KNIGHT,
+                            KNIGHT_ATTACKS, PAWN, PAWN_ATTACKS, PROMOTION, QUEEN, QUEEN_CASTLE, QUIET, ROOK, SQUARES,
+                            WHITE, BitboardPosition, bishop_attacks, iter_bits, rook_attacks)
+from chess.engine import STARTING_FEN, fen_decoder, square_name
+
+# Games are read as (headers, SAN moves, result) without touching the move
+# generator; replay() resolves the SAN against a BitboardPosition only when
+# positions are wanted. Readers take any iterable of lines, so an open file is
+# streamed one line at a time and memory only grows with the current game.
+
+Game = namedtuple("Game", ["headers", "moves", "result"])
+EpdRecord = namedtuple("EpdRecord", ["fen", "operations"])
+
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+SAN_PIECES = {"N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+SAN_LETTERS = {piece: letter for letter, piece in SAN_PIECES.items()}
+FILES = "abcdefgh"
+SEVEN_TAG_ROSTER = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TOKEN = re.compile(r'[{};()]|[^\s{};()]+')
+# A move number: "12.", "12..." or a bare "12". Castling written with
+# zeros ("0-0") starts with a digit too and must survive.
+_MOVE_NUMBER = re.compile(r'\d+(?:\.+|$)')
+_EPD_OPERATION = re.compile(r'\s*([A-Za-z]\w*)\s*((?:"[^"]*"|[^;"])*);')
+
+def move_from_san(position, san) -> int:
+    # Only the pieces that can reach the target square are tried, with one
+    # make/unmake each to reject moves that leave the king in check, instead
+    # of generating every legal move for each ply of a replayed game.
+    text = san.rstrip("+#!?")
+    us = position.side
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        castle = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+        for move in position.generate_legal():
+            if move >> 12 == castle:
+                return move
+        raise ValueError(f"Illegal SAN move {san!r} in {position.fen()}")
+
+    try:
+        promotion = None
+        if "=" in text:
+            text, letter = text.split("=")
+            promotion = SAN_PIECES[letter.upper()]
+        elif text[-1] in "NBRQ" and len(text) > 2 and text[-2].isdigit():
+            text, promotion = text[:-1], SAN_PIECES[text[-1]]
+        piece = SAN_PIECES.get(text[0], PAWN)
+        if piece != PAWN:
+            text = text[1:]
+        to_sq = (8 - int(text[-1])) * 8 + FILES.index(text[-2])
+        hint = text[:-2].replace("x", "").replace("-", "")
+        from_file = FILES.index(hint[0]) if hint and hint[0] in FILES else None
+        from_rank = 8 - int(hint[-1]) if hint and hint[-1].isdigit() else None
+    except (IndexError, KeyError, ValueError):
+        raise ValueError(f"Malformed SAN move {san!r}") from None
+
+    pieces = position.pieces[us * 6 + piece]
+    occupied = position.occupancy[0] | position.occupancy[1]
+    captures = position.occupancy[us ^ 1] >> to_sq & 1
+    if position.occupancy[us] >> to_sq & 1:
+        raise ValueError(f"Illegal SAN move {san!r} in {position.fen()}")
+    if piece == PAWN:
+        forward = -8 if us == WHITE else 8
+        if from_file is not None and from_file != to_sq % 8:
+            origins = PAWN_ATTACKS[us ^ 1][to_sq] & pieces
+            flag = CAPTURE if captures else EP_CAPTURE if to_sq == position.ep_square else None
+        else:
+            single = to_sq - forward
+            if 0 <= single < 64 and pieces >> single & 1:
+                origins, flag = 1 << single, QUIET
+            elif to_sq // 8 == (4 if us == WHITE else 3) and not occupied >> single & 1 and pieces >> (single - forward) & 1:
+                origins, flag = 1 << (single - forward), DOUBLE_PUSH
+            else:
+                origins, flag = 0, None
+            if captures:
+                flag = None
+        if (promotion is not None) != (to_sq // 8 in (0, 7)):
+            flag = None
+        elif promotion is not None and flag is not None:
+            flag = (flag & CAPTURE) | PROMOTION | (promotion - KNIGHT)
+    else:
+        if piece == KNIGHT:
+            origins = KNIGHT_ATTACKS[to_sq]
+        elif piece == BISHOP:
+            origins = bishop_attacks(to_sq, occupied)
+        elif piece == ROOK:
+            origins = rook_attacks(to_sq, occupied)
+        elif piece == QUEEN:
+            origins = bishop_attacks(to_sq, occupied) | rook_attacks(to_sq, occupied)
+        else:
+            origins = KING_ATTACKS[to_sq]
+        origins &= pieces
+        flag = CAPTURE if captures else QUIET
+
+    found = None
+    if flag is not None:
+        for from_sq in iter_bits(origins):
+            if (from_file is not None and from_sq % 8 != from_file) or (from_rank is not None and from_sq // 8 != from_rank):
+                continue
+            move = from_sq | to_sq << 6 | flag << 12
+            position.make_move(move)
+            legal = not position.is_attacked(position.pieces[us * 6 + KING].bit_length() - 1, us ^ 1)
+            position.unmake_move()
+            if not legal:
+                continue
+            if found is not None:
+                raise ValueError(f"Ambiguous SAN move {san!r} in {position.fen()}")
+            found = move
+    if found is None:
+        raise ValueError(f"Illegal SAN move {san!r} in {position.fen()}")
+    return found
+
+def move_to_san(position, move, legal=None) -> str:
+    flag = move >> 12
+    if flag == KING_CASTLE:
+        san = "O-O"
+    elif flag == QUEEN_CASTLE:
+        san = "O-O-O"
+    else:
+        from_sq, to_sq = move & 63, (move >> 6) & 63
+        side = position.side
+        piece = next(piece for piece in range(6) if position.pieces[side * 6 + piece] >> from_sq & 1)
+        target = square_name(SQUARES[to_sq])
+        if piece == PAWN:
+            san = (FILES[from_sq % 8] + "x" if flag & CAPTURE else "") + target
+            if flag & PROMOTION:
+                san += "=" + SAN_LETTERS[KNIGHT + (flag & 3)]
+        else:
+            pieces = position.pieces[side * 6 + piece]
+            rivals = [other & 63 for other in (legal if legal is not None else position.generate_legal())
+                      if (other >> 6) & 63 == to_sq and other & 63 != from_sq and pieces >> (other & 63) & 1]
+            hint = ""
+            if rivals:
+                if all(sq % 8 != from_sq % 8 for sq in rivals):
+                    hint = FILES[from_sq % 8]
+                elif all(sq // 8 != from_sq // 8 for sq in rivals):
+                    hint = str(8 - from_sq // 8)
+                else:
+                    hint = square_name(SQUARES[from_sq])
+            san = SAN_LETTERS[piece] + hint + ("x" if flag & CAPTURE else "") + target
+    position.make_move(move)
+    if position.in_check():
+        san += "+" if position.generate_legal() else "#"
+    position.unmake_move()
+    return san
+
+def read_games(lines):
+    headers, moves, result = {}, [], None
+    in_comment, depth = False, 0
+    for line in lines:
+        if not in_comment and not depth:
+            stripped = line.lstrip()
+            if stripped.startswith("["):
+                if moves:
+                    yield Game(headers, moves, headers.get("Result", "*"))
+                    headers, moves = {}, []
+                match = _TAG.match(stripped)
+                if match:
+                    headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+                continue
+            if stripped.startswith("%"):
+                continue
+
+        pos = 0
+        while pos < len(line):
+            if in_comment:
+                end = line.find("}", pos)
+                if end < 0:
+                    break
+                in_comment, pos = False, end + 1
+                continue
+            match = _TOKEN.search(line, pos)
+            if match is None:
+                break
+            token, pos = match.group(), match.end()
+            if token == "{":
+                in_comment = True
+            elif token == ";":
+                break
+            elif token == "(":
+                depth += 1
+            elif token == ")":
+                depth = max(0, depth - 1)
+            elif depth or token[0] == "$":
+                continue
+            elif token in RESULTS:
+                result = token
+                yield Game(headers, moves, result)
+                headers, moves, result = {}, [], None
+            else:
+                number = _MOVE_NUMBER.match(token)
+                if number is not None:
+                    token = token[number.end():]
+                    if not token:
+                        continue
+                moves.append(token)
+    if moves or headers:
+        yield Game(headers, moves, headers.get("Result", "*"))
+
+def replay(game):
+    # Yields (position, move) before each move is played. The same position
+    # object is updated in place as iteration continues; copy() it to keep it.
+    position = BitboardPosition(game.headers.get("FEN", STARTING_FEN))
+    for san in game.moves:
+        move = move_from_san(position, san)
+        yield position, move
+        position.make_move(move)
+
+def final_position(game):
+    position = BitboardPosition(game.headers.get("FEN", STARTING_FEN))
+    for san in game.moves:
+        position.make_move(move_from_san(position, san))
+    return position
+
+def read_epd(lines):
+    # Blank lines and lines starting with # are skipped; a record without
+    # the four position fields, or with a side to move other than w or b or
+    # non-numeric hmvc/fmvn, raises ValueError naming its line number.
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(None, 4)
+        if len(fields) < 4:
+            raise ValueError(f"EPD line {number}: expected board, side, castling and en passant fields, got {line!r}")
+        if fields[1] not in ("w", "b"):
+            raise ValueError(f"EPD line {number}: side to move must be w or b, got {fields[1]!r}")
+        operations = {}
+        for name, value in _EPD_OPERATION.findall(fields[4] if len(fields) > 4 else ""):
+            operations[name] = value.strip().strip('"')
+        for name, default in (("hmvc", "0"), ("fmvn", "1")):
+            if not operations.get(name, default).isdigit():
+                raise ValueError(f"EPD line {number}: {name} must be a number, got {operations[name]!r}")
+        fen = " ".join(fields[:4]) + f" {operations.get('hmvc', 0)} {operations.get('fmvn', 1)}"
+        yield EpdRecord(fen, operations)
+
+def write_pgn(game, width=80) -> str:
+    headers = dict(game.headers)
+    headers["Result"] = game.result
+    tags = [name for name in SEVEN_TAG_ROSTER if name in headers] + [name for name in headers if name not in SEVEN_TAG_ROSTER]
+    lines = ['[{} "{}"]'.format(name, str(headers[name]).replace("\\", "\\\\").replace('"', '\\"')) for name in tags]
+    lines.append("")
+
+    board_info = fen_decoder(headers.get("FEN", STARTING_FEN))
+    number, turn = board_info["fullmove_number"], board_info["turn"]
+    tokens = []
+    for i, san in enumerate(game.moves):
+        if turn == "w":
+            tokens.append(f"{number}.")
+        elif i == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if turn == "b":
+            number += 1
+        turn = "b" if turn == "w" else "w"
+    tokens.append(game.result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > width:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def export_pgn(position, headers=None, result="*") -> str:
+    # Rebuilds the game from the position's move history: unwind a copy to
+    # the starting position, then replay it to produce SAN.
+    line = position.copy()
+    moves = [entry[0] for entry in line.history]
+    while line.history:
+        line.unmake_move()
+    tags = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?", "White": "?", "Black": "?"}
+    tags.update(headers or {})
+    start_fen = line.fen()
+    if start_fen != STARTING_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = start_fen
+    sans = []
+    for move in moves:
+        sans.append(move_to_san(line, move))
+        line.make_move(move)
+    return write_pgn(Game(tags, sans, result))
+
+def open_lines(path):
+    if path == "-":
+        yield from sys.stdin
+    else:
+        with open(path, encoding="utf-8", errors="replace") as file:
+            yield from file
+
+def benchmark(path, epd=False, limit=None, replay_moves=True, out=sys.stdout) -> None:
+    start = time.perf_counter()
+    records, plies, errors = 0, 0, 0
+    if epd:
+        for record in read_epd(open_lines(path)):
+            if replay_moves:
+                BitboardPosition(record.fen)
+            records += 1
+            if limit is not None and records >= limit:
+                break
+    else:
+        for game in read_games(open_lines(path)):
+            if replay_moves:
+                try:
+                    for _ in replay(game):
+                        plies += 1
+                except ValueError:
+                    errors += 1
+            else:
+                plies += len(game.moves)
+            records += 1
+            if limit is not None and records >= limit:
+                break
+    elapsed = time.perf_counter() - start
+    kind = "positions" if epd else "games"
+    print(f"{records} {kind}, {plies} plies, {errors} errors in {elapsed:.3f}s: "
+          f"{records / elapsed if elapsed > 0 else 0:.1f} {kind}/s, {plies / elapsed if elapsed > 0 else 0:.0f} plies/s", file=out)
+
+# Movetext and the final FEN python-chess 1.11.2 reaches for it, covering
+# castling written with zeros, move numbers glued to moves, comments and
+# variations.
+KNOWN_GAMES = [
+    ("1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. 0-0 Nf6 5. d3 0-0 *",
+     "r1bq1rk1/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQ1RK1 w - - 1 6"),
+    ("1.d4 d5 2.Nc3 Nc6 3.Bf4 Bf5 4.Qd2 Qd7 5.0-0-0 5...0-0-0 6. e3 *",
+     "2kr1bnr/pppqpppp/2n5/3p1b2/3P1B2/2N1P3/PPPQ1PPP/2KR1BNR b - - 0 6"),
+    ("1. e4 {0-0 in a comment} 1... c5 2. Nf3 (2. Nc3 Nc6 3. f4) 2... d6 3. Bb5+ Bd7 4. O-O 1-0",
+     "rn1qkbnr/pp1bpppp/3p4/1Bp5/4P3/5N2/PPPP1PPP/RNBQ1RK1 b kq - 3 4"),
+]
+
+def check_games(out=sys.stdout) -> bool:
+    passed = True
+    for movetext, expected in KNOWN_GAMES:
+        try:
+            fen = final_position(next(read_games([movetext]))).fen()
+        except ValueError as error:
+            fen = f"error: {error}"
+        ok = fen == expected
+        passed = passed and ok
+        print(f"{'ok' if ok else 'FAIL'}  {movetext}" + ("" if ok else f"\n      got {fen}\n expected {expected}"), file=out)
+    print("all games replay" if passed else "MISMATCH against expected positions", file=out)
+    return passed
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.pgn", description="Stream a PGN or EPD file and report parse throughput.")
+    parser.add_argument("path", nargs="?", help="PGN or EPD file, - for stdin")
+    parser.add_argument("--epd", action="store_true", help="read EPD records instead of PGN games")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many games or positions")
+    parser.add_argument("--no-replay", action="store_true", help="only tokenise, do not resolve SAN moves")
+    parser.add_argument("--memory", action="store_true", help="report peak traced memory (slows parsing down)")
+    parser.add_argument("--check", action="store_true", help="replay built-in games against known final positions")
+    args = parser.parse_args(argv)
+    if args.check:
+        return 0 if check_games() else 1
+    if args.path is None:
+        parser.error("give a PGN or EPD path, or --check")
+
+    if args.memory:
+        import tracemalloc
+        tracemalloc.start()
+    try:
+        benchmark(args.path, args.epd, args.limit, not args.no_replay)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        print(f"peak memory {peak / 1024:.0f} KiB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
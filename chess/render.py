@@ -0,0 +1,216 @@
+import time
+
+import pygame
+
+LIGHT_SQUARE = (233, 236, 239)
+DARK_SQUARE = (125, 135, 150)
+OVERLAY_COLOR = (255, 255, 255)
+OVERLAY_BACKGROUND = (0, 0, 0)
+
+# Sprite offsets in the piece table are given in pixels for 100 pixel squares.
+BASE_SQUARE_SIZE = 100
+
+def draw_highlighted_rect(surface, rect, border_color, highlight_color, border_thickness, highlight_thickness):
+    pygame.draw.rect(surface, border_color, rect, border_thickness)
+    inner_rect = pygame.Rect(rect.left + border_thickness, rect.top + border_thickness,rect.width - 2 * border_thickness, rect.height - 2 * border_thickness)
+    pygame.draw.rect(surface, highlight_color, inner_rect, highlight_thickness)
+
+def scale_pieces(chess_pieces, square_size):
+    # Convert and scale every sprite once; blitting a cached surface is far
+    # cheaper than convert_alpha() plus transform.scale() per piece per frame.
+    sprites, offsets = {}, {}
+    for name, (surface, offset) in chess_pieces.items():
+        sprites[name] = pygame.transform.scale(surface.convert_alpha(), (square_size, square_size))
+        offsets[name] = (offset[0] * square_size // BASE_SQUARE_SIZE, offset[1] * square_size // BASE_SQUARE_SIZE)
+    return sprites, offsets
+
+def draw_background(square_size, colors=(DARK_SQUARE, LIGHT_SQUARE)):
+    background = pygame.Surface((square_size * 8, square_size * 8)).convert()
+    for x in range(8):
+        for y in range(8):
+            color = colors[0] if (x - y) % 2 == 0 else colors[1]
+            pygame.draw.rect(background, color, pygame.Rect(x * square_size, y * square_size, square_size, square_size))
+    return background
+
+class FrameStats:
+    # Rolling frame counter for the overlay: passes through the render call
+    # per second, how many of them actually drew something, the time spent
+    # rendering a frame, the share of the screen pushed to the display and the
+    # process CPU time as a share of wall time.
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.created = self.started = time.perf_counter()
+        self.cpu_created = self.cpu_started = time.process_time()
+        self.frames = 0
+        self.drawn = 0
+        self.render_time = 0.0
+        self.updated_pixels = 0
+        self.fps = 0.0
+        self.drawn_fps = 0.0
+        self.frame_ms = 0.0
+        self.updated_share = 0.0
+        self.cpu_share = 0.0
+        self.total_frames = 0
+        self.total_drawn = 0
+
+    def record(self, render_time, updated_pixels, screen_pixels) -> bool:
+        self.frames += 1
+        self.total_frames += 1
+        if updated_pixels:
+            self.drawn += 1
+            self.total_drawn += 1
+        self.render_time += render_time
+        self.updated_pixels += updated_pixels
+        now = time.perf_counter()
+        elapsed = now - self.started
+        if elapsed < self.interval:
+            return False
+        cpu_now = time.process_time()
+        self.fps = self.frames / elapsed
+        self.drawn_fps = self.drawn / elapsed
+        self.frame_ms = self.render_time / self.frames * 1000
+        self.updated_share = self.updated_pixels / (screen_pixels * self.frames)
+        self.cpu_share = (cpu_now - self.cpu_started) / elapsed
+        self.started, self.cpu_started = now, cpu_now
+        self.frames, self.drawn, self.render_time, self.updated_pixels = 0, 0, 0.0, 0
+        return True
+
+    def text(self) -> str:
+        return (f"{self.fps:5.1f} fps  {self.drawn_fps:5.1f} drawn/s  {self.frame_ms:5.2f} ms/frame  "
+                f"{self.updated_share * 100:5.1f}% updated  cpu {self.cpu_share * 100:4.1f}%")
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.created
+        cpu = time.process_time() - self.cpu_created
+        return (f"{self.total_frames} frames, {self.total_drawn} drawn in {elapsed:.1f}s; "
+                f"cpu {cpu:.2f}s ({cpu / elapsed * 100 if elapsed > 0 else 0:.1f}% of one core)")
+
+class BoardRenderer:
+    # Sprites come from a chess.atlas.PieceAtlas when one is given, already
+    # scaled for each square size; otherwise chess_pieces, the table of
+    # [surface, offset] by piece name, is scaled here for every size used.
+    def __init__(self, screen, chess_pieces, square_size=BASE_SQUARE_SIZE, border_color=(255, 255, 255),
+                 highlight_color=(80, 80, 80), border_thickness=1, highlight_thickness=5, show_stats=False, atlas=None):
+        self.chess_pieces = chess_pieces
+        self.atlas = atlas
+        self.border_color = border_color
+        self.highlight_color = highlight_color
+        self.border_thickness = border_thickness
+        self.highlight_thickness = highlight_thickness
+        self.set_square_size(square_size, screen)
+        self.show_stats = show_stats
+        self.stats = FrameStats()
+        self.font = None
+        self.stats_surface = None
+        self.stats_rect = None
+
+    def set_square_size(self, square_size, screen=None) -> None:
+        # Also used at runtime, with the new display surface when the window
+        # was resized for the new size; the next frame is a full redraw.
+        if screen is not None:
+            self.screen = screen
+            self.screen_rect = screen.get_rect()
+        self.square_size = square_size
+        if self.atlas is not None:
+            self.sprites, self.offsets = self.atlas.sprites(square_size)
+        else:
+            self.sprites, self.offsets = scale_pieces(self.chess_pieces, square_size)
+        self.background = draw_background(square_size)
+        # Sprites may hang over the neighbouring squares by their offset, so
+        # a changed square repaints this much extra on each side.
+        self.margin = max((max(abs(dx), abs(dy)) for dx, dy in self.offsets.values()), default=0)
+        self.drawn_board = {}
+        self.overlay_rects = []
+        self.full_redraw = True
+
+    def invalidate(self) -> None:
+        self.full_redraw = True
+
+    def toggle_stats(self) -> None:
+        self.show_stats = not self.show_stats
+        self.full_redraw = True
+
+    def square_area(self, square):
+        size = self.square_size
+        area = pygame.Rect(square[0] * size - self.margin, square[1] * size - self.margin, size + 2 * self.margin, size + 2 * self.margin)
+        return area.clip(self.screen_rect)
+
+    def blit_piece(self, board, square) -> None:
+        name = board[square]
+        offset = self.offsets[name]
+        self.screen.blit(self.sprites[name], (square[0] * self.square_size + offset[0], square[1] * self.square_size + offset[1]))
+
+    def restore(self, area, board) -> None:
+        # Repaint one area from the cached background, then every piece whose
+        # sprite can reach into it, clipped so nothing outside is touched.
+        self.screen.set_clip(area)
+        self.screen.blit(self.background, area.topleft, area)
+        size = self.square_size
+        left, right = max(0, (area.left - self.margin) // size), min(7, (area.right + self.margin) // size)
+        top, bottom = max(0, (area.top - self.margin) // size), min(7, (area.bottom + self.margin) // size)
+        for y in range(top, bottom + 1):
+            for x in range(left, right + 1):
+                if (x, y) in board:
+                    self.blit_piece(board, (x, y))
+        self.screen.set_clip(None)
+
+    def render(self, board, hover_rect=None, dragged_piece=None, mouse_pos=None) -> list:
+        start = time.perf_counter()
+        # The overlay text only changes when FrameStats rolls over its interval.
+        stats_changed = self.show_stats and (self.stats_rect is None or self.stats.frames == 0)
+        overlay_rects = []
+        if hover_rect is not None:
+            overlay_rects.append(pygame.Rect(hover_rect))
+        if dragged_piece is not None:
+            overlay_rects.append(pygame.Rect(mouse_pos, (self.square_size, self.square_size)).clip(self.screen_rect))
+
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+            for square in board:
+                self.blit_piece(board, square)
+            dirty = [self.screen_rect.copy()]
+            self.full_redraw = False
+        else:
+            dirty = [self.square_area(square) for square in board.keys() | self.drawn_board.keys()
+                     if board.get(square) != self.drawn_board.get(square)]
+            if overlay_rects != self.overlay_rects:
+                dirty.extend(self.overlay_rects)
+            if stats_changed and self.stats_rect is not None:
+                dirty.append(self.stats_rect)
+            for area in dirty:
+                self.restore(area, board)
+        self.drawn_board = dict(board)
+
+        # Overlays are drawn last; they are redrawn whenever they moved or
+        # anything underneath them was repainted this frame.
+        if overlay_rects != self.overlay_rects or any(rect.collidelist(dirty) != -1 for rect in overlay_rects):
+            if hover_rect is not None:
+                draw_highlighted_rect(self.screen, overlay_rects[0], self.border_color, self.highlight_color,
+                                      self.border_thickness, self.highlight_thickness)
+            if dragged_piece is not None:
+                self.screen.blit(self.sprites[dragged_piece], mouse_pos)
+            dirty.extend(overlay_rects)
+        self.overlay_rects = overlay_rects
+
+        if self.show_stats and (stats_changed or self.stats_rect.collidelist(dirty) != -1):
+            dirty.append(self.draw_stats())
+
+        if dirty:
+            pygame.display.update(dirty)
+        self.stats.record(time.perf_counter() - start, sum(rect.width * rect.height for rect in dirty),
+                          self.screen_rect.width * self.screen_rect.height)
+        return dirty
+
+    def draw_stats(self):
+        if self.font is None:
+            # The game only initialises the display; fonts start with the
+            # first overlay.
+            if not pygame.font.get_init():
+                pygame.font.init()
+            self.font = pygame.font.SysFont(None, 22)
+        if self.stats_surface is None or self.stats.frames == 0:
+            self.stats_surface = self.font.render(self.stats.text(), True, OVERLAY_COLOR, OVERLAY_BACKGROUND)
+        area = self.stats_surface.get_rect(topleft=(4, 4)).clip(self.screen_rect)
+        self.screen.blit(self.stats_surface, area.topleft)
+        self.stats_rect = area
+        return area
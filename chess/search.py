@@ -0,0 +1,375 @@
+import argparse
+import ctypes
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import RawArray
+
+from chess.bitboard import CAPTURE, EP_CAPTURE, KNIGHT, PAWN, PROMOTION, QUEEN, BitboardPosition
+from chess.engine import STARTING_FEN, move_to_uci
+from chess.evaluate import PIECE_VALUES, evaluate
+
+INFINITY = 1_000_000
+MATE = 100_000
+MATE_BOUND = MATE - 1000
+MAX_PLY = 128
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+SearchResult = namedtuple("SearchResult", ["best_move", "score", "depth", "nodes", "time", "nps", "pv"])
+
+class SearchAborted(Exception):
+    pass
+
+class TranspositionTable:
+    # Fixed number of slots indexed by the low bits of the Zobrist key. A slot
+    # is replaced when it is empty, holds the same position, was written by an
+    # earlier search, or was searched no deeper than the new entry.
+    def __init__(self, size=1 << 18):
+        self.size = 1 << (size - 1).bit_length()
+        self.mask = self.size - 1
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def clear(self) -> None:
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size
+
+    def new_search(self) -> None:
+        self.generation += 1
+
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] == key:
+            return self.entries[index]
+        return None
+
+    def store(self, key, depth, score, flag, move) -> None:
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or self.keys[index] == key or entry[4] != self.generation or depth >= entry[0]:
+            self.keys[index] = key
+            self.entries[index] = (depth, score, flag, move, self.generation)
+
+    def usage(self) -> float:
+        return sum(1 for entry in self.entries if entry is not None and entry[4] == self.generation) / self.size
+
+# Packed layout of a shared entry, low bits first: score + SCORE_OFFSET (24
+# bits), depth (8), flag (8), generation (8), move (16).
+SCORE_OFFSET = 1 << 23
+
+def shared_table(size=1 << 18):
+    # Zeroed shared memory for a SharedTranspositionTable of size slots,
+    # to be handed to worker processes when they start.
+    return RawArray("Q", 2 << (size - 1).bit_length())
+
+class SharedTranspositionTable(TranspositionTable):
+    # The same table in memory shared between processes, so workers
+    # searching one position (Lazy SMP) use each other's results. A slot is
+    # two 64-bit words, the key XORed with the packed entry and the entry;
+    # a slot two processes wrote at once fails the key check and reads as
+    # empty, so no lock is needed.
+    def __init__(self, table):
+        self.table = table
+        self.words = memoryview(table).cast("B").cast("Q")
+        self.size = len(self.words) // 2
+        self.mask = self.size - 1
+        self.generation = 0
+
+    def clear(self) -> None:
+        ctypes.memset(self.table, 0, ctypes.sizeof(self.table))
+
+    def probe(self, key):
+        index = (key & self.mask) * 2
+        data = self.words[index + 1]
+        if not data or self.words[index] ^ data != key:
+            return None
+        return ((data >> 24) & 0xFF, (data & 0xFFFFFF) - SCORE_OFFSET, (data >> 32) & 0xFF, data >> 48, (data >> 40) & 0xFF)
+
+    def store(self, key, depth, score, flag, move) -> None:
+        index = (key & self.mask) * 2
+        words = self.words
+        old = words[index + 1]
+        if (old and words[index] ^ old != key and (old >> 40) & 0xFF == self.generation
+                and depth < (old >> 24) & 0xFF):
+            return
+        data = (score + SCORE_OFFSET) | depth << 24 | flag << 32 | self.generation << 40 | move << 48
+        words[index] = key ^ data
+        words[index + 1] = data
+
+    def new_search(self) -> None:
+        self.generation = (self.generation + 1) & 0xFF
+
+    def usage(self) -> float:
+        words = self.words
+        return sum(1 for index in range(1, 2 * self.size, 2)
+                   if words[index] and (words[index] >> 40) & 0xFF == self.generation) / self.size
+
+def score_to_tt(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+class Searcher:
+    # With staged=False every node generates and orders all its legal moves
+    # up front, as a baseline for the staged move picker.
+    # tt replaces the private table, e.g. with a SharedTranspositionTable.
+    def __init__(self, tt_size=1 << 18, staged=True, tt=None):
+        self.tt = tt if tt is not None else TranspositionTable(tt_size)
+        self.staged = staged
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(64)]
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = None
+        self.max_nodes = None
+        self.root_moves = None
+
+    def clear(self) -> None:
+        # Forgets everything learned from earlier searches, as for a new game.
+        self.tt.clear()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(64)]
+
+    def stop(self) -> None:
+        self.stopped = True
+
+    def check_limits(self) -> None:
+        if self.stopped or (self.max_nodes is not None and self.nodes >= self.max_nodes) or \
+           (self.deadline is not None and time.perf_counter() >= self.deadline):
+            self.stopped = True
+            raise SearchAborted
+
+    def order_moves(self, position, moves, tt_move, ply) -> list:
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for move in moves:
+            flag = move >> 12
+            if move == tt_move:
+                score = 10_000_000
+            elif flag & CAPTURE:
+                victim = PAWN if flag == EP_CAPTURE else position.piece_at((move >> 6) & 63) % 6
+                attacker = position.piece_at(move & 63) % 6
+                score = 1_000_000 + PIECE_VALUES[victim] * 10 - attacker
+                if flag & PROMOTION:
+                    score += PIECE_VALUES[1 + (flag & 3)]
+            elif flag & PROMOTION:
+                score = 900_000 + PIECE_VALUES[1 + (flag & 3)]
+            elif move == killers[0]:
+                score = 800_000
+            elif move == killers[1]:
+                score = 790_000
+            else:
+                score = history[move & 63][(move >> 6) & 63]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def pick_moves(self, position, tt_move, ply):
+        # Yields the legal moves in search order one stage at a time: the
+        # hash move, captures and promotions by MVV-LVA, the killers, then
+        # the remaining quiet moves by history. A stage is only generated
+        # once the earlier ones failed to cut off, and the hash move and
+        # killers are checked for legality on their own square first.
+        check_info = position.check_info()
+        if tt_move and position.is_legal(tt_move, check_info):
+            yield tt_move
+        else:
+            tt_move = 0
+        noisy = position.generate_legal_subset(quiet=False, check_info=check_info)
+        yield from self.order_moves(position, [move for move in noisy if move != tt_move], 0, ply)
+        killers = [move for move in self.killers[ply]
+                   if move and move != tt_move and not (move >> 12) & (CAPTURE | PROMOTION) and position.is_legal(move, check_info)]
+        yield from killers
+        quiets = position.generate_legal_subset(noisy=False, check_info=check_info)
+        yield from self.order_moves(position, [move for move in quiets if move != tt_move and move not in killers], 0, ply)
+
+    def quiescence(self, position, alpha, beta, ply) -> int:
+        self.nodes += 1
+        if not self.nodes & 255:
+            self.check_limits()
+
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = [move for move in position.generate_legal_subset(quiet=False)
+                    if (move >> 12) & CAPTURE or (move >> 12) == PROMOTION | (QUEEN - KNIGHT)]
+        for move in self.order_moves(position, captures, 0, ply):
+            position.make_move(move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def negamax(self, position, depth, alpha, beta, ply) -> int:
+        self.nodes += 1
+        if not self.nodes & 255:
+            self.check_limits()
+
+        # Inside the tree the first repetition already scores as a draw:
+        # whoever could avoid it would have, so repeating is as good as the
+        # threefold claim and the line needs no further search.
+        if ply and (position.halfmove_clock >= 100 or position.repetitions[position.key] > 1):
+            return 0
+        in_check = position.in_check()
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiescence(position, alpha, beta, ply)
+
+        original_alpha = alpha
+        tt_move = 0
+        entry = self.tt.probe(position.key)
+        if entry is not None:
+            tt_depth, tt_score, tt_flag, tt_move, _ = entry
+            if ply and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if tt_flag == EXACT:
+                    return tt_score
+                if tt_flag == LOWER and tt_score > alpha:
+                    alpha = tt_score
+                elif tt_flag == UPPER and tt_score < beta:
+                    beta = tt_score
+                if alpha >= beta:
+                    return tt_score
+
+        best_score, best_move, legal = -INFINITY, 0, 0
+        if self.staged:
+            moves = self.pick_moves(position, tt_move, ply)
+        else:
+            moves = self.order_moves(position, position.generate_legal(), tt_move, ply)
+        for move in moves:
+            legal += 1
+            if not ply and self.root_moves is not None and move not in self.root_moves:
+                continue
+            position.make_move(move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not (move >> 12) & CAPTURE:
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1], killers[0] = killers[0], move
+                            self.history[move & 63][(move >> 6) & 63] += depth * depth
+                        break
+
+        if not legal:
+            return -MATE + ply if in_check else 0
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(position.key, depth, score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def principal_variation(self, position, max_length) -> list:
+        pv = []
+        seen = set()
+        while len(pv) < max_length and position.key not in seen:
+            seen.add(position.key)
+            entry = self.tt.probe(position.key)
+            if entry is None or not position.is_legal(entry[3]):
+                break
+            pv.append(entry[3])
+            position.make_move(entry[3])
+        for _ in pv:
+            position.unmake_move()
+        return pv
+
+    def search(self, position, max_depth=MAX_PLY - 1, movetime=None, max_nodes=None, info=None, root_moves=None) -> SearchResult:
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + movetime / 1000 if movetime is not None else None
+        self.max_nodes = max_nodes
+        self.root_moves = root_moves
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.tt.new_search()
+        root_ply = len(position.history)
+
+        moves = position.generate_legal()
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+        best_move, best_score, completed_depth, pv = (moves[0] if moves else 0), 0, 0, []
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.negamax(position, depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                while len(position.history) > root_ply:
+                    position.unmake_move()
+                break
+            completed_depth, best_score = depth, score
+            pv = self.principal_variation(position, depth)
+            if pv:
+                best_move = pv[0]
+            if info is not None:
+                elapsed = time.perf_counter() - start
+                info(depth, score, self.nodes, elapsed, self.public_line(position, pv))
+            if not moves or abs(score) > MATE_BOUND:
+                break
+
+        # A stop() that arrives before the search starts still aborts it; the
+        # flag is only cleared once the search has finished.
+        self.stopped = False
+        elapsed = time.perf_counter() - start
+        return SearchResult(position.to_move(best_move) if best_move else None, best_score, completed_depth,
+                            self.nodes, elapsed, self.nodes / elapsed if elapsed > 0 else 0.0,
+                            self.public_line(position, pv))
+
+    def public_line(self, position, pv) -> list:
+        line = []
+        for move in pv:
+            line.append(position.to_move(move))
+            position.make_move(move)
+        for _ in pv:
+            position.unmake_move()
+        return line
+
+def analyse(fen, depth=None, movetime=None, nodes=None, tt_size=1 << 18) -> SearchResult:
+    searcher = Searcher(tt_size)
+    return searcher.search(BitboardPosition(fen), depth or MAX_PLY - 1, movetime, nodes)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.search", description="Search a position and report speed.")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--movetime", type=int, default=None, help="time budget in milliseconds")
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--eager", action="store_true", help="order all legal moves up front instead of in stages")
+    args = parser.parse_args(argv)
+    if args.depth is None and args.movetime is None and args.nodes is None:
+        args.movetime = 5000
+
+    def info(depth, score, nodes, elapsed, pv):
+        print(f"depth {depth:>2}  score {score:>6}  nodes {nodes:>9}  time {elapsed:7.3f}s  nps {nodes / elapsed if elapsed > 0 else 0:8.0f}  pv {' '.join(move_to_uci(move) for move in pv)}")
+
+    position = BitboardPosition(args.fen)
+    result = Searcher(staged=not args.eager).search(position, args.depth or MAX_PLY - 1, args.movetime, args.nodes, info)
+    best = move_to_uci(result.best_move) if result.best_move is not None else "(none)"
+    print(f"bestmove {best}  depth {result.depth}  nodes {result.nodes}  time {result.time:.3f}s  nps {result.nps:.0f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from chess.bitboard import WHITE
+from chess.engine import STARTING_FEN
+from chess.game import Game, validate_fen
+from chess.packed import HEADER, HEADER_SIZE, pack_position, unpack_fen
+from chess.search import MATE, MATE_BOUND, MAX_PLY, Searcher
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Self-play samples are 40 little-endian bytes: a 32 byte chess.packed
+# position record followed by
+#   32-33  search score for the side to move in centipawns; mates are
+#          stored as +-(SCORE_LIMIT - plies to mate)
+#   34-35  the move the search chose, as a 16-bit bitboard move
+#   36     game result for the side to move: 1 win, 0 draw, -1 loss
+#   37     how the game ended, an index into TERMINATIONS
+#   38-39  reserved, zero
+# The file starts with the same 32 byte header as a position database, with
+# its own magic. Samples of a game are written together once it has ended,
+# since the result is not known before.
+
+SAMPLE = struct.Struct("<32shHbB2x")
+SAMPLE_SIZE = SAMPLE.size
+MAGIC = b"SELFPLAY"
+VERSION = 1
+SCORE_LIMIT = 32000
+TERMINATIONS = ["adjudicated", "checkmate", "stalemate", "insufficient_material", "seventyfive_moves",
+                "fivefold_repetition", "fifty_moves", "threefold_repetition"]
+RESULT_VALUES = {"1-0": 1, "0-1": -1, "1/2-1/2": 0}
+
+Sample = namedtuple("Sample", ["fen", "score", "move", "result", "termination"])
+GameRecord = namedtuple("GameRecord", ["index", "data", "plies", "samples", "nodes", "result", "termination"])
+
+if np is not None:
+    from chess.packed import RECORD_DTYPE
+    SAMPLE_DTYPE = np.dtype([("position", RECORD_DTYPE), ("score", "<i2"), ("move", "<u2"), ("result", "i1"),
+                             ("termination", "u1"), ("reserved", "u1", (2,))])
+
+def clamp_score(score) -> int:
+    if score > MATE_BOUND:
+        return SCORE_LIMIT - (MATE - score)
+    if score < -MATE_BOUND:
+        return -SCORE_LIMIT + (MATE + score)
+    return max(-(SCORE_LIMIT - 1000), min(SCORE_LIMIT - 1000, score))
+
+# Each worker process keeps one Searcher with a fixed size transposition
+# table and plays one game at a time, so its memory is bounded by the table
+# and the samples of the game in progress (at most max_plies of them).
+_searcher = None
+
+def _init_worker(tt_size):
+    global _searcher
+    _searcher = Searcher(tt_size)
+
+def play_game(index, fen, seed, depth, nodes, movetime, random_plies, max_plies) -> GameRecord:
+    # The first random_plies moves are random so games from the same opening
+    # differ; the rest are the engine's choice and are recorded. Draws that
+    # could be claimed end the game at once. The searcher starts each game
+    # fresh, so a game depends only on its index and the settings.
+    rng = random.Random(seed * 1_000_003 + index)
+    game = Game(fen, claim_draws=True)
+    position = game.position
+    _searcher.clear()
+    samples = []
+    total_nodes = 0
+    while not game.is_over and len(game.moves) < max_plies:
+        if len(game.moves) < random_plies:
+            game.push(position.to_move(rng.choice(game.legal)))
+            continue
+        result = _searcher.search(position, depth or MAX_PLY - 1, movetime, nodes)
+        total_nodes += result.nodes
+        samples.append((pack_position(position), clamp_score(result.score), position.encode_move(result.best_move), position.side))
+        game.push(result.best_move)
+
+    termination = game.outcome.termination if game.outcome is not None else "adjudicated"
+    white_result = RESULT_VALUES.get(game.result, 0)
+    code = TERMINATIONS.index(termination)
+    data = b"".join(SAMPLE.pack(record, score, move, white_result if side == WHITE else -white_result, code)
+                    for record, score, move, side in samples)
+    return GameRecord(index, data, len(game.moves), len(samples), total_nodes,
+                      game.result if game.outcome is not None else "1/2-1/2", termination)
+
+def read_openings(path) -> list:
+    # One FEN per line; blank lines and lines starting with # are skipped.
+    # Every line is checked here, so a bad opening stops the run before it
+    # starts instead of failing later inside a worker.
+    openings = []
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            fen = line.strip()
+            if not fen or fen.startswith("#"):
+                continue
+            try:
+                validate_fen(fen)
+            except ValueError as error:
+                raise ValueError(f"{path}:{number}: {error}") from None
+            openings.append(fen)
+    if not openings:
+        raise ValueError(f"{path} has no opening positions")
+    return openings
+
+class Checkpoint:
+    # Written next to the output as OUTPUT.checkpoint after samples are
+    # flushed to disk. It records the settings, the size of the sample file
+    # and which games are complete: every game below done_below plus those in
+    # done. On resume the file is cut back to that size, which drops any
+    # samples written after the checkpoint, and completed games are skipped;
+    # the number of games may be raised to extend a finished run.
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.done_below = 0
+        self.done = set()
+        self.size = HEADER_SIZE
+        self.totals = {"samples": 0, "plies": 0, "nodes": 0, "elapsed_s": 0.0, "terminations": {}}
+
+    @classmethod
+    def load(cls, path, settings):
+        with open(path) as file:
+            try:
+                data = json.load(file)
+                saved_settings = data["settings"]
+                checkpoint = cls(path, settings)
+                checkpoint.done_below, checkpoint.done = data["done_below"], set(data["done"])
+                checkpoint.size, checkpoint.totals = data["size"], data["totals"]
+                samples = checkpoint.totals["samples"]
+            except (ValueError, KeyError, TypeError) as error:
+                raise ValueError(f"{path} is not a self-play checkpoint: {error}") from error
+        if saved_settings != settings:
+            raise ValueError(f"{path} was written with different settings: {saved_settings}")
+        if checkpoint.size != HEADER_SIZE + samples * SAMPLE_SIZE:
+            raise ValueError(f"{path} records {samples} samples but a file size of {checkpoint.size} bytes")
+        return checkpoint
+
+    def open_output(self, output):
+        # Opens the sample file of a resumed run at the end of the last
+        # checkpointed sample. Samples written after the checkpoint are cut
+        # off; a missing or shorter file means checkpointed samples are
+        # gone, and the run cannot continue from it.
+        try:
+            file = open(output, "r+b")
+        except FileNotFoundError:
+            raise ValueError(f"{output} is missing; {self.path} cannot be resumed without it") from None
+        size = os.fstat(file.fileno()).st_size
+        header = file.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE or HEADER.unpack(header) != (MAGIC, VERSION, SAMPLE_SIZE):
+            file.close()
+            raise ValueError(f"{output} is not a version {VERSION} self-play file")
+        if size < self.size:
+            file.close()
+            raise ValueError(f"{output} has {size} bytes but {self.path} recorded {self.size}; "
+                             f"{(self.size - size + SAMPLE_SIZE - 1) // SAMPLE_SIZE} checkpointed samples are missing")
+        file.truncate(self.size)
+        file.seek(self.size)
+        return file
+
+    def is_done(self, index) -> bool:
+        return index < self.done_below or index in self.done
+
+    def complete(self, index) -> None:
+        self.done.add(index)
+        while self.done_below in self.done:
+            self.done.remove(self.done_below)
+            self.done_below += 1
+
+    @property
+    def games(self) -> int:
+        return self.done_below + len(self.done)
+
+    def save(self) -> None:
+        data = {"settings": self.settings, "done_below": self.done_below, "done": sorted(self.done),
+                "size": self.size, "totals": self.totals}
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+def _report(checkpoint, session_games, session_samples, session_nodes, elapsed, total_games, out) -> None:
+    rate = session_games / elapsed if elapsed > 0 else 0.0
+    remaining = total_games - checkpoint.games
+    eta = f"{remaining / rate / 60:.1f} min" if rate > 0 else "?"
+    print(f"games {checkpoint.games}/{total_games}  {rate * 3600:9.0f} games/hour  "
+          f"{session_samples / elapsed if elapsed > 0 else 0:8.1f} positions/s  "
+          f"{session_nodes / elapsed if elapsed > 0 else 0:9.0f} nodes/s  "
+          f"samples {checkpoint.totals['samples']}  eta {eta}", file=out, flush=True)
+
+def run_selfplay(output, games, openings=(STARTING_FEN,), workers=None, depth=None, nodes=None, movetime=None,
+                 random_plies=8, max_plies=300, seed=1, tt_size=1 << 16, resume=False, checkpoint_every=30.0,
+                 report_every=10.0, out=sys.stderr) -> Checkpoint:
+    workers = workers or os.cpu_count() or 1
+    openings = list(openings)
+    for number, fen in enumerate(openings, 1):
+        try:
+            validate_fen(fen)
+        except ValueError as error:
+            raise ValueError(f"opening {number}: {error}") from None
+    settings = {"depth": depth, "nodes": nodes, "movetime": movetime, "random_plies": random_plies,
+                "max_plies": max_plies, "seed": seed,
+                "openings": hashlib.sha1("\n".join(openings).encode()).hexdigest()}
+    checkpoint_path = output + ".checkpoint"
+    if os.path.exists(checkpoint_path):
+        if not resume:
+            raise ValueError(f"{checkpoint_path} exists; pass resume=True (--resume) to continue that run")
+        checkpoint = Checkpoint.load(checkpoint_path, settings)
+        file = checkpoint.open_output(output)
+    else:
+        checkpoint = Checkpoint(checkpoint_path, settings)
+        file = open(output, "wb")
+        file.write(HEADER.pack(MAGIC, VERSION, SAMPLE_SIZE))
+        checkpoint.save()
+
+    todo = (index for index in range(games) if not checkpoint.is_done(index))
+    session_games = session_samples = session_nodes = 0
+    start = last_checkpoint = last_report = time.perf_counter()
+    elapsed_before = checkpoint.totals["elapsed_s"]
+
+    def save() -> None:
+        file.flush()
+        os.fsync(file.fileno())
+        checkpoint.size = file.tell()
+        checkpoint.totals["elapsed_s"] = elapsed_before + time.perf_counter() - start
+        checkpoint.save()
+
+    try:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(tt_size,))
+        try:
+            def submit(index):
+                return executor.submit(play_game, index, openings[index % len(openings)], seed, depth, nodes, movetime,
+                                       random_plies, max_plies)
+
+            # At most two games per worker are queued or waiting to be
+            # written, whatever the number of games.
+            pending = deque(submit(index) for index in _take(todo, workers * 2))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    record = future.result()
+                    file.write(record.data)
+                    checkpoint.complete(record.index)
+                    totals = checkpoint.totals
+                    totals["samples"] += record.samples
+                    totals["plies"] += record.plies
+                    totals["nodes"] += record.nodes
+                    totals["terminations"][record.termination] = totals["terminations"].get(record.termination, 0) + 1
+                    session_games += 1
+                    session_samples += record.samples
+                    session_nodes += record.nodes
+                pending.extend(submit(index) for index in _take(todo, len(done)))
+
+                now = time.perf_counter()
+                if now - last_checkpoint >= checkpoint_every:
+                    save()
+                    last_checkpoint = now
+                if report_every and now - last_report >= report_every:
+                    _report(checkpoint, session_games, session_samples, session_nodes, now - start, games, out)
+                    last_report = now
+        except BaseException:
+            # On an interrupt, games in progress are abandoned rather than
+            # waited for; a resumed run starts from the last checkpoint.
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        save()
+    finally:
+        file.close()
+    if report_every:
+        _report(checkpoint, session_games, session_samples, session_nodes, time.perf_counter() - start, games, out)
+    return checkpoint
+
+def _take(iterator, count) -> list:
+    taken = []
+    for item in iterator:
+        taken.append(item)
+        if len(taken) == count:
+            break
+    return taken
+
+def _open_samples(path):
+    file = open(path, "rb")
+    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, sample_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or sample_size != SAMPLE_SIZE:
+        data.close()
+        file.close()
+        raise ValueError(f"{path} is not a version {VERSION} self-play file")
+    return file, data
+
+def read_samples(path):
+    file, data = _open_samples(path)
+    try:
+        for offset in range(HEADER_SIZE, len(data) - SAMPLE_SIZE + 1, SAMPLE_SIZE):
+            record, score, move, result, termination = SAMPLE.unpack_from(data, offset)
+            yield Sample(unpack_fen(record), score, move, result, TERMINATIONS[termination])
+    finally:
+        data.close()
+        file.close()
+
+def load_samples(path):
+    # The whole file as a read-only NumPy structured array, for training.
+    if np is None:
+        raise ImportError("load_samples() requires numpy")
+    file, data = _open_samples(path)
+    count = (len(data) - HEADER_SIZE) // SAMPLE_SIZE
+    data.close()
+    file.close()
+    return np.memmap(path, dtype=SAMPLE_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.selfplay", description="Generate self-play training data.")
+    parser.add_argument("output", help="sample file to write (OUTPUT.checkpoint is written next to it)")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--openings", metavar="PATH", help="file with one opening FEN per line (default: the starting position)")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--movetime", type=int, default=None, help="milliseconds per move")
+    parser.add_argument("--random-plies", type=int, default=8, help="random moves at the start of each game")
+    parser.add_argument("--max-plies", type=int, default=300, help="adjudicate a draw after this many plies")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tt-size", type=int, default=1 << 16, help="transposition table entries per worker")
+    parser.add_argument("--resume", action="store_true", help="continue the run recorded in OUTPUT.checkpoint")
+    parser.add_argument("--checkpoint-every", type=float, default=30.0, metavar="SECONDS")
+    parser.add_argument("--report-every", type=float, default=10.0, metavar="SECONDS")
+    parser.add_argument("--show", type=int, metavar="N", help="print the first N samples of OUTPUT and exit")
+    args = parser.parse_args(argv)
+
+    if args.show is not None:
+        for number, sample in enumerate(read_samples(args.output)):
+            if number == args.show:
+                break
+            print(f"{sample.fen}  score {sample.score:6}  result {sample.result:2}  {sample.termination}")
+        return 0
+    if args.depth is None and args.nodes is None and args.movetime is None:
+        args.depth = 2
+    try:
+        openings = read_openings(args.openings) if args.openings else [STARTING_FEN]
+        checkpoint = run_selfplay(args.output, args.games, openings, args.workers, args.depth, args.nodes, args.movetime,
+                                  args.random_plies, args.max_plies, args.seed, args.tt_size, args.resume,
+                                  args.checkpoint_every, args.report_every)
+    except KeyboardInterrupt:
+        print(f"interrupted; run again with --resume to continue from {args.output}.checkpoint", file=sys.stderr)
+        return 130
+    except ValueError as error:
+        parser.error(str(error))
+    totals = checkpoint.totals
+    hours = totals["elapsed_s"] / 3600
+    print(f"{checkpoint.games} games, {totals['samples']} positions, {totals['plies'] / max(checkpoint.games, 1):.1f} plies/game "
+          f"in {totals['elapsed_s']:.1f}s: {checkpoint.games / hours if hours else 0:.0f} games/hour, "
+          f"{totals['samples'] / totals['elapsed_s'] if totals['elapsed_s'] else 0:.1f} positions/s")
+    print("terminations: " + ", ".join(f"{name} {count}" for name, count in sorted(totals["terminations"].items())))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import traceback
+from collections import deque
+from itertools import count
+
+from chess.cache import LRUCache
+from chess.engine import STARTING_FEN
+from chess.game import Game
+
+# A single-process asyncio server hosting many games at once. Clients send
+# one JSON object per line and get one JSON object per line back, in order;
+# an "id" field in a request is echoed in its reply so a client can keep
+# several requests in flight on one connection. Requests:
+#   {"op": "new", "fen": FEN}                  -> {"ok": true, "game": ID, "fen": ..., "turn": ...}
+#   {"op": "move", "game": ID, "move": "e2e4"} -> {"ok": true, "fen": ..., "result": ...} or {"ok": false, "error": ...}
+#   {"op": "state", "game": ID}                -> the game's fen, turn, moves and result
+#   {"op": "pgn", "game": ID}                  -> {"ok": true, "pgn": ...}
+#   {"op": "close", "game": ID}                -> {"ok": true}
+#   {"op": "stats", "reset": false}            -> server counters and move validation latency
+# "fen" and "claim_draws" (end on threefold repetition or the 50-move rule)
+# are optional for "new"; "new", "move" and "state" also take "legal": true
+# to get the legal moves of the resulting position. A move that ends the game
+# gets a "termination" such as "checkmate" or "fivefold_repetition".
+#
+# Games belong to the connection that created them and are dropped when it
+# closes; other connections get "No game" for them. Each game is its own Game object; the only thing they share is the
+# move cache, which is keyed by position.
+
+DEFAULT_PORT = 8765
+MOVE_CACHE_SIZE = 1 << 16
+LATENCY_SAMPLES = 1 << 17
+
+def percentile(values, fraction) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class GameServer:
+    def __init__(self, max_games=100000, cache_size=MOVE_CACHE_SIZE):
+        self.games = {}
+        self.ids = count(1)
+        self.max_games = max_games
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self.connections = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.moves = 0
+        self.rejected = 0
+        self.games_created = 0
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def stats(self) -> dict:
+        return {
+            "games": len(self.games),
+            "games_created": self.games_created,
+            "connections": self.connections,
+            "moves": self.moves,
+            "rejected": self.rejected,
+            "validation_p50_us": percentile(self.latencies, 0.50) * 1e6,
+            "validation_p99_us": percentile(self.latencies, 0.99) * 1e6,
+            "wall_s": time.perf_counter() - self.started,
+            "cpu_s": time.process_time() - self.cpu_started,
+            "cache_hit_rate": self.cache.hit_rate() if self.cache is not None else 0.0,
+        }
+
+    def game(self, request, owned) -> Game:
+        # Only the connection that created a game may address it; to others
+        # it does not exist.
+        game_id = request.get("game")
+        if "game" not in request:
+            raise ValueError(f"{request.get('op')!r} needs a \"game\" field")
+        if not isinstance(game_id, int) or isinstance(game_id, bool):
+            raise ValueError(f"\"game\" must be a game number, got {game_id!r}")
+        game = self.games.get(game_id) if game_id in owned else None
+        if game is None:
+            raise ValueError(f"No game {game_id!r}")
+        return game
+
+    def handle(self, request, owned) -> dict:
+        # Runs a request to completion; requests are short and CPU bound, so
+        # they run on the event loop without yielding. A request of the
+        # wrong shape raises ValueError, which becomes an error reply.
+        if not isinstance(request, dict):
+            raise ValueError("Requests must be JSON objects")
+        op = request.get("op")
+        if not isinstance(op, str):
+            raise ValueError(f"\"op\" must be a string, got {op!r}")
+        if op == "move":
+            game = self.game(request, owned)
+            if not isinstance(request.get("move"), str):
+                raise ValueError(f"\"move\" must be a UCI move string, got {request.get('move')!r}")
+            start = time.perf_counter()
+            try:
+                game.play(request.get("move"))
+            except ValueError as error:
+                self.latencies.append(time.perf_counter() - start)
+                self.rejected += 1
+                return {"ok": False, "error": str(error)}
+            self.latencies.append(time.perf_counter() - start)
+            self.moves += 1
+            reply = {"ok": True, "fen": game.fen(), "result": game.result}
+            if game.outcome is not None:
+                reply["termination"] = game.outcome.termination
+        elif op == "new":
+            if len(self.games) >= self.max_games:
+                raise ValueError(f"Server is full ({self.max_games} games)")
+            game = Game(request.get("fen") or STARTING_FEN, cache=self.cache, game_id=next(self.ids),
+                        claim_draws=bool(request.get("claim_draws")))
+            self.games[game.id] = game
+            owned.add(game.id)
+            self.games_created += 1
+            reply = {"ok": True, "game": game.id, "fen": game.fen(), "turn": game.turn}
+        elif op == "state":
+            game = self.game(request, owned)
+            reply = {"ok": True, **game.to_dict()}
+        elif op == "pgn":
+            return {"ok": True, "pgn": self.game(request, owned).pgn()}
+        elif op == "close":
+            game = self.game(request, owned)
+            del self.games[game.id]
+            owned.discard(game.id)
+            return {"ok": True}
+        elif op == "stats":
+            reply = {"ok": True, **self.stats()}
+            if request.get("reset"):
+                self.reset_stats()
+            return reply
+        else:
+            raise ValueError(f"Unknown op {op!r}")
+        if request.get("legal"):
+            reply["legal"] = game.legal_moves()
+        return reply
+
+    async def serve_client(self, reader, writer) -> None:
+        owned = set()
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    reply = self.handle(request, owned)
+                except ValueError as error:
+                    reply = {"ok": False, "error": str(error)}
+                except Exception as error:
+                    # A bug must not take the connection and its games down
+                    # with it; the client gets an error and the traceback
+                    # goes to stderr.
+                    traceback.print_exc()
+                    reply = {"ok": False, "error": f"Internal error: {type(error).__name__}"}
+                if isinstance(request, dict) and "id" in request:
+                    reply["id"] = request["id"]
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in owned:
+                self.games.pop(game_id, None)
+            self.connections -= 1
+            writer.close()
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, max_games=100000, cache_size=MOVE_CACHE_SIZE) -> None:
+    game_server = GameServer(max_games, cache_size)
+    server = await asyncio.start_server(game_server.serve_client, host, port)
+    address = server.sockets[0].getsockname()
+    print(f"listening on {address[0]}:{address[1]}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+class Client:
+    # Multiplexes requests from many coroutines over one connection.
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.ids = count()
+        self.pending = {}
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def receive(self) -> None:
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            self.pending.pop(reply["id"]).set_result(reply)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, **request) -> dict:
+        request["id"] = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request["id"]] = future
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.receiver
+
+async def play_random_game(client, max_moves, rng, round_trips, think=0.0) -> int:
+    reply = await client.request(op="new", legal=True)
+    game_id, legal = reply["game"], reply["legal"]
+    played = 0
+    while legal and played < max_moves:
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+        start = time.perf_counter()
+        reply = await client.request(op="move", game=game_id, move=rng.choice(legal), legal=True)
+        round_trips.append(time.perf_counter() - start)
+        if not reply["ok"]:
+            raise RuntimeError(f"server rejected a legal move: {reply['error']}")
+        legal = reply["legal"]
+        played += 1
+    await client.request(op="close", game=game_id)
+    return played
+
+async def load_test(host, port, games=2000, connections=50, max_moves=40, seed=1, think=0.0) -> dict:
+    # Plays `games` random games at once over `connections` connections and
+    # reports client round trips and the server's own validation latency and
+    # CPU time. With no think time every game moves as soon as its last move
+    # is answered, so round trips measure a saturated server. Games per core is how many concurrent games one core keeps up
+    # with at the given pace; it is moves per CPU second times the seconds
+    # between a game's moves.
+    rng = random.Random(seed)
+    clients = [await Client.connect(host, port) for _ in range(connections)]
+    await clients[0].request(op="stats", reset=True)
+    round_trips = []
+    start = time.perf_counter()
+    played = await asyncio.gather(*(play_random_game(clients[i % connections], max_moves, rng, round_trips, think) for i in range(games)))
+    elapsed = time.perf_counter() - start
+    stats = await clients[0].request(op="stats")
+    for client in clients:
+        await client.close()
+    moves = sum(played)
+    stats.update({"client_games": games, "client_moves": moves, "client_wall_s": elapsed,
+                  "round_trip_p50_us": percentile(round_trips, 0.50) * 1e6,
+                  "round_trip_p99_us": percentile(round_trips, 0.99) * 1e6,
+                  "moves_per_core_s": stats["moves"] / stats["cpu_s"] if stats["cpu_s"] > 0 else 0.0,
+                  "games_per_core_s": games / stats["cpu_s"] if stats["cpu_s"] > 0 else 0.0})
+    return stats
+
+# Requests of the wrong shape; each must get an error reply and leave the
+# connection open.
+MALFORMED_REQUESTS = [
+    {"op": 5}, {"op": "fly"}, {"op": "move"}, {"op": "move", "game": [1], "move": "e2e4"},
+    {"op": "move", "game": "1", "move": "e2e4"}, {"op": "state", "game": True}, {"op": "new", "fen": 7},
+    {"op": "new", "fen": "rnbqkbnrR/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"},
+]
+
+async def check_protocol(host="127.0.0.1", out=sys.stdout) -> bool:
+    # Runs a server in this process and checks, over two connections, that
+    # neither can touch the other's game and that malformed requests are
+    # answered with errors.
+    game_server = GameServer()
+    server = await asyncio.start_server(game_server.serve_client, host, 0)
+    port = server.sockets[0].getsockname()[1]
+    owner, other = await Client.connect(host, port), await Client.connect(host, port)
+    passed = True
+
+    def report(name, ok) -> None:
+        nonlocal passed
+        passed = passed and ok
+        print(f"{name:<40} {'ok' if ok else 'FAIL'}", file=out)
+
+    game_id = (await owner.request(op="new"))["game"]
+    for request in ({"op": "move", "move": "e2e4"}, {"op": "state"}, {"op": "pgn"}, {"op": "close"}):
+        reply = await other.request(game=game_id, **request)
+        report(f"{request['op']} on another connection's game", not reply["ok"])
+    reply = await owner.request(op="state", game=game_id)
+    report("owner's game untouched", reply["ok"] and reply["moves"] == [])
+    reply = await owner.request(op="move", game=game_id, move="e2e4")
+    report("owner can move", reply["ok"])
+    for request in MALFORMED_REQUESTS:
+        reply = await other.request(**request)
+        report(f"refused {json.dumps(request)[:31]}", not reply["ok"] and "error" in reply)
+    report("connection open after bad requests", (await other.request(op="new"))["ok"])
+    report("owner can close", (await owner.request(op="close", game=game_id))["ok"])
+
+    await owner.close()
+    await other.close()
+    server.close()
+    await server.wait_closed()
+    print("protocol checks passed" if passed else "PROTOCOL CHECK FAILED", file=out)
+    return passed
+
+def print_load_report(stats, pace, out=sys.stdout) -> None:
+    print(f"{stats['client_games']} games, {stats['client_moves']} moves in {stats['client_wall_s']:.2f}s "
+          f"({stats['client_moves'] / stats['client_wall_s']:.0f} moves/s)", file=out)
+    print(f"move validation  p50 {stats['validation_p50_us']:8.1f} us  p99 {stats['validation_p99_us']:8.1f} us  (server)", file=out)
+    print(f"round trip       p50 {stats['round_trip_p50_us']:8.1f} us  p99 {stats['round_trip_p99_us']:8.1f} us  (client)", file=out)
+    print(f"server cpu {stats['cpu_s']:.2f}s: {stats['moves_per_core_s']:.0f} moves and {stats['games_per_core_s']:.1f} "
+          f"complete games per core-second, move cache hit rate {stats['cache_hit_rate']:.1%}", file=out)
+    print(f"at one move every {pace:g}s per game: {stats['moves_per_core_s'] * pace:.0f} concurrent games per core", file=out)
+
+async def _spawn_and_load(args) -> dict:
+    # Starts a server in a child process so its CPU time is measured apart
+    # from the client's.
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+    process = await asyncio.create_subprocess_exec(sys.executable, "-m", "chess.server", "serve", "--host", args.host,
+                                                   "--port", "0", stdout=asyncio.subprocess.PIPE, env=env)
+    try:
+        line = (await process.stdout.readline()).decode()
+        if not line.startswith("listening on "):
+            raise RuntimeError("server did not start")
+        port = int(line.rsplit(":", 1)[1])
+        return await load_test(args.host, port, args.games, args.connections, args.moves, args.seed, args.think)
+    finally:
+        process.terminate()
+        await process.wait()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m chess.server", description="Host many games over a JSON line protocol.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the game server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--max-games", type=int, default=100000)
+    serve_parser.add_argument("--cache", type=int, default=MOVE_CACHE_SIZE, metavar="N", help="positions in the shared move cache, 0 to disable")
+    load = commands.add_parser("load", help="load test a server with concurrent random games")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, help="server to test; without it a server is started in a child process")
+    load.add_argument("--games", type=int, default=2000, help="games played at once")
+    load.add_argument("--connections", type=int, default=50)
+    load.add_argument("--moves", type=int, default=40, help="moves per game at most")
+    load.add_argument("--think", type=float, default=0.0, metavar="SECONDS", help="mean pause before each move, 0 to saturate the server")
+    load.add_argument("--pace", type=float, default=10.0, metavar="SECONDS", help="seconds between a game's moves for the games-per-core estimate")
+    load.add_argument("--seed", type=int, default=1)
+    load.add_argument("--json", action="store_true", help="print the raw numbers as JSON")
+    commands.add_parser("check", help="check game isolation and error replies on a server in this process")
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        return 0 if asyncio.run(check_protocol()) else 1
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.max_games, args.cache))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.port is None:
+        stats = asyncio.run(_spawn_and_load(args))
+    else:
+        stats = asyncio.run(load_test(args.host, args.port, args.games, args.connections, args.moves, args.seed, args.think))
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print_load_report(stats, args.pace)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,966 @@
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from chess.bitboard import CAPTURE, EP_CAPTURE, PAWN, BitboardPosition, iter_bits
+from chess.cache import LRUCache
+
+# Probing for Syzygy WDL (.rtbw) and DTZ (.rtbz) endgame tables.
+#
+# A table stores one value per legal placement of its pieces. Placements are
+# numbered by an index built from the squares in the order the file header
+# gives, after folding the board by its symmetries (pawnless tables use the
+# a1-d1-d4 triangle, pawn tables the queenside files). The values are Re-Pair
+# compressed into fixed size blocks of canonical Huffman codes, and a probe
+# has to decode its block from the start up to the wanted value, so decoded
+# blocks are kept in an LRUCache shared by all tables of a Tablebase.
+#
+# Inside this module squares use the table numbering, a1 = 0 and h8 = 63,
+# which is sq ^ 56 in the bitboard numbering, and pieces use the table codes:
+# white pawn..king = 1-6, black = 9-14.
+
+WDL_MAGIC = b"\x71\xe8\x23\x5d"
+DTZ_MAGIC = b"\xd7\x66\x0c\xa5"
+WDL_SUFFIX = ".rtbw"
+DTZ_SUFFIX = ".rtbz"
+
+# WDL values are from the side to move: -2 loss, -1 loss that the 50-move
+# rule turns into a draw, 0 draw, 1 win spoiled by the 50-move rule, 2 win.
+LOSS, BLESSED_LOSS, DRAW, CURSED_WIN, WIN = -2, -1, 0, 1, 2
+
+TABLE_PIECES = "KQRBNP"
+TABLE_TYPES = {6: "K", 5: "Q", 4: "R", 3: "B", 2: "N", 1: "P"}
+
+UINT16 = struct.Struct("<H")
+UINT32 = struct.Struct("<I")
+UINT32_BE = struct.Struct(">I")
+UINT64_BE = struct.Struct(">Q")
+MASK64 = (1 << 64) - 1
+MEMO_LENGTH = 32
+
+# DTZ maps are indexed by WDL + 2, and the DTZ of some WDL outcomes is stored
+# halved unless the flag for it is set.
+WDL_TO_MAP = [1, 3, 0, 2, 0]
+PA_FLAGS = [8, 0, 0, 0, 4]
+WDL_TO_DTZ = [-1, -101, 0, 101, 1]
+
+def offdiag(sq):
+    return (sq >> 3) - (sq & 7)
+
+def flipdiag(sq):
+    return ((sq >> 3) | (sq << 3)) & 63
+
+def _index_tables():
+    # TRIANGLE numbers the a1-d1-d4 triangle a pawnless table folds the first
+    # piece into, off-diagonal squares first; every other square maps to its
+    # image under the board symmetries.
+    triangle_order = [1, 2, 3, 10, 11, 19, 0, 9, 18, 27]
+    triangle = [0] * 64
+    diag = [0] * 64
+    lower = [0] * 64
+    for sq in range(64):
+        file, rank = sq & 7, sq >> 3
+        file, rank = min(file, 7 - file), min(rank, 7 - rank)
+        if rank > file:
+            file, rank = rank, file
+        triangle[sq] = triangle_order.index(rank * 8 + file)
+
+        file, rank = sq & 7, sq >> 3
+        if file == rank:
+            diag[sq] = file
+        elif file + rank == 7:
+            diag[sq] = 8 + rank
+        low, high = min(file, rank), max(file, rank)
+        lower[sq] = 28 + file if file == rank else sum(7 - k for k in range(low)) + high - low - 1
+
+    # Two kings, the first in the triangle: placements where both are on the
+    # a1-h8 diagonal are numbered after all others, and with the first king on
+    # the diagonal the second never stands above it.
+    kk_index = [[-1] * 64 for _ in range(10)]
+    both_on_diagonal = []
+    code = 0
+    for slot in range(10):
+        king = triangle_order[slot]
+        for sq in range(64):
+            if max(abs((sq & 7) - (king & 7)), abs((sq >> 3) - (king >> 3))) <= 1:
+                continue
+            if not offdiag(king) and offdiag(sq) > 0:
+                continue
+            if not offdiag(king) and not offdiag(sq):
+                both_on_diagonal.append((slot, sq))
+            else:
+                kk_index[slot][sq] = code
+                code += 1
+    for slot, sq in both_on_diagonal:
+        kk_index[slot][sq] = code
+        code += 1
+
+    # Pawn tables fold the leading pawn onto files a-d. FLAP numbers those
+    # squares file by file, and PTWIST orders pawn squares for the other
+    # leading pawns.
+    flap = [0] * 64
+    ptwist = [0] * 64
+    for sq in range(8, 56):
+        file, rank = sq & 7, sq >> 3
+        flap[sq] = min(file, 7 - file) * 6 + rank - 1
+        ptwist[sq] = 47 - 12 * min(file, 7 - file) - 2 * (rank - 1) - (1 if file > 3 else 0)
+    invflap = [rank * 8 + file for file in range(4) for rank in range(1, 7)]
+    return triangle, diag, lower, kk_index, flap, ptwist, invflap
+
+TRIANGLE, DIAG, LOWER, KK_INDEX, FLAP, PTWIST, INVFLAP = _index_tables()
+FILE_TO_FILE = [0, 1, 2, 3, 3, 2, 1, 0]
+
+# Placements of the leading group: three unique pieces, or the two kings.
+PIECE_PIVOTS = {0: 31332, 2: 462}
+
+def _pawn_tables():
+    pawn_index = [[0] * 24 for _ in range(6)]
+    pawn_factor = [[0] * 4 for _ in range(6)]
+    for leading in range(6):
+        for file in range(4):
+            total = 0
+            for j in range(6 * file, 6 * file + 6):
+                pawn_index[leading][j] = total
+                total += 1 if leading == 0 else math.comb(PTWIST[INVFLAP[j]], leading)
+            pawn_factor[leading][file] = total
+    return pawn_index, pawn_factor
+
+PAWN_INDEX, PAWN_FACTOR = _pawn_tables()
+
+def material_key(position, mirror=False) -> str:
+    # "KRPvKR": white's pieces, then black's, strongest first.
+    sides = [[], []]
+    for side in (0, 1):
+        for piece_type in (5, 4, 3, 2, 1, 0):
+            sides[side].append(TABLE_PIECES[5 - piece_type] * position.pieces[side * 6 + piece_type].bit_count())
+    white, black = "".join(sides[0]), "".join(sides[1])
+    return black + "v" + white if mirror else white + "v" + black
+
+def normalize_name(name, mirror=False) -> str:
+    white, black = name.split("v", 1)
+    white = "".join(sorted(white, key=TABLE_PIECES.index))
+    black = "".join(sorted(black, key=TABLE_PIECES.index))
+    if mirror ^ ((len(white), [TABLE_PIECES.index(c) for c in black]) < (len(black), [TABLE_PIECES.index(c) for c in white])):
+        return black + "v" + white
+    return white + "v" + black
+
+def _key_from_codes(codes, mirror=False) -> str:
+    sides = ["", ""]
+    for code in sorted(codes, key=lambda code: -(code & 7)):
+        sides[(code >> 3) ^ mirror] += TABLE_TYPES[code & 7]
+    return sides[0] + "v" + sides[1]
+
+def reachable_materials(position) -> set:
+    # Material keys of position and of everything captures and promotions
+    # can lead to, bare kings excepted: the tables probing position may
+    # need. Counts are (white pawn..queen, black pawn..queen).
+    start = tuple(position.pieces[side * 6 + piece_type].bit_count() for side in (0, 1) for piece_type in range(5))
+    seen, todo = {start}, [start]
+    while todo:
+        counts = todo.pop()
+        for index, count in enumerate(counts):
+            if not count:
+                continue
+            children = [counts[:index] + (count - 1,) + counts[index + 1:]]
+            if index % 5 == 0:
+                children += [children[0][:index + promoted] + (counts[index + promoted] + 1,) + children[0][index + promoted + 1:]
+                             for promoted in range(1, 5)]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    todo.append(child)
+    keys = set()
+    for counts in seen:
+        if any(counts):
+            sides = ["K" + "".join(TABLE_PIECES[5 - piece_type] * counts[side * 5 + piece_type] for piece_type in (4, 3, 2, 1, 0))
+                     for side in (0, 1)]
+            keys.add(sides[0] + "v" + sides[1])
+    return keys
+
+def _dtz_before_zeroing(wdl):
+    return ((wdl > 0) - (wdl < 0)) * (1 if abs(wdl) == 2 else 101)
+
+class _Pairs:
+    # Decompression state of one side (and file, for pawn tables) of a table.
+    __slots__ = ("index_table", "size_table", "data", "offset", "symbols", "block_size", "index_bits", "min_len",
+                 "base", "symbol_lengths", "expansions", "sizes")
+
+class _Encoding:
+    # Piece order and index factors of one side (and file) of a table.
+    __slots__ = ("pieces", "norm", "factor", "size", "pairs")
+
+class Table:
+    # One .rtbw or .rtbz file. The memory map and headers are read on the
+    # first probe, so registering a directory of tables is cheap.
+    def __init__(self, path, blocks):
+        self.path = path
+        self.blocks = blocks
+        name, suffix = os.path.splitext(os.path.basename(path))
+        self.wdl = suffix == WDL_SUFFIX
+        self.name = name
+        self.key = normalize_name(name)
+        self.mirrored_key = normalize_name(name, mirror=True)
+        self.symmetric = self.key == self.mirrored_key
+        self.num = len(name) - 1
+        self.has_pawns = "P" in name
+        self.map = None
+
+        first, second = name.split("v")
+        if self.has_pawns:
+            # The leading pawns are those of the side with fewer (but some).
+            lead, other = second.count("P"), first.count("P")
+            if other and (not lead or other < lead):
+                lead, other = other, lead
+            self.pawns = (lead, other)
+        else:
+            unique = sum(1 for piece in TABLE_PIECES if first.count(piece) == 1) + sum(1 for piece in TABLE_PIECES if second.count(piece) == 1)
+            self.enc_type = 0 if unique >= 3 else 2
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def _u16(self, offset):
+        return UINT16.unpack_from(self.map, offset)[0]
+
+    def _u32(self, offset):
+        return UINT32.unpack_from(self.map, offset)[0]
+
+    def _open(self) -> None:
+        with open(self.path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) % 64 != 16 or data[:4] != (WDL_MAGIC if self.wdl else DTZ_MAGIC):
+            data.close()
+            raise ValueError(f"{self.path} is not a Syzygy table")
+        if hasattr(mmap, "MADV_RANDOM"):
+            data.madvise(mmap.MADV_RANDOM)
+        self.map = data
+
+        split = data[4] & 1 if self.wdl else 0
+        files = 4 if data[4] & 2 else 1
+        sides = 2 if self.wdl else 1
+        ptr = 5
+
+        # Piece headers: an order byte (two with pawns on both sides) and a
+        # byte per piece, the low nibble for white to move and the high
+        # nibble for black. Pawn tables have one header for each file.
+        self.encodings = [[None] * sides for _ in range(4 if self.has_pawns else 1)]
+        for file in range(len(self.encodings)):
+            order_bytes = 2 if self.has_pawns and self.pawns[1] else 1
+            for side in range(sides):
+                shift = 4 * side
+                encoding = _Encoding()
+                encoding.pieces = [(data[ptr + order_bytes + i] >> shift) & 15 for i in range(self.num)]
+                order = (data[ptr] >> shift) & 15
+                if self.has_pawns:
+                    order2 = (data[ptr + 1] >> shift) & 15 if self.pawns[1] else 15
+                    encoding.norm = self._pawn_norm(encoding.pieces)
+                    encoding.factor, encoding.size = self._pawn_factors(order, order2, encoding.norm, file)
+                else:
+                    encoding.norm = self._piece_norm(encoding.pieces)
+                    encoding.factor, encoding.size = self._piece_factors(order, encoding.norm)
+                encoding.pairs = None
+                self.encodings[file][side] = encoding
+            ptr += self.num + order_bytes
+        ptr += ptr & 1
+
+        # Decompression headers, then (DTZ only) the value maps, then the
+        # index tables, size tables and data of every side in turn.
+        stored = [(file, side) for file in range(files) for side in range(1 + split)]
+        self.flags = [0] * files
+        for file, side in stored:
+            encoding = self.encodings[file][side]
+            self.flags[file] = data[ptr]
+            encoding.pairs, ptr = self._setup_pairs(ptr, encoding.size)
+        if not self.wdl:
+            self.map_start = ptr
+            self.map_index = [None] * files
+            for file in range(files):
+                if self.flags[file] & 2:
+                    self.map_index[file] = []
+                    if not self.flags[file] & 16:
+                        for _ in range(4):
+                            self.map_index[file].append(ptr + 1 - self.map_start)
+                            ptr += 1 + data[ptr]
+                    else:
+                        ptr += ptr & 1
+                        for _ in range(4):
+                            self.map_index[file].append((ptr + 2 - self.map_start) // 2)
+                            ptr += 2 + 2 * self._u16(ptr)
+            ptr += ptr & 1
+        for file, side in stored:
+            pairs = self.encodings[file][side].pairs
+            pairs.index_table = ptr
+            ptr += pairs.sizes[0]
+        for file, side in stored:
+            pairs = self.encodings[file][side].pairs
+            pairs.size_table = ptr
+            ptr += pairs.sizes[1]
+        for file, side in stored:
+            pairs = self.encodings[file][side].pairs
+            ptr = (ptr + 63) & ~63
+            pairs.data = ptr
+            ptr += pairs.sizes[2]
+
+        # Pawnless tables may have their colours the other way round from
+        # the file name.
+        if not self.has_pawns:
+            self.key = _key_from_codes(self.encodings[0][0].pieces)
+            self.mirrored_key = _key_from_codes(self.encodings[0][0].pieces, mirror=True)
+
+    def _piece_norm(self, pieces):
+        norm = [0] * self.num
+        norm[0] = 3 if self.enc_type == 0 else 2
+        i = norm[0]
+        while i < self.num:
+            j = i
+            while j < self.num and pieces[j] == pieces[i]:
+                norm[i] += 1
+                j += 1
+            i += norm[i]
+        return norm
+
+    def _pawn_norm(self, pieces):
+        norm = [0] * self.num
+        lead, other = self.pawns
+        norm[0] = lead
+        if other:
+            norm[lead] = other
+        i = lead + other
+        while i < self.num:
+            j = i
+            while j < self.num and pieces[j] == pieces[i]:
+                norm[i] += 1
+                j += 1
+            i += norm[i]
+        return norm
+
+    def _piece_factors(self, order, norm):
+        factor = [0] * self.num
+        free = 64 - norm[0]
+        size = 1
+        i, k = norm[0], 0
+        while i < self.num or k == order:
+            if k == order:
+                factor[0] = size
+                size *= PIECE_PIVOTS[self.enc_type]
+            else:
+                factor[i] = size
+                size *= math.comb(free, norm[i])
+                free -= norm[i]
+                i += norm[i]
+            k += 1
+        return factor, size
+
+    def _pawn_factors(self, order, order2, norm, file):
+        factor = [0] * self.num
+        i = norm[0]
+        if order2 < 15:
+            i += norm[i]
+        free = 64 - i
+        size = 1
+        k = 0
+        while i < self.num or k == order or k == order2:
+            if k == order:
+                factor[0] = size
+                size *= PAWN_FACTOR[norm[0] - 1][file]
+            elif k == order2:
+                factor[norm[0]] = size
+                size *= math.comb(48 - norm[0], norm[norm[0]])
+            else:
+                factor[i] = size
+                size *= math.comb(free, norm[i])
+                free -= norm[i]
+                i += norm[i]
+            k += 1
+        return factor, size
+
+    def _setup_pairs(self, ptr, table_size):
+        data = self.map
+        pairs = _Pairs()
+        if data[ptr] & 0x80:
+            # Every position of this side has the same value.
+            pairs.index_bits = 0
+            pairs.min_len = data[ptr + 1] if self.wdl else 0
+            pairs.sizes = (0, 0, 0)
+            return pairs, ptr + 2
+
+        pairs.block_size = data[ptr + 1]
+        pairs.index_bits = data[ptr + 2]
+        real_blocks = self._u32(ptr + 4)
+        blocks = real_blocks + data[ptr + 3]
+        max_len, min_len = data[ptr + 8], data[ptr + 9]
+        lengths = max_len - min_len + 1
+        symbol_count = self._u16(ptr + 10 + 2 * lengths)
+        pairs.min_len = min_len
+        pairs.symbols = ptr + 12 + 2 * lengths
+        indices = (table_size + (1 << pairs.index_bits) - 1) >> pairs.index_bits
+        pairs.sizes = (6 * indices, 2 * blocks, (1 << pairs.block_size) * real_blocks)
+
+        # Each symbol is either a value or a pair of earlier symbols; its
+        # length is the number of values it expands to, minus one.
+        symbol_lengths = [0] * symbol_count
+        for symbol in range(symbol_count):
+            w = pairs.symbols + 3 * symbol
+            right = (data[w + 2] << 4) | (data[w + 1] >> 4)
+            if right != 0xFFF:
+                left = ((data[w + 1] & 15) << 8) | data[w]
+                symbol_lengths[symbol] = symbol_lengths[left] + symbol_lengths[right] + 1
+        pairs.symbol_lengths = symbol_lengths
+        pairs.expansions = {}
+
+        # Canonical Huffman: base[l - min_len] is the smallest left-aligned
+        # code of length l.
+        offset = ptr + 10
+        base = [0] * lengths
+        for i in range(lengths - 2, -1, -1):
+            base[i] = (base[i + 1] + self._u16(offset + 2 * i) - self._u16(offset + 2 * i + 2)) // 2
+        pairs.base = [value << (64 - (min_len + i)) for i, value in enumerate(base)]
+        pairs.offset = offset - 2 * min_len
+        return pairs, ptr + 12 + 2 * lengths + 3 * symbol_count + (symbol_count & 1)
+
+    def _expand(self, pairs, symbol):
+        # Short expansions are memoised; long runs are rebuilt from their
+        # halves so the memo stays bounded by the symbol count.
+        expansion = pairs.expansions.get(symbol)
+        if expansion is None:
+            data = self.map
+            w = pairs.symbols + 3 * symbol
+            if pairs.symbol_lengths[symbol]:
+                left = ((data[w + 1] & 15) << 8) | data[w]
+                right = (data[w + 2] << 4) | (data[w + 1] >> 4)
+                expansion = self._expand(pairs, left) + self._expand(pairs, right)
+            elif self.wdl:
+                expansion = (data[w],)
+            else:
+                expansion = (((data[w + 1] & 15) << 8) | data[w],)
+            if len(expansion) <= MEMO_LENGTH:
+                pairs.expansions[symbol] = expansion
+        return expansion
+
+    def _decode_block(self, pairs, block):
+        data = self.map
+        count = self._u16(pairs.size_table + 2 * block) + 1
+        ptr = pairs.data + (block << pairs.block_size)
+        code = UINT64_BE.unpack_from(data, ptr)[0]
+        ptr += 8
+        bits = 0
+        end = len(data) - 4
+        min_len, base, offset = pairs.min_len, pairs.base, pairs.offset
+        values = []
+        while len(values) < count:
+            length = min_len
+            while code < base[length - min_len]:
+                length += 1
+            symbol = UINT16.unpack_from(data, offset + 2 * length)[0] + ((code - base[length - min_len]) >> (64 - length))
+            values.extend(self._expand(pairs, symbol))
+            code = (code << length) & MASK64
+            bits += length
+            if bits >= 32:
+                bits -= 32
+                if ptr <= end:
+                    code |= UINT32_BE.unpack_from(data, ptr)[0] << bits
+                ptr += 4
+        return bytes(values[:count]) if self.wdl else tuple(values[:count])
+
+    def _value(self, pairs, index):
+        if not pairs.index_bits:
+            return pairs.min_len
+        main = index >> pairs.index_bits
+        literal = (index & ((1 << pairs.index_bits) - 1)) - (1 << (pairs.index_bits - 1))
+        block = self._u32(pairs.index_table + 6 * main)
+        literal += self._u16(pairs.index_table + 6 * main + 4)
+        if literal < 0:
+            while literal < 0:
+                block -= 1
+                literal += self._u16(pairs.size_table + 2 * block) + 1
+        else:
+            while literal > self._u16(pairs.size_table + 2 * block):
+                literal -= self._u16(pairs.size_table + 2 * block) + 1
+                block += 1
+
+        key = (self.path, id(pairs), block)
+        values = self.blocks.get(key)
+        if values is None:
+            values = self._decode_block(pairs, block)
+            self.blocks.put(key, values)
+        return values[literal]
+
+    def _squares(self, position, codes, start, cmirror, mirror, squares):
+        i = start
+        while i < self.num:
+            code = codes[i]
+            color = (code ^ cmirror) >> 3
+            for sq in iter_bits(position.pieces[color * 6 + (code & 7) - 1]):
+                squares[i] = sq ^ 56 ^ mirror
+                i += 1
+        return squares
+
+    def _encode_piece(self, encoding, squares):
+        n = self.num
+        if squares[0] & 4:
+            squares = [sq ^ 7 for sq in squares]
+        if squares[0] & 32:
+            squares = [sq ^ 56 for sq in squares]
+        first_off = next((i for i in range(n) if offdiag(squares[i])), n)
+        if first_off < (3 if self.enc_type == 0 else 2) and offdiag(squares[first_off]) > 0:
+            squares = [flipdiag(sq) for sq in squares]
+
+        if self.enc_type == 0:
+            a, b, c = squares[0], squares[1], squares[2]
+            i = b > a
+            j = (c > a) + (c > b)
+            if offdiag(a):
+                index = TRIANGLE[a] * 63 * 62 + (b - i) * 62 + (c - j)
+            elif offdiag(b):
+                index = 6 * 63 * 62 + DIAG[a] * 28 * 62 + LOWER[b] * 62 + c - j
+            elif offdiag(c):
+                index = 6 * 63 * 62 + 4 * 28 * 62 + DIAG[a] * 7 * 28 + (DIAG[b] - i) * 28 + LOWER[c]
+            else:
+                index = 6 * 63 * 62 + 4 * 28 * 62 + 4 * 7 * 28 + DIAG[a] * 7 * 6 + (DIAG[b] - i) * 6 + (DIAG[c] - j)
+            start = 3
+        else:
+            index = KK_INDEX[TRIANGLE[squares[0]]][squares[1]]
+            start = 2
+        return index * encoding.factor[0] + self._encode_groups(encoding, squares, start, 0)
+
+    def _encode_groups(self, encoding, squares, i, skip):
+        # Groups of identical pieces are numbered as combinations of the
+        # squares the earlier pieces leave free.
+        index = 0
+        norm, factor = encoding.norm, encoding.factor
+        while i < self.num:
+            group = sorted(squares[i:i + norm[i]])
+            total = 0
+            for m, sq in enumerate(group):
+                below = sum(1 for other in squares[:i] if sq > other)
+                total += math.comb(sq - below - skip, m + 1)
+            index += total * factor[i]
+            i += norm[i]
+            skip = 0
+        return index
+
+    def _encode_pawn(self, encoding, squares):
+        if squares[0] & 4:
+            squares = [sq ^ 7 for sq in squares]
+        lead, other = self.pawns
+        squares[1:lead] = sorted(squares[1:lead], key=lambda sq: -PTWIST[sq])
+        t = lead - 1
+        index = PAWN_INDEX[t][FLAP[squares[0]]]
+        for i in range(t, 0, -1):
+            index += math.comb(PTWIST[squares[i]], t - i + 1)
+        index *= encoding.factor[0]
+        if other:
+            # The second pawn group can only stand on ranks 2-7.
+            return index + self._encode_groups(encoding, squares, lead, 8)
+        return index + self._encode_groups(encoding, squares, lead, 0)
+
+    def probe(self, position, wdl=0):
+        # Returns the stored value for the position: WDL + 2 from a .rtbw
+        # table, or the raw DTZ from a .rtbz table (None if the table only
+        # stores the other side to move).
+        if self.map is None:
+            self._open()
+        # side is the stored side the position is looked up in; positions
+        # with the colours the other way round from the table are probed
+        # with colours and ranks flipped.
+        if not self.symmetric:
+            if material_key(position) != self.key:
+                cmirror, mirror, side = 8, 0x38, int(position.side == 0)
+            else:
+                cmirror, mirror, side = 0, 0, int(position.side != 0)
+        else:
+            cmirror, mirror, side = (0, 0, 0) if position.side == 0 else (8, 0x38, 0)
+
+        squares = [0] * self.num
+        if not self.has_pawns:
+            file = 0
+            if not self.wdl and (self.flags[0] & 1) != side and not self.symmetric:
+                return None
+            encoding = self.encodings[0][side if self.wdl else 0]
+            self._squares(position, encoding.pieces, 0, cmirror, 0, squares)
+            index = self._encode_piece(encoding, squares)
+        else:
+            code = self.encodings[0][0].pieces[0] ^ cmirror
+            count = 0
+            for sq in iter_bits(position.pieces[(code >> 3) * 6 + (code & 7) - 1]):
+                squares[count] = sq ^ 56 ^ mirror
+                count += 1
+            for i in range(1, self.pawns[0]):
+                if FLAP[squares[0]] > FLAP[squares[i]]:
+                    squares[0], squares[i] = squares[i], squares[0]
+            file = FILE_TO_FILE[squares[0] & 7]
+            if not self.wdl and (self.flags[file] & 1) != side and not self.symmetric:
+                return None
+            encoding = self.encodings[file][side if self.wdl else 0]
+            self._squares(position, encoding.pieces, count, cmirror, mirror, squares)
+            index = self._encode_pawn(encoding, squares)
+        value = self._value(encoding.pairs, index)
+        if self.wdl:
+            return value
+
+        flags = self.flags[file]
+        if flags & 2:
+            if not flags & 16:
+                value = self.map[self.map_start + self.map_index[file][WDL_TO_MAP[wdl + 2]] + value]
+            else:
+                value = self._u16(self.map_start + 2 * (self.map_index[file][WDL_TO_MAP[wdl + 2]] + value))
+        if not flags & PA_FLAGS[wdl + 2] or wdl & 1:
+            value *= 2
+        return value
+
+def _as_bitboard(position):
+    # Accepts a FEN, a dict-backend Position or a BitboardPosition; probing
+    # makes and unmakes moves, which always leaves a BitboardPosition as it was.
+    if isinstance(position, BitboardPosition):
+        return position
+    if isinstance(position, str):
+        return BitboardPosition(position)
+    return BitboardPosition(position.fen())
+
+def _is_checkmate(position) -> bool:
+    return not position.generate_legal() and position.in_check()
+
+class Tablebase:
+    # A directory (or several) of Syzygy tables. Values follow the side to
+    # move and assume the position was reached by a capture or pawn move, as
+    # the tables do; a position with castling rights cannot be probed.
+    def __init__(self, directory=None, block_cache_size=4096):
+        self.wdl = {}
+        self.dtz = {}
+        self.max_pieces = 0
+        self.blocks = LRUCache(block_cache_size)
+        if directory is not None:
+            self.add_directory(directory)
+
+    def add_directory(self, directory) -> int:
+        added = 0
+        for filename in sorted(os.listdir(directory)):
+            name, suffix = os.path.splitext(filename)
+            if suffix not in (WDL_SUFFIX, DTZ_SUFFIX) or "v" not in name or name.strip("KQRBNPv") or name == "KvK":
+                continue
+            table = Table(os.path.join(directory, filename), self.blocks)
+            tables = self.wdl if table.wdl else self.dtz
+            for key in (table.key, table.mirrored_key):
+                if key in tables:
+                    tables[key].close()
+                tables[key] = table
+            self.max_pieces = max(self.max_pieces, table.num)
+            added += 1
+        return added
+
+    def close(self) -> None:
+        for table in list(self.wdl.values()) + list(self.dtz.values()):
+            table.close()
+        self.wdl.clear()
+        self.dtz.clear()
+        self.blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def covers(self, position) -> bool:
+        # Probing follows captures and promotions into other material, so
+        # every table they can reach must be loaded too, not only the one
+        # for position.
+        position = _as_bitboard(position)
+        return (not position.castling and (position.occupancy[0] | position.occupancy[1]).bit_count() <= self.max_pieces
+                and all(key in self.wdl and key in self.dtz for key in reachable_materials(position)))
+
+    def _table(self, tables, position):
+        key = material_key(position)
+        table = tables.get(key)
+        if table is None:
+            raise ValueError(f"No {'WDL' if tables is self.wdl else 'DTZ'} table for {key}")
+        # Tables are registered under both colourings, and pawnless tables
+        # only learn which one is theirs once opened.
+        if table.map is None:
+            table._open()
+            if key not in (table.key, table.mirrored_key):
+                raise ValueError(f"No {'WDL' if tables is self.wdl else 'DTZ'} table for {key}")
+        return table
+
+    def _probe_wdl_table(self, position) -> int:
+        if position.occupancy[0] | position.occupancy[1] == position.pieces[5] | position.pieces[11]:
+            return DRAW
+        return self._table(self.wdl, position).probe(position) - 2
+
+    def _probe_ab(self, position, alpha, beta):
+        # Captures are not stored reliably in the tables, so they are searched
+        # first. The second value is 2 when a capture decides the result.
+        for move in position.generate_legal():
+            flag = move >> 12
+            if not flag & CAPTURE or flag == EP_CAPTURE:
+                continue
+            position.make_move(move)
+            try:
+                value = -self._probe_ab(position, -beta, -alpha)[0]
+            finally:
+                position.unmake_move()
+            if value > alpha:
+                if value >= beta:
+                    return value, 2
+                alpha = value
+        value = self._probe_wdl_table(position)
+        if alpha >= value:
+            return alpha, 1 + (alpha > 0)
+        return value, 1
+
+    def _en_passant(self, position):
+        # Best WDL over the legal en passant captures, -3 if there are none,
+        # and whether every legal move is one.
+        best = -3
+        moves = position.generate_legal()
+        for move in moves:
+            if move >> 12 == EP_CAPTURE:
+                position.make_move(move)
+                try:
+                    best = max(best, -self._probe_ab(position, -2, 2)[0])
+                finally:
+                    position.unmake_move()
+        return best, all(move >> 12 == EP_CAPTURE for move in moves)
+
+    def _check(self, position) -> None:
+        if position.castling:
+            raise ValueError(f"Syzygy tables do not cover castling rights: {position.fen()}")
+        pieces = (position.occupancy[0] | position.occupancy[1]).bit_count()
+        if pieces > self.max_pieces + 1:
+            raise ValueError(f"{pieces} pieces, the loaded tables cover at most {self.max_pieces}")
+
+    def probe_wdl(self, position) -> int:
+        position = _as_bitboard(position)
+        self._check(position)
+        return self._probe_wdl(position)
+
+    def _probe_wdl(self, position) -> int:
+        value = self._probe_ab(position, -2, 2)[0]
+        if position.ep_square == -1:
+            return value
+        ep_value, only_ep = self._en_passant(position)
+        if ep_value > -3:
+            if ep_value >= value:
+                value = ep_value
+            elif value == 0 and only_ep:
+                # Forced to play the losing en passant capture.
+                value = ep_value
+        return value
+
+    def _probe_dtz_table(self, position, wdl):
+        return self._table(self.dtz, position).probe(position, wdl)
+
+    def _probe_dtz_no_ep(self, position) -> int:
+        wdl, success = self._probe_ab(position, -2, 2)
+        if wdl == 0:
+            return 0
+        if success == 2:
+            return _dtz_before_zeroing(wdl)
+
+        us = position.side
+        if wdl > 0:
+            # A pawn push that keeps the win zeroes the counter right away.
+            for move in position.generate_legal():
+                if move >> 12 & CAPTURE or not position.pieces[us * 6 + PAWN] >> (move & 63) & 1:
+                    continue
+                position.make_move(move)
+                try:
+                    value = -self._probe_wdl(position)
+                finally:
+                    position.unmake_move()
+                if value == wdl:
+                    return 1 if value == 2 else 101
+
+        dtz = self._probe_dtz_table(position, wdl)
+        if dtz is not None:
+            return _dtz_before_zeroing(wdl) + (dtz if wdl > 0 else -dtz)
+
+        # The DTZ table only stores the other side to move: look one ply ahead.
+        if wdl > 0:
+            best = 0xFFFF
+            for move in position.generate_legal():
+                if move >> 12 & CAPTURE or position.pieces[us * 6 + PAWN] >> (move & 63) & 1:
+                    continue
+                position.make_move(move)
+                try:
+                    value = -self._probe_dtz(position)
+                    if value == 1 and _is_checkmate(position):
+                        best = 1
+                    elif 0 < value and value + 1 < best:
+                        best = value + 1
+                finally:
+                    position.unmake_move()
+            return best
+
+        best = -1
+        for move in position.generate_legal():
+            position.make_move(move)
+            try:
+                if position.halfmove_clock == 0:
+                    if wdl == -2:
+                        value = -1
+                    else:
+                        value = 0 if self._probe_ab(position, 1, 2)[0] == 2 else -101
+                else:
+                    value = -self._probe_dtz(position) - 1
+            finally:
+                position.unmake_move()
+            best = min(best, value)
+        return best
+
+    def probe_dtz(self, position) -> int:
+        # Plies to the next capture or pawn move that keeps the WDL result:
+        # positive when winning, negative when losing, 0 for a draw, beyond
+        # +-100 when the 50-move rule spoils the result. May be one ply more
+        # than the true value, never changing the result.
+        position = _as_bitboard(position)
+        self._check(position)
+        return self._probe_dtz(position)
+
+    def _probe_dtz(self, position) -> int:
+        value = self._probe_dtz_no_ep(position)
+        if position.ep_square == -1:
+            return value
+        ep_value, only_ep = self._en_passant(position)
+        if ep_value == -3:
+            return value
+        ep_value = WDL_TO_DTZ[ep_value + 2]
+        if value < -100:
+            if ep_value >= 0:
+                value = ep_value
+        elif value < 0:
+            if ep_value >= 0 or ep_value < -100:
+                value = ep_value
+        elif value > 100:
+            if ep_value > 0:
+                value = ep_value
+        elif value > 0:
+            if ep_value == 1:
+                value = ep_value
+        elif ep_value >= 0:
+            value = ep_value
+        elif only_ep:
+            value = ep_value
+        return value
+
+    def root_moves(self, position) -> list:
+        # (move, dtz) for every legal move, dtz counted from this position:
+        # a move that wins keeps a positive value, and smaller is faster.
+        position = _as_bitboard(position)
+        self._check(position)
+        scored = []
+        for move in position.generate_legal():
+            position.make_move(move)
+            try:
+                if _is_checkmate(position):
+                    value = 1
+                elif position.halfmove_clock == 0:
+                    value = _dtz_before_zeroing(-self._probe_wdl(position))
+                else:
+                    value = -self._probe_dtz(position)
+                    value += (value > 0) - (value < 0)
+            finally:
+                position.unmake_move()
+            scored.append((move, value))
+        return scored
+
+    def best_move(self, position):
+        # The fastest win, else a draw, else the slowest loss. A win the
+        # 50-move rule spoils ranks between a real win and a draw, and a loss
+        # it saves between a draw and a real loss.
+        scored = self.root_moves(position)
+        if not scored:
+            return None
+
+        def rank(item):
+            value = item[1]
+            if value > 0:
+                return (3 if value <= 100 else 2, -value)
+            if value == 0:
+                return (1, 0)
+            return (0 if value >= -100 else 0.5, -value)
+
+        return max(scored, key=rank)[0]
+
+def check_known(tablebase, path, out=sys.stdout) -> int:
+    # Probes each "FEN; wdl; dtz" line of path (# lines are comments) and
+    # reports every position whose values differ. "FEN; -; -" marks a
+    # position covers() must refuse because some table it can reach is
+    # missing. Returns the number of mismatches; data/syzygy/known.txt holds
+    # reference values for the tables committed next to it.
+    checked, mismatches = 0, 0
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                fen, wdl, dtz = (field.strip() for field in line.split(";"))
+                expected = None if (wdl, dtz) == ("-", "-") else (int(wdl), int(dtz))
+            except ValueError:
+                raise ValueError(f"{path}:{number}: expected 'FEN; wdl; dtz', got {line!r}") from None
+            position = BitboardPosition(fen)
+            if expected is None:
+                checked += 1
+                if tablebase.covers(position):
+                    mismatches += 1
+                    print(f"{path}:{number}: {fen}  covered, but reaches tables that are not loaded", file=out)
+                continue
+            probed = (tablebase.probe_wdl(position), tablebase.probe_dtz(position))
+            checked += 1
+            if probed != expected:
+                mismatches += 1
+                print(f"{path}:{number}: {fen}  wdl {probed[0]} dtz {probed[1]}, expected wdl {expected[0]} dtz {expected[1]}", file=out)
+    print(f"{checked} positions checked, {mismatches} mismatches", file=out)
+    return mismatches
+
+def main(argv=None) -> int:
+    from chess.engine import move_to_uci
+
+    parser = argparse.ArgumentParser(prog="python -m chess.syzygy", description="Probe Syzygy endgame tables.")
+    parser.add_argument("directory", help="directory holding .rtbw and .rtbz files")
+    parser.add_argument("fen", nargs="*", help="positions to probe")
+    parser.add_argument("--cache", type=int, default=4096, metavar="BLOCKS", help="decoded blocks to keep (default 4096)")
+    parser.add_argument("--bench", type=int, default=0, metavar="N", help="time N WDL and DTZ probes of each position")
+    parser.add_argument("--check", metavar="PATH", help="compare probes against a file of 'FEN; wdl; dtz' lines")
+    args = parser.parse_args(argv)
+    if not args.fen and args.check is None:
+        parser.error("give positions to probe or --check PATH")
+
+    with Tablebase(args.directory, args.cache) as tablebase:
+        print(f"{len(set(tablebase.wdl.values()))} WDL and {len(set(tablebase.dtz.values()))} DTZ tables, "
+              f"up to {tablebase.max_pieces} pieces")
+        for fen in args.fen:
+            position = BitboardPosition(fen)
+            start = time.perf_counter()
+            wdl = tablebase.probe_wdl(position)
+            dtz = tablebase.probe_dtz(position)
+            move = tablebase.best_move(position)
+            elapsed = time.perf_counter() - start
+            print(f"{fen}\n  wdl {wdl}  dtz {dtz}  best {move_to_uci(position.to_move(move)) if move is not None else '-'}"
+                  f"  ({elapsed * 1000:.2f} ms cold)")
+            if args.bench:
+                for name, probe in (("wdl", tablebase.probe_wdl), ("dtz", tablebase.probe_dtz)):
+                    start = time.perf_counter()
+                    for _ in range(args.bench):
+                        probe(position)
+                    elapsed = time.perf_counter() - start
+                    print(f"  {name} {elapsed / args.bench * 1e6:.1f} us per probe")
+        if args.check is not None:
+            try:
+                if check_known(tablebase, args.check):
+                    return 1
+            except ValueError as error:
+                parser.error(str(error))
+        stats = tablebase.blocks.stats()
+        print(f"block cache: {stats.size}/{stats.capacity} blocks, {stats.hits} hits, {stats.misses} misses")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import sys
+import threading
+import time
+
+from chess.bitboard import BitboardPosition
+from chess.engine import STARTING_FEN, move_to_uci
+from chess.game import parse_uci, validate_fen
+from chess.search import MATE, MATE_BOUND, MAX_PLY, Searcher
+
+ENGINE_NAME = "Chess"
+ENGINE_AUTHOR = "Mrbossmanguydude"
+
+def format_score(score) -> str:
+    if score > MATE_BOUND:
+        return f"mate {(MATE - score + 1) // 2}"
+    if score < -MATE_BOUND:
+        return f"mate {-((MATE + score + 1) // 2)}"
+    return f"cp {score}"
+
+def parse_go(tokens) -> dict:
+    # Raises ValueError for a limit that is not a number.
+    limits = {}
+    numeric = ("depth", "movetime", "nodes", "wtime", "btime", "winc", "binc", "movestogo")
+    flags = ("infinite", "ponder")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in numeric and i + 1 < len(tokens):
+            try:
+                limits[token] = int(tokens[i + 1])
+            except ValueError:
+                raise ValueError(f"go {token} needs a number, got {tokens[i + 1]!r}") from None
+            i += 2
+        elif token in flags:
+            limits[token] = True
+            i += 1
+        elif token == "searchmoves":
+            limits["searchmoves"] = []
+            i += 1
+            while i < len(tokens) and tokens[i] not in numeric and tokens[i] not in flags:
+                limits["searchmoves"].append(tokens[i])
+                i += 1
+        else:
+            i += 1
+    return limits
+
+def allocate_time(limits, turn):
+    # Spend a slice of the remaining clock plus most of the increment, and
+    # always leave a safety margin for process and pipe latency.
+    remaining = limits.get("wtime" if turn == "w" else "btime")
+    if remaining is None:
+        return None
+    increment = limits.get("winc" if turn == "w" else "binc", 0)
+    moves_to_go = limits.get("movestogo", 30)
+    budget = remaining / max(moves_to_go, 1) + increment * 0.8
+    return max(1, min(budget, remaining - 50))
+
+class UciEngine:
+    def __init__(self, output=sys.stdout, tt_size=1 << 18, book=None, tablebase=None):
+        self.output = output
+        self.tt_size = tt_size
+        self.book = book
+        self.tablebase = tablebase
+        self.searcher = Searcher(tt_size)
+        self.position = BitboardPosition(STARTING_FEN)
+        self.search_thread = None
+        self.output_lock = threading.Lock()
+        # Cleared while a "go infinite" or "go ponder" search may not answer
+        # yet; "stop" and "ponderhit" set it.
+        self.released = threading.Event()
+        self.limits = {}
+        self.ponder_deadline = None
+
+    def send(self, line) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def set_position(self, tokens) -> None:
+        # Raises ValueError for a bad FEN or an illegal move, leaving the
+        # current position as it was.
+        if not tokens:
+            return
+        if tokens[0] == "startpos":
+            fen, rest = STARTING_FEN, tokens[1:]
+        elif tokens[0] == "fen":
+            fen_fields = []
+            rest = tokens[1:]
+            while rest and rest[0] != "moves":
+                fen_fields.append(rest.pop(0))
+            fen = " ".join(fen_fields)
+        else:
+            return
+        validate_fen(fen)
+        position = BitboardPosition(fen)
+        if rest and rest[0] == "moves":
+            for text in rest[1:]:
+                position.push(parse_uci(position, text))
+        self.position = position
+
+    def info(self, depth, score, nodes, elapsed, pv) -> None:
+        # A ponderhit that arrived before the search started had its
+        # deadline reset by Searcher.search; it is applied again here.
+        if self.ponder_deadline is not None:
+            self.searcher.deadline = self.ponder_deadline
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        self.send(f"info depth {depth} score {format_score(score)} nodes {nodes} nps {nps} time {int(elapsed * 1000)} "
+                  f"pv {' '.join(move_to_uci(move) for move in pv)}")
+
+    def run_search(self, position, limits) -> None:
+        # A book move is answered at once; searchmoves restricts the root, so
+        # the book is only used without it. "go infinite" and "go ponder"
+        # must not answer before "stop" or "ponderhit", so they always search.
+        waiting = limits.get("infinite") or limits.get("ponder")
+        if self.book is not None and "searchmoves" not in limits and not waiting:
+            move = self.book.choose_move(position)
+            if move is not None:
+                self.send(f"bestmove {move_to_uci(position.to_move(move))}")
+                return
+        # Positions the endgame tables cover are answered from them, with
+        # the fastest zeroing win rather than a search. A table that cannot
+        # be probed (missing, unreadable) falls back to the search.
+        if self.tablebase is not None and "searchmoves" not in limits and not waiting:
+            try:
+                move = self.tablebase.best_move(position) if self.tablebase.covers(position) else None
+            except (ValueError, OSError) as error:
+                self.send(f"info string tablebase probe failed, searching instead: {error}")
+                move = None
+            if move is not None:
+                self.send(f"bestmove {move_to_uci(position.to_move(move))}")
+                return
+        movetime = None if waiting else self.move_time(limits, position.turn)
+        root_moves = None
+        if "searchmoves" in limits:
+            legal = position.generate_legal()
+            wanted = set(limits["searchmoves"])
+            root_moves = [move for move in legal if move_to_uci(position.to_move(move)) in wanted] or None
+        result = self.searcher.search(position, limits.get("depth", MAX_PLY - 1), movetime, limits.get("nodes"), self.info, root_moves)
+        # A search that ends by itself (a mate found, the depth limit) still
+        # holds its answer until the GUI releases it.
+        self.released.wait()
+        self.send(f"bestmove {move_to_uci(result.best_move) if result.best_move is not None else '0000'}")
+
+    def search_and_reply(self, position, limits) -> None:
+        # The GUI waits for a bestmove whatever happens, so a search that
+        # fails is reported and answered with a legal move of the position
+        # as it was before the search touched it.
+        before = position.copy()
+        try:
+            self.run_search(position, limits)
+        except Exception as error:
+            self.send(f"info string search failed: {type(error).__name__}: {error}")
+            legal = before.generate_legal()
+            self.released.wait()
+            self.send(f"bestmove {move_to_uci(before.to_move(legal[0])) if legal else '0000'}")
+
+    def move_time(self, limits, turn):
+        movetime = limits.get("movetime")
+        if movetime is None and not limits.get("infinite"):
+            movetime = allocate_time(limits, turn)
+        return movetime
+
+    def go(self, tokens) -> None:
+        self.stop()
+        limits = parse_go(tokens)
+        self.limits = limits
+        self.ponder_deadline = None
+        if limits.get("infinite") or limits.get("ponder"):
+            self.released.clear()
+        else:
+            self.released.set()
+        # The worker thread gets its own copy of the position so a following
+        # "position" command cannot change the board under a running search.
+        position = self.position.copy()
+        self.search_thread = threading.Thread(target=self.search_and_reply, args=(position, limits), daemon=True)
+        self.search_thread.start()
+
+    def ponderhit(self) -> None:
+        # The opponent played the expected move: the pondering search goes
+        # on as a normal one, with the time of "go" counted from now.
+        if self.search_thread is None or not self.limits.get("ponder") or self.released.is_set():
+            return
+        movetime = self.move_time(self.limits, self.position.turn)
+        if movetime is not None:
+            self.ponder_deadline = self.searcher.deadline = time.perf_counter() + movetime / 1000
+        self.released.set()
+
+    def stop(self) -> None:
+        if self.search_thread is not None:
+            self.released.set()
+            self.searcher.stop()
+            self.search_thread.join()
+            self.search_thread = None
+            self.searcher.stopped = False
+
+    def handle(self, line) -> bool:
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            self.searcher = Searcher(self.tt_size)
+            self.position = BitboardPosition(STARTING_FEN)
+        elif command == "position":
+            self.stop()
+            try:
+                self.set_position(arguments)
+            except ValueError as error:
+                self.send(f"info string position ignored: {error}")
+        elif command == "go":
+            try:
+                self.go(arguments)
+            except ValueError as error:
+                self.send(f"info string go ignored: {error}")
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+def main(input_stream=sys.stdin, output=sys.stdout, book=None, tablebase=None) -> int:
+    engine = UciEngine(output, book=book, tablebase=tablebase)
+    for line in input_stream:
+        if not engine.handle(line):
+            break
+    engine.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import random
+
+# Piece keys are indexed like the bitboard backend (white pawn..king, then
+# black pawn..king) and by square y * 8 + x. A fixed seed keeps keys stable
+# between processes so they can be stored and shared.
+
+PIECE_NAMES = ["wpawn", "wknight", "wbishop", "wrook", "wqueen", "wking",
+               "bpawn", "bknight", "bbishop", "brook", "bqueen", "bking"]
+CASTLING_BITS = {"K": 1, "Q": 2, "k": 4, "q": 8}
+
+_random = random.Random(0x5EED_C4E55)
+PIECE_KEYS = [[_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+_CASTLING_RIGHT_KEYS = [_random.getrandbits(64) for _ in range(4)]
+EP_KEYS = [_random.getrandbits(64) for _ in range(8)]
+SIDE_KEY = _random.getrandbits(64)
+del _random
+
+def _castling_keys():
+    keys = [0] * 16
+    for mask in range(16):
+        for bit in range(4):
+            if mask & (1 << bit):
+                keys[mask] ^= _CASTLING_RIGHT_KEYS[bit]
+    return keys
+
+# One key per castling-rights mask, so a rights change is a single XOR pair.
+CASTLING_KEYS = _castling_keys()
+
+PIECE_KEYS_BY_NAME = dict(zip(PIECE_NAMES, PIECE_KEYS))
+
+def castling_mask(castling_availability) -> int:
+    mask = 0
+    for char in castling_availability:
+        mask |= CASTLING_BITS.get(char, 0)
+    return mask
+
+def ep_key(board, turn, en_passant_square) -> int:
+    # The en passant file only counts when a pawn of the side to move stands
+    # next to the pushed pawn, as in Polyglot. Otherwise the position after
+    # a double push would never repeat the same position reached later
+    # without one, and threefold repetitions would go unnoticed.
+    if en_passant_square is None:
+        return 0
+    x, y = en_passant_square
+    pawn_y = y + 1 if turn == "w" else y - 1
+    if board.get((x - 1, pawn_y)) == turn + "pawn" or board.get((x + 1, pawn_y)) == turn + "pawn":
+        return EP_KEYS[x]
+    return 0
+
+def compute_key(board, turn, castling_availability, en_passant_square) -> int:
+    key = 0
+    for (x, y), name in board.items():
+        key ^= PIECE_KEYS_BY_NAME[name][y * 8 + x]
+    key ^= CASTLING_KEYS[castling_mask(castling_availability)]
+    key ^= ep_key(board, turn, en_passant_square)
+    if turn == "b":
+        key ^= SIDE_KEY
+    return key
+
+def position_key(position) -> int:
+    return compute_key(position.board, position.turn, position.castling_availability, position.en_passant_square)